@@ -2,7 +2,7 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 
-from cogs.models import Alerts
+from cogs.models import AlertViewings, Alerts, alert_state
 from utils import BotU, CogU, ContextU, Cooldown, makeembed_bot
 from utils.cogs.error_handler import makeembed_successfulaction
 from utils.constants import GUILDS
@@ -51,16 +51,15 @@ class AlertCog(CogU, name='Alerts'):
                 color=discord.Color.brand_red()
             ))
         else:
+            alerts = alerts[:10] # the most embeds a message can have
             for alert in alerts:
-                await alert.viewed_alert(ctx.author.id)
                 embs.append(makeembed_bot(
                     title=alert.alert_title,
                     description=alert.alert_message,
                     color=discord.Color.brand_green(),
                     timestamp=alert.created_at,
                 ))
-                if len(embs) > 9:
-                    break
+            await AlertViewings.viewed_alerts(ctx.author.id, alerts)
 
         return await ctx.reply(embeds=embs, ephemeral=True)
 
@@ -76,11 +75,12 @@ class AlertCog(CogU, name='Alerts'):
 
         a = await Alerts.create(
             alert_title=title,
-            alert_description=descripton,
+            alert_message=descripton,
             is_active=True,
         )
+        alert_state.invalidate()
 
-        return await ctx.reply(makeembed_successfulaction(description=f'Sucessfully created alert (ID `{a.id}).'))
+        return await ctx.reply(embed=makeembed_successfulaction(description=f'Sucessfully created alert (ID `{a.id}).'))
 
 async def setup(bot: BotU):
     cog = AlertCog(bot)
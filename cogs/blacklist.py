@@ -2,10 +2,10 @@ from typing import Literal, Optional, Union
 
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ext.commands import BucketType
 
-from cogs.models import Blacklist
+from cogs.models import Blacklist, blacklist_index
 from utils import (
     BotU,
     CogU,
@@ -19,12 +19,28 @@ from utils import (
     makeembed_successfulaction,
 )
 
+BLACKLIST_RECONCILE_INTERVAL = 5
+"""How often, in minutes, the in-memory blacklist is reloaded from the database."""
+
 class BlacklistCog(CogU, name='Blacklist',hidden=True):
     """Commands for viewing, adding and removing user's access from the bot."""
     bot: BotU
 
     def __init__(self, bot: BotU):
         self.bot = bot
+        self.reconcile_blacklist.start()
+
+    async def cog_unload(self):
+        self.reconcile_blacklist.cancel()
+
+    @tasks.loop(minutes=BLACKLIST_RECONCILE_INTERVAL)
+    async def reconcile_blacklist(self):
+        """Reloads the blacklist, in case it was changed in the database directly."""
+        await blacklist_index.load()
+
+    @reconcile_blacklist.before_loop
+    async def before_reconcile_blacklist(self):
+        await self.bot.wait_until_ready()
 
     @commands.hybrid_group(name='blacklist',description='View the Blacklist.',hidden=True)
     @commands.is_owner()
@@ -92,8 +108,7 @@ class BlacklistCog(CogU, name='Blacklist',hidden=True):
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild: discord.Guild):
-        blacklist = await Blacklist.filter(offender_id=guild.id, type='guild')
-        if blacklist:
+        if await Blacklist.is_blacklisted(guild.id, type='guild'):
             return await guild.leave()
     
     # @commands.Cog.listener()
@@ -1,10 +1,32 @@
+from typing import Any, Dict, Optional
+import uuid
+
 import discord
 from discord.ext import commands
 
-from cogs.models import CommandInvocation
+from cogs.models import CommandInvocation, recent_lookups
 from cogs.ranks import Platform
 from cogs.ranksv2 import Platform as PlatformV2
-from utils import BotU, CogU, ContextU, generate_transaction_id
+from utils import BotU, CogU, ContextU, ExpiringFutureMap, generate_transaction_id
+
+command_transactions: ExpiringFutureMap[int, Optional[uuid.UUID]] = ExpiringFutureMap(ttl=300)
+"""Maps the ID of a command's message/interaction to the transaction ID of its CommandInvocation."""
+
+def _loggable(value: Any) -> Any:
+    """Gets what an argument is logged as. Platforms are logged as their route, anything that isn't JSON serializable as None."""
+    if isinstance(value, (Platform, PlatformV2)):
+        return value.route
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return None
+
+def command_params(ctx: ContextU) -> Dict[str, Any]:
+    """Gets the arguments a command was invoked with by name, whether they were passed positionally or not.
+    Prefix commands pass arguments before the `*` positionally, so they're only in `ctx.args`."""
+    positional = [arg for arg in ctx.args if arg is not ctx.cog and arg is not ctx]
+    params = dict(zip(ctx.command.clean_params, positional)) if ctx.command else {}
+    params.update(ctx.kwargs)
+    return params
 
 class CmdLoggingCog(CogU):
     def __init__(self, bot: BotU):
@@ -17,32 +39,38 @@ class CmdLoggingCog(CogU):
         transaction_id = generate_transaction_id()
 
         for arg in ctx.args:
-            if isinstance(arg, (Platform, PlatformV2)):
-                arg = arg.value
-            if not isinstance(arg, (str, int, float, bool)):
+            arg = _loggable(arg)
+            if arg is None:
                 continue
             args.append(arg)
         
-        for k, v in ctx.kwargs.items():
-            if isinstance(v, (Platform, PlatformV2)):
-                v = v.value
-            if not isinstance(v, (str, int, float, bool)):
+        # every named argument is logged here, so positional ones can be found by name too
+        for k, v in command_params(ctx).items():
+            v = _loggable(v)
+            if v is None:
                 continue
             kwargs[k] = v
 
-        await CommandInvocation.create(
-            transaction_id=transaction_id,
-            command_id = ctx.interaction.id if ctx.interaction else ctx.message.id,
-            prefix=ctx.clean_prefix if ctx.interaction is None else None,
-            is_slash=ctx.interaction is not None,
-            command=ctx.command.qualified_name,
-            user_id=ctx.author.id,
-            guild_id=ctx.guild.id if ctx.guild else None,
-            channel_id=ctx.channel.id,
-            args=args,
-            kwargs=kwargs,
-            timestamp=ctx.message.created_at,
-        )
+        command_id = ctx.interaction.id if ctx.interaction else ctx.message.id
+
+        try:
+            await CommandInvocation.create(
+                transaction_id=transaction_id,
+                command_id=command_id,
+                prefix=ctx.clean_prefix if ctx.interaction is None else None,
+                is_slash=ctx.interaction is not None,
+                command=ctx.command.qualified_name,
+                user_id=ctx.author.id,
+                guild_id=ctx.guild.id if ctx.guild else None,
+                channel_id=ctx.channel.id,
+                args=args,
+                kwargs=kwargs,
+                timestamp=ctx.message.created_at,
+            )
+        except Exception:
+            command_transactions.set(command_id, None) # don't leave Stats waiting for a row that won't exist
+            raise
+        command_transactions.set(command_id, transaction_id)
     
     @commands.Cog.listener()
     async def on_command_completion(self, ctx: ContextU):
@@ -52,6 +80,13 @@ class CmdLoggingCog(CogU):
             completed=True,
             completion_timestamp=discord.utils.utcnow()
         )
+
+        params = command_params(ctx)
+        username, platform = params.get('username'), params.get('platform')
+        if isinstance(platform, (Platform, PlatformV2)):
+            platform = platform.route
+        if isinstance(username, str) and isinstance(platform, str):
+            recent_lookups.record(ctx.author.id, ctx.command.qualified_name, username, platform)
     
     @commands.Cog.listener()
     async def on_command_error(self, ctx: ContextU, error: commands.CommandError):
@@ -1,19 +1,30 @@
 from __future__ import annotations
+import asyncio
+import bisect
+from collections import deque
 import datetime
 from enum import Enum
+import json
+import os
+import pickle
+import time
 import traceback
-from typing import Any, Dict, List, Optional, Tuple, Type, Union
+import uuid
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple, Type, Union
 
 import dateparser
 import discord
 import environ
 from siegeapi import Player
 from siegeapi.player import LinkedAccount
-from tortoise import Tortoise, fields
+from tortoise import BaseDBAsyncClient, Tortoise, fields
 from tortoise.models import Model
+from tortoise.transactions import in_transaction
 from typing_extensions import Self
 
+from utils.cache import TTLCache
 from utils.custom_constants import CURRENT_SEASON
+from utils.search import SearchIndex
 
 IGNORED_FIELDS = ("id", "created_at", "updated_at", "IGNORED_FIELDS", "Meta", 'userid', 'user_id', 'username', 'request_id', 'season')
 
@@ -70,6 +81,16 @@ class R6UserConnections(Base):
     linked_by = fields.BigIntField(null=True)
     """The Discord ID of the user who linked the account."""
 
+    async def save(self, *args, **kwargs) -> None:
+        """Saves the connection, keeping the username registry up to date when it's created or renamed."""
+        old_name = None
+        if self._saved_in_db and self.platform in USERNAME_PLATFORMS and not username_registry.has(self.name, self.platform):
+            # the name isn't in the registry, so it might have changed. look up the old one to remove it
+            names = await R6UserConnections.filter(id=self.id).values_list("name", flat=True)
+            old_name = names[0] if names else None
+        await super().save(*args, **kwargs)
+        username_registry.rename(old_name, self)
+
     @classmethod
     async def create_from_r6tracker_resp(cls, resp: dict):
         if len(resp) == 1 and isinstance(resp, list):
@@ -272,6 +293,201 @@ class R6UserConnections(Base):
         table = "R6UserConnections"
 
 
+USERNAME_PLATFORMS = ("uplay", "ubi", "psn", "xbl")
+"""The platforms whose names show up in username autocomplete."""
+USERNAME_LOAD_CHUNK_SIZE = 10000
+"""How many connections are read at once when loading the username registry."""
+USERNAME_SNAPSHOT_PATH = "usernames.snapshot"
+"""Where the username registry is saved, so it can be loaded on startup without reading every connection."""
+USERNAME_SNAPSHOT_VERSION = 3
+"""Bump this when the snapshot format changes, so old snapshots are ignored."""
+USERNAME_SNAPSHOT_MARGIN = datetime.timedelta(minutes=5)
+"""How far before a snapshot was saved connections are re-read from when loading it, so ones saved while it was being written aren't missed."""
+
+class UsernameRegistry:
+    """Holds the name of every non third party connection in a search index for username autocomplete.
+
+    Entries are keyed by (lowercase name, platform), so the same name is only added once per platform.
+    Kept up to date by `R6UserConnections.save`, loaded by `load` and saved to disk by `save_snapshot`.
+    Changes that don't go through `save` (updates, deletes, other processes) are caught up on by `reconcile`."""
+
+    def __init__(self):
+        self.index: SearchIndex[Tuple[str, str], Tuple[str, str]] = SearchIndex()
+        """Values are (name, platform)."""
+        self.last_id: int = 0
+        """The highest connection ID read from the database. Connections after it are read when loading from a snapshot.
+        Only `load` moves it, since connections can be saved out of ID order."""
+        self.loaded: bool = False
+        self.snapshot_time: Optional[datetime.datetime] = None
+        """When the snapshot that was loaded was saved. None if the registry was read from the database."""
+        self._lock = asyncio.Lock()
+        self._pending_renames: List[Tuple[Optional[str], R6UserConnections]] = []
+        """Renames made while loading, applied once the load is done so the snapshot can't overwrite them."""
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @staticmethod
+    def _key(name: str, platform: str) -> Tuple[str, str]:
+        return (name.lower(), platform)
+
+    def has(self, name: Optional[str], platform: str) -> bool:
+        return bool(name) and self._key(name, platform) in self.index # type: ignore
+
+    def add(self, name: Optional[str], platform: str) -> None:
+        if name and platform in USERNAME_PLATFORMS:
+            self.index.add(self._key(name, platform), name, (name, platform))
+
+    def rename(self, old_name: Optional[str], connection: R6UserConnections) -> None:
+        """Adds a connection that was just saved, removing its old name if it was renamed."""
+        if self._lock.locked():
+            self._pending_renames.append((old_name, connection))
+            return
+        self._rename(old_name, connection)
+
+    def _rename(self, old_name: Optional[str], connection: R6UserConnections) -> None:
+        if old_name and old_name.lower() != (connection.name or "").lower():
+            self.index.remove(self._key(old_name, connection.platform))
+        if not connection.is_third_party:
+            self.add(connection.name, connection.platform)
+
+    def bump(self, name: str, platform: str) -> None:
+        """Makes a name rank higher, e.g. when it's looked up."""
+        self.index.bump(self._key(name, platform))
+
+    def search(self, query: str, limit: int = 25, cutoff: float = 0.2) -> List[Tuple[str, str]]:
+        """Searches for names. See `SearchIndex.search`.
+
+        Returns:
+            List[Tuple[str, str]]: (name, platform) for the best matches.
+        """
+        return self.index.search(query, limit=limit, cutoff=cutoff)
+
+    async def load(self, path: Optional[str] = USERNAME_SNAPSHOT_PATH, chunk_size: int = USERNAME_LOAD_CHUNK_SIZE) -> int:
+        """Loads the registry from a snapshot if there is one, then reads the connections made since, in chunks.
+
+        Args:
+            path (Optional[str], optional): The snapshot to load. If None, every connection is read. Defaults to USERNAME_SNAPSHOT_PATH.
+            chunk_size (int, optional): How many connections are read at once. Defaults to USERNAME_LOAD_CHUNK_SIZE.
+
+        Returns:
+            int: How many names were read from the database.
+        """
+        async with self._lock:
+            if path:
+                await asyncio.to_thread(self._load_snapshot, path)
+
+            added = 0
+            if self.snapshot_time is not None:
+                # connections from before the snapshot that were changed since. old names are removed by `reconcile`
+                rows = await R6UserConnections.filter(
+                    id__lte=self.last_id,
+                    updated_at__gte=self.snapshot_time - USERNAME_SNAPSHOT_MARGIN,
+                    is_third_party=False,
+                    platform__in=USERNAME_PLATFORMS,
+                ).values_list("name", "platform")
+                added += self.index.add_many(
+                    (self._key(name, platform), name, (name, platform))
+                    for name, platform in rows if name
+                )
+
+            while True:
+                rows = await R6UserConnections.filter(
+                    id__gt=self.last_id,
+                    is_third_party=False,
+                    platform__in=USERNAME_PLATFORMS,
+                ).order_by("id").limit(chunk_size).values_list("id", "name", "platform")
+                if not rows:
+                    break
+                added += self.index.add_many(
+                    (self._key(name, platform), name, (name, platform))
+                    for _, name, platform in rows if name
+                )
+                self.last_id = rows[-1][0]
+                await asyncio.sleep(0) # let other tasks run between chunks
+
+            self._apply_pending_renames()
+            self.loaded = True
+            return added
+
+    def _apply_pending_renames(self) -> None:
+        for old_name, connection in self._pending_renames:
+            self._rename(old_name, connection)
+        self._pending_renames.clear()
+
+    async def reconcile(self, chunk_size: int = USERNAME_LOAD_CHUNK_SIZE) -> Tuple[int, int]:
+        """Reads every connection and brings the registry in line with them,
+        adding names it's missing and removing ones no connection has any more.
+
+        Args:
+            chunk_size (int, optional): How many connections are read at once. Defaults to USERNAME_LOAD_CHUNK_SIZE.
+
+        Returns:
+            Tuple[int, int]: How many names were added and how many were removed.
+        """
+        async with self._lock:
+            seen: Set[Tuple[str, str]] = set()
+            added = 0
+            last_id = 0
+            while True:
+                rows = await R6UserConnections.filter(
+                    id__gt=last_id,
+                    is_third_party=False,
+                    platform__in=USERNAME_PLATFORMS,
+                ).order_by("id").limit(chunk_size).values_list("id", "name", "platform")
+                if not rows:
+                    break
+                entries = [(self._key(name, platform), name, (name, platform)) for _, name, platform in rows if name]
+                seen.update(key for key, _, _ in entries)
+                added += self.index.add_many(entries)
+                last_id = rows[-1][0]
+                await asyncio.sleep(0) # let other tasks run between chunks
+
+            removed = 0
+            for key in self.index.keys():
+                if key not in seen:
+                    self.index.remove(key)
+                    removed += 1
+            self.last_id = max(self.last_id, last_id)
+            # renames saved while reading are applied last, so they can't be undone by rows read before them
+            self._apply_pending_renames()
+            return added, removed
+
+    def _load_snapshot(self, path: str) -> None:
+        try:
+            with open(path, "rb") as f:
+                snapshot = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            traceback.print_exception(e)
+            return
+        if snapshot.get("version") != USERNAME_SNAPSHOT_VERSION:
+            return
+        self.index = snapshot["index"]
+        self.last_id = snapshot["last_id"]
+        self.snapshot_time = snapshot["saved_at"]
+
+    async def save_snapshot(self, path: str = USERNAME_SNAPSHOT_PATH) -> None:
+        """Saves the registry to disk. It's written to a temporary file first, so a crash can't leave half a snapshot."""
+        if not self.loaded:
+            return
+
+        def write(snapshot: dict):
+            with open(f"{path}.tmp", "wb") as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{path}.tmp", path)
+
+        # pickled in a thread so the event loop isn't blocked. the lock queues renames until it's done, so the index can't change underneath it.
+        # searches only read it, and bumps only change a popularity in place
+        async with self._lock:
+            await asyncio.to_thread(write, {"version": USERNAME_SNAPSHOT_VERSION, "last_id": self.last_id, "saved_at": discord.utils.utcnow(), "index": self.index})
+            self._apply_pending_renames()
+
+
+username_registry = UsernameRegistry()
+
+
 class Playtime(Base):
     userid = fields.CharField(max_length=100, unique=True)
     clearance_level = fields.BigIntField(null=True)
@@ -349,7 +565,7 @@ class RankedStats(Base):
 
     @staticmethod
     async def create_from_dict(data: dict):
-        await __class__.create(
+        stats = await __class__.create(
             casual_kills=data.get("casual", {}).get("kills", None),
             casual_deaths=data.get("casual", {}).get("deaths", None),
             casual_wins=data.get("casual", {})
@@ -429,6 +645,8 @@ class RankedStats(Base):
             ranked_rank_points=data.get("ranked", {}).get("rank_points", None),
             user_id=data.get("platform_families_full_profiles", {}).get("userid", None),
         )
+        leaderboard_store.update(stats)
+        return stats
 
     @classmethod
     async def from_player(cls, player: Player):
@@ -522,18 +740,307 @@ class RankedStats(Base):
                 }
             )
         
-        if await cls.filter(user=user, platform=kwargs.get("platform")).exists():
-            stats = await cls.get(user=user, platform=kwargs.get("platform"))
+        stats = await cls.filter(user=user, platform=kwargs.get("platform")).first()
+        previous = StatsSnapshots.values_from_stats(stats) if stats else None
+        if stats:
             await stats.update_from_dict(kwargs)
             await stats.save() 
         else:
             stats = await cls.create(**kwargs)
-        
+
+        leaderboard_store.update(stats)
+        await StatsSnapshots.record(stats, previous)
+
         return stats
     class Meta:
         table = "RankedStats"
         unique_together = ("user_id", "platform")
 
+
+class StatsSnapshots(Model):
+    """A player's ranked stats over time, for MMR graphs and progress over a period.
+
+    A row is only added when the stats changed since the last refresh, so this stays small.
+    It's kept narrow on purpose, without the timestamps from Base, since it has many more rows than anything else."""
+
+    id = fields.BigIntField(pk=True, generated=True)
+    user = fields.ForeignKeyField("my_app.R6User", related_name="stats_snapshots")
+    platform = fields.CharField(max_length=20)
+    timestamp = fields.DatetimeField()
+
+    rank_points = fields.IntField(null=True)
+    wins = fields.IntField(null=True)
+    losses = fields.IntField(null=True)
+    kills = fields.IntField(null=True)
+    deaths = fields.IntField(null=True)
+
+    @staticmethod
+    def values_from_stats(stats: RankedStats) -> Tuple[Optional[int], ...]:
+        """Gets the values a snapshot stores from a RankedStats object, in field order."""
+        return (stats.ranked_rank_points, stats.ranked_wins, stats.ranked_losses, stats.ranked_kills, stats.ranked_deaths)
+
+    @classmethod
+    async def record(cls, stats: RankedStats, previous: Optional[Tuple[Optional[int], ...]]=None) -> Optional[Self]:
+        """Adds a snapshot of a player's stats, if they changed.
+
+        Args:
+            stats (RankedStats): The player's stats, after refreshing them.
+            previous (Optional[Tuple[Optional[int], ...]], optional): `values_from_stats` from before refreshing them. Defaults to None.
+
+        Returns:
+            Optional[Self]: The snapshot, or None if nothing changed.
+        """
+        values = cls.values_from_stats(stats)
+        if values == previous or all(value is None for value in values):
+            return None
+        rank_points, wins, losses, kills, deaths = values
+        return await cls.create(
+            user_id=stats.user_id, # type: ignore
+            platform=stats.platform,
+            timestamp=datetime.datetime.now(tz=datetime.timezone.utc),
+            rank_points=rank_points,
+            wins=wins,
+            losses=losses,
+            kills=kills,
+            deaths=deaths,
+        )
+
+    @classmethod
+    async def history(cls, user_id: int, platform: str, since: Optional[datetime.datetime]=None) -> List[Self]:
+        """Gets a player's snapshots, oldest first.
+
+        Args:
+            user_id (int): The ID of the player's R6User.
+            platform (str): The platform of the stats.
+            since (Optional[datetime.datetime], optional): Only get snapshots after this. Defaults to None.
+        """
+        query = cls.filter(user_id=user_id, platform=platform)
+        if since:
+            query = query.filter(timestamp__gte=since)
+        return await query.order_by("timestamp")
+
+    @classmethod
+    async def at(cls, user_id: int, platform: str, when: datetime.datetime) -> Optional[Self]:
+        """Gets what a player's stats were at a point in time, e.g. to show their progress since last week.
+
+        Returns:
+            Optional[Self]: The latest snapshot at or before `when`, or None if there isn't one.
+        """
+        return await cls.filter(user_id=user_id, platform=platform, timestamp__lte=when).order_by("-timestamp").first()
+
+    class Meta:
+        table = "StatsSnapshots"
+        indexes = (("user_id", "platform", "timestamp"),)
+
+
+class LeaderboardIndex:
+    """A single leaderboard, kept sorted in memory so a page can be read without sorting the whole season.
+
+    Every player has at most one entry. If a player has stats on more than one platform,
+    their entry is their best row for this leaderboard."""
+
+    def __init__(self, season: str, prefix: str, stat: str, platform: Optional[str], descending: bool):
+        self.season = season
+        self.prefix = prefix
+        self.stat = stat
+        self.platform = platform
+        self.descending = descending
+
+        self.keys: List[Tuple[int, float, int]] = []
+        """The sorted (sort value, created_at, RankedStats ID) of every entry, best first."""
+        self.entries: Dict[int, Tuple[int, float, int]] = {}
+        """Maps an R6User ID to the key of its entry."""
+        self.rows: Dict[int, Dict[int, Tuple[int, float, int]]] = {}
+        """Maps an R6User ID to the key of each of its rows. The best one is used as the entry."""
+
+    @property
+    def column(self) -> str:
+        return f"{self.prefix}_{self.stat}"
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        """The RankedStats fields needed to place a row on this leaderboard."""
+        if self.stat in ("rank_points", "max_rank_points"):
+            filter_fields = ("ranked_max_rank_points",)
+        else:
+            filter_fields = (f"{self.prefix}_kills", f"{self.prefix}_deaths")
+        return ("id", "user_id", "platform", "season_number", "created_at", self.column, *filter_fields)
+
+    def key_for(self, row: Dict[str, Any]) -> Optional[Tuple[int, float, int]]:
+        """Gets the key of a row, or None if the row isn't shown on this leaderboard."""
+        if row["season_number"] != self.season:
+            return None
+        if self.platform and row["platform"] != self.platform:
+            return None
+
+        if self.stat in ("rank_points", "max_rank_points"):
+            if row["ranked_max_rank_points"] == 1000: # unranked
+                return None
+        elif row[f"{self.prefix}_kills"] == 0 and row[f"{self.prefix}_deaths"] == 0: # inactive this season
+            return None
+
+        value = row[self.column]
+        if value is None:
+            return None
+        return (-value if self.descending else value, row["created_at"].timestamp(), row["id"])
+
+    def update(self, user_id: int, row_id: int, key: Optional[Tuple[int, float, int]]) -> None:
+        """Moves a row to its new place on the leaderboard, or removes it if `key` is None."""
+        rows = self.rows.setdefault(user_id, {})
+        if key is None:
+            rows.pop(row_id, None)
+        else:
+            rows[row_id] = key
+
+        best = min(rows.values()) if rows else None
+        if not rows:
+            del self.rows[user_id]
+
+        old = self.entries.get(user_id)
+        if old == best:
+            return
+        if old is not None:
+            del self.keys[bisect.bisect_left(self.keys, old)]
+            del self.entries[user_id]
+        if best is not None:
+            bisect.insort(self.keys, best)
+            self.entries[user_id] = best
+
+    def page(self, offset: int, limit: int, hidden: Set[int]) -> Tuple[int, List[int]]:
+        """Reads a page of the leaderboard.
+
+        Args:
+            offset (int): The number of shown players to skip.
+            limit (int): The maximum number of players to return.
+            hidden (Set[int]): The R6User IDs of players that shouldn't be shown.
+
+        Returns:
+            Tuple[int, List[int]]: The number of shown players, and the RankedStats IDs on this page.
+        """
+        hidden_keys = {self.entries[user_id] for user_id in hidden if user_id in self.entries}
+
+        start = offset
+        for position in sorted(bisect.bisect_left(self.keys, key) for key in hidden_keys):
+            if position > start:
+                break
+            start += 1
+
+        ids = []
+        i = start
+        while i < len(self.keys) and len(ids) < limit:
+            if self.keys[i] not in hidden_keys:
+                ids.append(self.keys[i][2])
+            i += 1
+        return len(self.keys) - len(hidden_keys), ids
+
+
+class LeaderboardStore:
+    """Holds the leaderboards that have been viewed, keyed by (season, gamemode, stat, platform, descending).
+
+    A leaderboard is loaded from the database the first time it is viewed,
+    after that it is kept up to date by `RankedStats.from_player` and `RankedStats.create_from_dict`."""
+
+    def __init__(self):
+        self._indexes: Dict[Tuple[str, str, str, Optional[str], bool], LeaderboardIndex] = {}
+        self._lock = asyncio.Lock()
+
+    async def get_index(self, season: str, prefix: str, stat: str, platform: Optional[str], descending: bool) -> LeaderboardIndex:
+        """Gets a leaderboard, loading it from the database if it hasn't been viewed yet.
+
+        Args:
+            season (str): The season number.
+            prefix (str): The prefix of the gamemode's RankedStats columns.
+            stat (str): The stat to sort by, e.g. `rank_points` or `wins`.
+            platform (Optional[str]): The platform route, or None for all platforms.
+            descending (bool): Whether the highest values are first.
+
+        Returns:
+            LeaderboardIndex: The leaderboard.
+        """
+        key = (season, prefix, stat, platform, descending)
+        async with self._lock:
+            if key in self._indexes:
+                return self._indexes[key]
+
+            index = LeaderboardIndex(season, prefix, stat, platform, descending)
+            # registered before loading so updates that happen while loading aren't lost
+            self._indexes[key] = index
+
+            query = RankedStats.filter(season_number=season)
+            if platform:
+                query = query.filter(platform=platform)
+            for row in await query.values(*index.fields):
+                if row["id"] in index.rows.get(row["user_id"], {}):
+                    continue # updated while loading, already newer than this row
+                index.update(row["user_id"], row["id"], index.key_for(row))
+            return index
+
+    def update(self, stats: RankedStats) -> None:
+        """Updates every loaded leaderboard with a player's new stats."""
+        for index in self._indexes.values():
+            row = {field: getattr(stats, field, None) for field in index.fields}
+            index.update(stats.user_id, stats.id, index.key_for(row)) # type: ignore
+
+    @staticmethod
+    async def hidden_users() -> Set[int]:
+        """Gets the R6User IDs of players that have turned off `show_on_leaderboard`."""
+        discord_ids = await Settings.filter(show_on_leaderboard=False).values_list("user_id", flat=True)
+        if not discord_ids:
+            return set()
+        userids = await R6UserConnections.filter(platform="discord", platform_id__in=[str(x) for x in discord_ids]).values_list("userid", flat=True)
+        if not userids:
+            return set()
+        return set(await R6User.filter(userid__in=userids).values_list("id", flat=True))
+
+
+leaderboard_store = LeaderboardStore()
+
+class RawPayloads(Base):
+    """The raw API data that stats objects were made from.
+    This is kept out of their tables, so reading stats doesn't load and decode kilobytes of JSON that are almost never used."""
+
+    model = fields.CharField(max_length=50)
+    """The name of the model the object is from."""
+
+    object_id = fields.BigIntField()
+    """The ID of the object."""
+
+    data = fields.JSONField(null=True)
+
+    @classmethod
+    async def save_many(cls, model: str, payloads: Dict[int, Any], using_db: Optional[BaseDBAsyncClient]=None) -> None:
+        """Saves the raw data of many objects in one upsert.
+
+        Args:
+            model (str): The name of the model the objects are from.
+            payloads (Dict[int, Any]): The raw data of each object, by ID.
+            using_db (Optional[BaseDBAsyncClient], optional): The connection to use, e.g. a transaction. Defaults to None.
+        """
+        if not payloads:
+            return
+        query = """INSERT INTO "RawPayloads" (model, object_id, data, created_at, updated_at)
+                   SELECT $1, x.object_id, x.data::jsonb, now(), now()
+                   FROM unnest($2::bigint[], $3::text[]) AS x(object_id, data)
+                   ON CONFLICT (model, object_id)
+                   DO UPDATE SET data = EXCLUDED.data, updated_at = now();
+                """
+        conn = using_db or Tortoise.get_connection("default")
+        await conn.execute_query(query, [model, list(payloads), [json.dumps(data) for data in payloads.values()]])
+
+    class Meta:
+        table = "RawPayloads"
+        unique_together = ("model", "object_id")
+
+class HasRawPayload:
+    """For models whose raw API data is kept in RawPayloads."""
+
+    id: int
+
+    async def raw(self) -> Optional[Any]:
+        """Loads the raw API data this object was made from."""
+        payload = await RawPayloads.filter(model=type(self).__name__, object_id=self.id).first()
+        return payload.data if payload else None
+
 class GamemodeType(Enum):
     RANKED = 'ranked'
     CASUAL = 'casual'
@@ -549,7 +1056,7 @@ class GamemodeType(Enum):
                 return instance
         raise ValueError(f"Bad str passed to from_str (doesn't match any enum objects for class {cls.__name__})")
     
-class RankedStatsSeasonal(Base):
+class RankedStatsSeasonal(Base, HasRawPayload):
     """Season specific stats for a user.
     A seperate instance of this object should exist for each gamemode"""
 
@@ -579,9 +1086,6 @@ class RankedStatsSeasonal(Base):
     rankpoints = fields.BigIntField(null=True)
     maxrankpoints = fields.BigIntField(null=True)
 
-    _raw = fields.JSONField(null=True)
-    """Raw metadata of the user."""
-    
     @classmethod
     async def from_api(cls, platform_connection: R6UserConnections, data: dict, ranked_stats: Optional[RankedStatsV2]=None) -> Self:
         """Generate a seasnoal object based off an API response.
@@ -594,40 +1098,96 @@ class RankedStatsSeasonal(Base):
         Returns:
             Self: The created object.
         """
-        data['expiryDate'] = dateparser.parse(data['expiryDate'])
-
         instance, _ = await cls.update_or_create(
             platform_connection=platform_connection,
             ranked_stats=ranked_stats,
             season=data['attributes']['season'],
             gamemode=data['attributes']['gamemode'],
-            defaults={
-                'season_name': data['metadata']['seasonName'],
-                'season_short': data['metadata']['shortName'],
-                'season_color': data['metadata']['color'],
-                'expirydate': data['expiryDate'],
-                'gamemode_name': data['metadata']['gamemodeName'],
-                'kills': data.get('stats',{}).get('kills',{'value': None})['value'],
-                'deaths': data.get('stats',{}).get('deaths',{'value': None})['value'],
-                'kdratio': data.get('stats',{}).get('kdRatio',{'value': None})['value'],
-                'killspergame': data.get('stats',{}).get('killsPerGame',{'value': None})['value'],
-                'matchesplayed': data.get('stats',{}).get('matchesPlayed',{'value': None})['value'],
-                'matcheswon': data.get('stats',{}).get('matchesWon',{'value': None})['value'],
-                'matcheslost': data.get('stats',{}).get('matchesLost',{'value': None})['value'],
-                'matchesabandoned': data.get('stats',{}).get('matchesAbandoned',{'value': None})['value'],
-                'winpercentage': data.get('stats',{}).get('winPercentage',{'value': None})['value'],
-                'rankpoints': data.get('stats',{}).get('mmr',{}).get('value',None) or data.get('stats',{}).get('rankPoints',{}).get('value',None),
-                'maxrankpoints': data.get('stats',{}).get('maxRankPoints',{}).get('value',None),
-                '_raw': data,
-            }
+            defaults=cls._values_from_api(data),
         )
+        await RawPayloads.save_many(cls.__name__, {instance.id: data})
 
         return instance
+
+    @classmethod
+    async def bulk_from_api(cls, platform_connection: R6UserConnections, data: List[dict], ranked_stats: Optional[RankedStatsV2]=None, using_db: Optional[BaseDBAsyncClient]=None) -> List[Self]:
+        """Saves every season segment of a profile at once.
+        The existing objects are read with one query, then the rest are created with one query and the existing ones updated with another.
+
+        Args:
+            platform_connection (R6UserConnections): The platform connection of the user.
+            data (List[dict]): The season segments from the API.
+            ranked_stats (Optional[RankedStatsV2], optional): User's ranked stats. Defaults to None.
+            using_db (Optional[BaseDBAsyncClient], optional): The connection to use, e.g. a transaction. Defaults to None.
+
+        Returns:
+            List[Self]: The created and updated objects.
+        """
+        values = {(segment['attributes']['season'], segment['attributes']['gamemode']): cls._values_from_api(segment) for segment in data}
+        if not values:
+            return []
+
+        existing = await cls.filter(
+            platform_connection=platform_connection,
+            ranked_stats=ranked_stats,
+            season__in=list({season for season, _ in values}),
+        ).using_db(using_db)
+        existing_by_key = {(instance.season, instance.gamemode): instance for instance in existing}
+
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        to_create: List[Self] = []
+        to_update: List[Self] = []
+        for (season, gamemode), fields_ in values.items():
+            instance = existing_by_key.get((season, gamemode))
+            if instance is None:
+                to_create.append(cls(platform_connection=platform_connection, ranked_stats=ranked_stats, season=season, gamemode=gamemode, **fields_))
+            else:
+                instance.update_from_dict({**fields_, 'updated_at': now})
+                to_update.append(instance)
+
+        if to_create:
+            await cls.bulk_create(to_create, using_db=using_db)
+        if to_update:
+            await cls.bulk_update(to_update, fields=[*next(iter(values.values())), 'updated_at'], using_db=using_db)
+
+        if to_create:
+            # read them back, since bulk_create doesn't set the IDs
+            existing = await cls.filter(
+                platform_connection=platform_connection,
+                ranked_stats=ranked_stats,
+                season__in=list({season for season, _ in values}),
+            ).using_db(using_db)
+        segments = {(segment['attributes']['season'], segment['attributes']['gamemode']): segment for segment in data}
+        saved = [instance for instance in existing if (instance.season, instance.gamemode) in segments]
+        await RawPayloads.save_many(cls.__name__, {instance.id: segments[(instance.season, instance.gamemode)] for instance in saved}, using_db=using_db)
+        return saved
+
+    @staticmethod
+    def _values_from_api(data: dict) -> Dict[str, Any]:
+        """Gets the values of every field besides the ones that identify the object from an API segment."""
+        return {
+            'season_name': data['metadata']['seasonName'],
+            'season_short': data['metadata']['shortName'],
+            'season_color': data['metadata']['color'],
+            'expiry_date': dateparser.parse(data['expiryDate']) if data.get('expiryDate') else None,
+            'gamemode_name': data['metadata']['gamemodeName'],
+            'kills': data.get('stats',{}).get('kills',{'value': None})['value'],
+            'deaths': data.get('stats',{}).get('deaths',{'value': None})['value'],
+            'kdratio': data.get('stats',{}).get('kdRatio',{'value': None})['value'],
+            'killspergame': data.get('stats',{}).get('killsPerGame',{'value': None})['value'],
+            'matchesplayed': data.get('stats',{}).get('matchesPlayed',{'value': None})['value'],
+            'matcheswon': data.get('stats',{}).get('matchesWon',{'value': None})['value'],
+            'matcheslost': data.get('stats',{}).get('matchesLost',{'value': None})['value'],
+            'matchesabandoned': data.get('stats',{}).get('matchesAbandoned',{'value': None})['value'],
+            'winpercentage': data.get('stats',{}).get('winPercentage',{'value': None})['value'],
+            'rankpoints': data.get('stats',{}).get('mmr',{}).get('value',None) or data.get('stats',{}).get('rankPoints',{}).get('value',None),
+            'maxrankpoints': data.get('stats',{}).get('maxRankPoints',{}).get('value',None),
+        }
     
     class Meta:
         table = "RankedStatsSeasonal"
 
-class RankedStatsV2(Base):
+class RankedStatsV2(Base, HasRawPayload):
     """This class is a new one to start new stats tracking for the new ranking provider (TrackerNetwork)."""
 
     user_connection = fields.ForeignKeyField('my_app.R6UserConnections', related_name='ranked_statsv2')
@@ -726,17 +1286,20 @@ class RankedStatsV2(Base):
     quickplay_winpercentage = fields.FloatField(null=True)
 
 
-
-    _raw = fields.JSONField(null=True)
-    """Raw metadata of the user."""
-
     @classmethod
     async def from_api(cls,  data: dict, platform_connection: Optional[R6UserConnections]=None,trackergg_connection: Optional[R6UserConnections]=None) -> Self:
-
+        """Saves a profile from the API, with its season stats and name changes.
+        Everything is written in one transaction, with a fixed number of queries no matter how many seasons or name changes there are."""
         if not trackergg_connection:
             if data['userInfo']['userId'] is not None and not trackergg_connection:
                 trackergg_connection = await R6UserConnections.filter(platform='trackergg',platform_id=data['userInfo']['userId']).first()
-        user, _ = await R6User.get_or_create(userid=data['metadata']['uplayUserId'])
+
+        async with in_transaction() as conn:
+            return await cls._from_api(conn, data, platform_connection, trackergg_connection)
+
+    @classmethod
+    async def _from_api(cls, conn: BaseDBAsyncClient, data: dict, platform_connection: Optional[R6UserConnections], trackergg_connection: Optional[R6UserConnections]) -> Self:
+        user, _ = await R6User.get_or_create(userid=data['metadata']['uplayUserId'], using_db=conn)
 
 
         if not platform_connection:
@@ -753,7 +1316,8 @@ class RankedStatsV2(Base):
                     'is_third_party': data['platformInfo']['platformSlug'] not in ['psn','xbl','uplay','ubi'],
                     'manual': False,
                     'linked_by': None,
-                }
+                },
+                using_db=conn,
             )
         #overview = data['overview']['segments'][0]
         overview = discord.utils.find(lambda x: x['type'] == 'overview', data['segments']) or {}
@@ -858,22 +1422,21 @@ class RankedStatsV2(Base):
                     'quickplay_kdratio': quickplay.get('stats',{}).get('kdRatio',{'value': None})['value'],
                     'quickplay_killspermatch': quickplay.get('stats',{}).get('killsPerMatch',{'value': None})['value'],
                     'quickplay_winpercentage': quickplay.get('stats',{}).get('winPercentage',{'value': None})['value'],
-
-                    '_raw': data,
-            }
+            },
+            using_db=conn,
         )
+        await RawPayloads.save_many(cls.__name__, {instance.id: data}, using_db=conn)
 
-        await NameChanges.bulk_from_api(user, metadata.get('nameChanges',[]))
+        await NameChanges.bulk_from_api(user, metadata.get('nameChanges',[]), using_db=conn)
 
-        for segment in data['segments']:
-            if segment['type'] == 'season':
-                await RankedStatsSeasonal.from_api(platform_connection=platform_connection, data=segment, ranked_stats=instance)
+        seasons = [segment for segment in data['segments'] if segment['type'] == 'season']
+        await RankedStatsSeasonal.bulk_from_api(platform_connection=platform_connection, data=seasons, ranked_stats=instance, using_db=conn)
         return instance
     
     class Meta:
         table = "RankedStatsV2"
 
-class PastRankedPoints(Base):
+class PastRankedPoints(Base, HasRawPayload):
     """This model is similar to RankedStatsV2, but this only shows ranked stats current and past."""
 
     user_connection = fields.ForeignKeyField('my_app.R6UserConnections', related_name='past_ranked_points')
@@ -888,9 +1451,6 @@ class PastRankedPoints(Base):
     rank_name = fields.CharField(max_length=50)
     """The rank name of the user."""
 
-    _raw = fields.JSONField(null=True)
-    """Raw metadata of the user."""
-
     @classmethod
     async def bulk_from_api(cls, user_connection: R6UserConnections, data: List[Tuple[str, Dict[str, Optional[Any]]]]) -> List[Self]:
         instances = []
@@ -905,13 +1465,13 @@ class PastRankedPoints(Base):
 
         instance, _ = await cls.update_or_create(
             user_connection=user_connection,
+            date=date,
             defaults={
-                'date': date,
                 'rank_points': stats.get('value',-1),
                 'rank_name': stats.get('metadata',{}).get('rank',-1),
-                '_raw': stats,
             }
         )
+        await RawPayloads.save_many(cls.__name__, {instance.id: stats})
         return instance
     
     class Meta:
@@ -930,11 +1490,44 @@ class NameChanges(Base):
     """The date the user changed their name."""
 
     @classmethod
-    async def bulk_from_api(cls, user: R6User, data: List[dict]) -> List[Self]:
-        instances = []
+    async def bulk_from_api(cls, user: R6User, data: List[dict], using_db: Optional[BaseDBAsyncClient]=None) -> List[Self]:
+        """Saves every name change of a user at once.
+        The existing ones are read with one query, then the rest are created with one query and renamed ones updated with another.
+
+        Args:
+            user (R6User): The user that changed their name.
+            data (List[dict]): The name changes from the API.
+            using_db (Optional[BaseDBAsyncClient], optional): The connection to use, e.g. a transaction. Defaults to None.
+
+        Returns:
+            List[Self]: The created and updated objects.
+        """
+        names: Dict[datetime.datetime, str] = {}
         for name_change in data or []:
-            instances.append(await cls.from_api(user, name_change))
-        return instances
+            timestamp = dateparser.parse(name_change['timestamp'])
+            if timestamp is not None:
+                names[timestamp] = name_change['name']
+        if not names:
+            return []
+
+        existing = await cls.filter(user=user, timestamp__in=list(names)).using_db(using_db)
+        existing_by_timestamp = {instance.timestamp.timestamp(): instance for instance in existing}
+
+        to_create: List[Self] = []
+        to_update: List[Self] = []
+        for timestamp, name in names.items():
+            instance = existing_by_timestamp.get(timestamp.timestamp())
+            if instance is None:
+                to_create.append(cls(user=user, timestamp=timestamp, name=name))
+            elif instance.name != name:
+                instance.name = name
+                to_update.append(instance)
+
+        if to_create:
+            await cls.bulk_create(to_create, using_db=using_db)
+        if to_update:
+            await cls.bulk_update(to_update, fields=['name'], using_db=using_db)
+        return to_update + to_create
 
     @classmethod
     async def from_api(cls, user: R6User, data: dict) -> Self:
@@ -953,7 +1546,26 @@ class NameChanges(Base):
     class Meta:
         table = "NameChanges"
 
-class Matches(Base):
+MATCH_INGEST_BATCH_SIZE = 1000
+"""How many matches or match segments are written per query when saving match history."""
+
+def parse_api_timestamp(value: Optional[str]) -> Optional[datetime.datetime]:
+    """Parses a timestamp from the API. ISO timestamps are parsed directly, since dateparser is slow."""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return dateparser.parse(value)
+
+def normalize_uuid(value: Any) -> Optional[str]:
+    """Gets the string form of a UUID, or None if it isn't one."""
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+class Matches(Base, HasRawPayload):
     """Represents a match in Rainbow Six Siege."""
 
     match_id = fields.UUIDField(unique=True)
@@ -966,48 +1578,98 @@ class Matches(Base):
     has_session_data = fields.BooleanField(default=False)
     is_rollback = fields.BooleanField(default=False)
 
-    _raw = fields.JSONField(null=True)
-
     @classmethod
-    async def bulk_from_api(cls, data: list[dict]):
-        for match in data.get('data',data):
-            await cls.from_api(match)
-    
-    @classmethod
-    async def from_api(cls, data: dict):
-        """Make sure to fetch all related users before calling this."""
+    async def bulk_from_api(cls, data: Union[dict, List[dict]]) -> List[Self]:
+        """Saves a page of match history, with every player's segment, in one transaction.
+        The number of queries doesn't depend on how many matches or players there are.
 
-        match, _ = await cls.update_or_create(
-            match_id=data['attributes']['id'],
-            defaults={
-                'gamemode': data['attributes'].get('gamemode',None),
-                'datacenter': data['attributes'].get('datacenter',None), 
-                'timestamp': dateparser.parse(data['attributes'].get('metadata',{}).get('timestamp',None)),
-                'gamemode_name': data['attributes'].get('metadata',{}).get('gamemodeName',None),
-                'has_overwolf_roster': data['attributes'].get('metadata',{}).get('hasOverwolfRoster',False),
-                'has_session_data': data['attributes'].get('metadata',{}).get('hasSessionData',False),
-                'is_rollback': data['attributes'].get('metadata',{}).get('isRollback',False),
+        Segments of players without a saved platform connection are skipped, since segments don't include the Ubisoft account they belong to.
+        Fetch those players first to save their segments.
+
+        Args:
+            data (Union[dict, List[dict]]): The response from the API, or the matches in it.
+
+        Returns:
+            List[Self]: The saved matches.
+        """
+        matches = data.get('data', data) if isinstance(data, dict) else data
+        by_id: Dict[str, dict] = {}
+        for match in matches:
+            match_id = normalize_uuid(match['attributes']['id'])
+            if match_id:
+                by_id[match_id] = match
+        if not by_id:
+            return []
+
+        async with in_transaction() as conn:
+            existing = {str(match.match_id): match for match in await cls.filter(match_id__in=list(by_id)).using_db(conn)}
+
+            now = datetime.datetime.now(tz=datetime.timezone.utc)
+            to_create: List[Self] = []
+            to_update: List[Self] = []
+            for match_id, match in by_id.items():
+                fields_ = cls._values_from_api(match)
+                instance = existing.get(match_id)
+                if instance is None:
+                    to_create.append(cls(match_id=match_id, **fields_))
+                else:
+                    instance.update_from_dict({**fields_, 'updated_at': now})
+                    to_update.append(instance)
+
+            if to_create:
+                await cls.bulk_create(to_create, batch_size=MATCH_INGEST_BATCH_SIZE, using_db=conn)
+            if to_update:
+                await cls.bulk_update(to_update, fields=[*cls._values_from_api(next(iter(by_id.values()))), 'updated_at'], batch_size=MATCH_INGEST_BATCH_SIZE, using_db=conn)
+            # read them back, since bulk_create doesn't set the IDs
+            saved = {str(match.match_id): match for match in await cls.filter(match_id__in=list(by_id)).using_db(conn)}
+
+            request_ids = {
+                normalize_uuid(segment['metadata']['platformUserId'])
+                for match in by_id.values() for segment in match['metadata']['segments']
+            }
+            request_ids.discard(None)
+            connections = {
+                str(connection.request_id): connection
+                for connection in await R6UserConnections.filter(request_id__in=list(request_ids)).using_db(conn)
             }
-        )
 
-        for segment in data['metadata']['segments']:
-            platform_connection = await R6UserConnections.filter(request_id=segment['metadata']['platformUserId']).first()
-            if not platform_connection:
-                if segment.get('metadata',{}).get('platformSlug',None):
-                    platform_connection = await R6UserConnections.create(
-                        platform=segment['metadata']['platformSlug'], 
-                        name=segment['metadata']['platformUserHandle'], 
-                        platform_id=segment['metadata']['platformUserIdentifier'],
-                        request_id=segment['metadata']['platformUserId'],
-
-                        pfp_url=segment['metadata']['avatarUrl'], pfp_url_last_updated=datetime.datetime.now())
-                raise ValueError("Fetch all the Users first.")
-            
-            await platform_connection.fetch_related('profile')
+            segments: List[Tuple[Matches, R6UserConnections, dict]] = []
+            for match_id, match in by_id.items():
+                for segment in match['metadata']['segments']:
+                    connection = connections.get(normalize_uuid(segment['metadata']['platformUserId'])) # type: ignore
+                    if connection:
+                        segments.append((saved[match_id], connection, segment))
+            await MatchSegments.bulk_from_api(segments, using_db=conn)
 
-            await MatchSegments.from_api(match, platform_connection.profile, platform_connection, segment)
+        return list(saved.values())
+
+    @classmethod
+    async def bulk_from_file(cls, path: str) -> List[Self]:
+        """Saves match history from a JSON file, like a saved API response. See `bulk_from_api`."""
+        def read():
+            with open(path, "r") as f:
+                return json.load(f)
 
-        return match
+        return await cls.bulk_from_api(await asyncio.to_thread(read))
+
+    @classmethod
+    async def from_api(cls, data: dict) -> Optional[Self]:
+        """Saves one match. See `bulk_from_api`."""
+        matches = await cls.bulk_from_api([data])
+        return matches[0] if matches else None
+
+    @staticmethod
+    def _values_from_api(data: dict) -> Dict[str, Any]:
+        """Gets the values of every field besides match_id from an API match."""
+        return {
+            'gamemode': data['attributes'].get('gamemode',None),
+            'datacenter': data['attributes'].get('datacenter',None),
+            'timestamp': parse_api_timestamp(data['attributes'].get('metadata',{}).get('timestamp',None)),
+            'gamemode_name': data['attributes'].get('metadata',{}).get('gamemodeName',None),
+            'has_overwolf_roster': data['attributes'].get('metadata',{}).get('hasOverwolfRoster',False),
+            'has_session_data': data['attributes'].get('metadata',{}).get('hasSessionData',False),
+            'is_rollback': data['attributes'].get('metadata',{}).get('isRollback',False),
+        }
 
     async def segments(self):
         return await MatchSegments.filter(match=self)
@@ -1015,7 +1677,7 @@ class Matches(Base):
     class Meta:
         table = "Matches"
 
-class MatchSegments(Base):
+class MatchSegments(Base, HasRawPayload):
     """This model stores player-specific information to a match, such as K/D, performance, etc"""
 
     match = fields.ForeignKeyField('my_app.Matches')
@@ -1092,8 +1754,6 @@ class MatchSegments(Base):
     extra_data = fields.JSONField(null=True)
     """Extra data that is not covered by the fields above."""
 
-    _raw = fields.JSONField(null=True)
-
     @classmethod
     async def from_api(cls, match: Matches, user: R6User, platform_connection: R6UserConnections, data: dict) -> Self:
         """Create a MatchSegments object from an API response.
@@ -1111,34 +1771,86 @@ class MatchSegments(Base):
             match=match,
             user=user,
             platform_connection=platform_connection,
-            defaults={
-                'platform_family': data.get('metadata', {}).get('platformFamily',None),
-                'result': data.get('metadata', {}).get('result', None),
-                'status': data.get('metadata', {}).get('status', None),
-                'has_extra_stats': data.get('metadata', {}).get('hasExtraStats', None),
-                'matches_played': data.get('stats', {}).get('matchesPlayed', {}).get('value', None),
-                'wins': data.get('stats', {}).get('wins', {}).get('value', None),
-                'losses': data.get('stats', {}).get('losses', {}).get('value', None),
-                'abandons': data.get('stats', {}).get('abandons', {}).get('value', None),
-                'kills': data.get('stats', {}).get('kills', {}).get('value', None),
-                'deaths': data.get('stats', {}).get('deaths', {}).get('value', None),
-                'rank': data.get('stats', {}).get('rank', {}).get('value', None),
-                'rank_points': data.get('stats', {}).get('rankPoints', {}).get('value', None),
-                'top_rank_position': data.get('stats', {}).get('topRankPosition', {}).get('value', None),
-                'rank_points_delta': data.get('stats', {}).get('rankPointsDelta', {}).get('value', None),
-                'rank_previous': data.get('stats', {}).get('rankPrevious',{}).get('value',None),
-                'top_rank_position_previous': data.get('stats', {}).get('topRankPositionPrevious',{}).get('value',None),
-                'kd_ratio': data.get('stats', {}).get('kdRatio', {}).get('value', None),
-                'win_percent': data.get('stats', {}).get('winPercent', {}).get('value', None),
-                'kills_per_minute': data.get('stats', {}).get('killsPerMinute', {}).get('value', None),
-                'damage_done': data.get('stats', {}).get('damageDone',{}).get('value',None),
-                'match_score': data.get('stats', {}).get('matchScore',{}).get('value',None),
-                'playtime': data.get('stats', {}).get('playtime',{}).get('value',None),
-                'extra_data': data.get('stats', None),
-                '_raw': data,
-            }
+            defaults=cls._values_from_api(data),
         )
+        await RawPayloads.save_many(cls.__name__, {instance.id: data})
         return instance
+
+    @classmethod
+    async def bulk_from_api(cls, data: List[Tuple[Matches, R6UserConnections, dict]], using_db: Optional[BaseDBAsyncClient]=None) -> List[Self]:
+        """Saves many segments at once.
+        The existing ones are read with one query, then the rest are created and the existing ones updated in batches.
+
+        Args:
+            data (List[Tuple[Matches, R6UserConnections, dict]]): The match, the player's platform connection and the API segment for every segment.
+            using_db (Optional[BaseDBAsyncClient], optional): The connection to use, e.g. a transaction. Defaults to None.
+
+        Returns:
+            List[Self]: The created and updated objects.
+        """
+        if not data:
+            return []
+
+        existing = await cls.filter(match_id__in=list({match.id for match, _, _ in data})).using_db(using_db)
+        existing_by_key = {(instance.match_id, instance.platform_connection_id): instance for instance in existing} # type: ignore
+
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        to_create: List[Self] = []
+        to_update: List[Self] = []
+        for match, platform_connection, segment in data:
+            fields_ = cls._values_from_api(segment)
+            instance = existing_by_key.get((match.id, platform_connection.id))
+            if instance is None:
+                instance = cls(match=match, user_id=platform_connection.profile_id, platform_connection=platform_connection, **fields_) # type: ignore
+                existing_by_key[(match.id, platform_connection.id)] = instance
+                to_create.append(instance)
+            else:
+                instance.update_from_dict({**fields_, 'updated_at': now})
+                if instance._saved_in_db: # not a segment that appeared twice in the payload
+                    to_update.append(instance)
+
+        if to_create:
+            await cls.bulk_create(to_create, batch_size=MATCH_INGEST_BATCH_SIZE, using_db=using_db)
+        if to_update:
+            await cls.bulk_update(to_update, fields=[*cls._values_from_api(data[0][2]), 'updated_at'], batch_size=MATCH_INGEST_BATCH_SIZE, using_db=using_db)
+
+        # read them back, since bulk_create doesn't set the IDs
+        segments = {(match.id, platform_connection.id): segment for match, platform_connection, segment in data}
+        saved = [
+            instance for instance in await cls.filter(match_id__in=list({match.id for match, _, _ in data})).using_db(using_db)
+            if (instance.match_id, instance.platform_connection_id) in segments # type: ignore
+        ]
+        await RawPayloads.save_many(cls.__name__, {instance.id: segments[(instance.match_id, instance.platform_connection_id)] for instance in saved}, using_db=using_db) # type: ignore
+        return saved
+
+    @staticmethod
+    def _values_from_api(data: dict) -> Dict[str, Any]:
+        """Gets the values of every field besides the ones that identify the object from an API segment."""
+        return {
+            'platform_family': data.get('metadata', {}).get('platformFamily',None),
+            'result': data.get('metadata', {}).get('result', None),
+            'status': data.get('metadata', {}).get('status', None),
+            'has_extra_stats': data.get('metadata', {}).get('hasExtraStats', None),
+            'matches_played': data.get('stats', {}).get('matchesPlayed', {}).get('value', None),
+            'wins': data.get('stats', {}).get('wins', {}).get('value', None),
+            'losses': data.get('stats', {}).get('losses', {}).get('value', None),
+            'abandons': data.get('stats', {}).get('abandons', {}).get('value', None),
+            'kills': data.get('stats', {}).get('kills', {}).get('value', None),
+            'deaths': data.get('stats', {}).get('deaths', {}).get('value', None),
+            'rank': data.get('stats', {}).get('rank', {}).get('value', None),
+            'rank_points': data.get('stats', {}).get('rankPoints', {}).get('value', None),
+            'top_rank_position': data.get('stats', {}).get('topRankPosition', {}).get('value', None),
+            'rank_points_delta': data.get('stats', {}).get('rankPointsDelta', {}).get('value', None),
+            'rank_previous': data.get('stats', {}).get('rankPrevious',{}).get('value',None),
+            'top_rank_position_previous': data.get('stats', {}).get('topRankPositionPrevious',{}).get('value',None),
+            'kd_ratio': data.get('stats', {}).get('kdRatio', {}).get('value', None),
+            'win_percent': data.get('stats', {}).get('winPercent', {}).get('value', None),
+            'kills_per_minute': data.get('stats', {}).get('killsPerMinute', {}).get('value', None),
+            'damage_done': data.get('stats', {}).get('damageDone',{}).get('value',None),
+            'match_score': data.get('stats', {}).get('matchScore',{}).get('value',None),
+            'playtime': data.get('stats', {}).get('playtime',{}).get('value',None),
+            'extra_data': data.get('stats', None),
+        }
     
     class Meta:
         table = "MatchSegments"
@@ -1399,6 +2111,68 @@ class CommandInvocation(Base):
 
     class Meta:
         table = "CommandInvocation"
+        indexes = (("user_id", "command", "created_at"),)
+
+
+RECENT_LOOKUPS_SIZE = 25
+"""How many recent lookups are remembered for each user and command. The most autocomplete can show."""
+RECENT_LOOKUPS_SCAN_LIMIT = 100
+"""How many of a user's latest invocations are read to find their recent lookups when they aren't cached."""
+RECENT_LOOKUPS_TTL = 3600.0
+"""How long, in seconds, a user's recent lookups are cached."""
+RECENT_LOOKUPS_MAXSIZE = 10000
+"""How many users' recent lookups are cached at once."""
+
+class RecentLookups:
+    """Remembers the players each user last looked up with each command, newest first, for username autocomplete with an empty input.
+
+    Kept up to date by `CmdLoggingCog.on_command_completion`. When a user isn't cached, their latest CommandInvocations are read instead."""
+
+    def __init__(self):
+        self._lookups: TTLCache[Tuple[int, str], Deque[Tuple[str, str]]] = TTLCache(ttl=RECENT_LOOKUPS_TTL, maxsize=RECENT_LOOKUPS_MAXSIZE)
+        """(name, platform) for each (user_id, command)."""
+
+    @staticmethod
+    def _push(lookups: Deque[Tuple[str, str]], name: str, platform: str) -> None:
+        for entry in lookups:
+            if entry[0].lower() == name.lower():
+                lookups.remove(entry)
+                break
+        lookups.appendleft((name, platform))
+
+    def record(self, user_id: int, command: str, name: str, platform: str) -> None:
+        """Records that a user looked up a player."""
+        lookups = self._lookups.get((user_id, command))
+        if lookups is not None: # otherwise it's loaded with this one the next time it's needed
+            self._push(lookups, name.replace('"', '').replace("'", '').strip(), platform)
+
+    async def get(self, user_id: int, command: str) -> List[Tuple[str, str]]:
+        """Gets the players a user last looked up with a command.
+
+        Returns:
+            List[Tuple[str, str]]: (name, platform) for each player, newest first.
+        """
+        async def fetch() -> Deque[Tuple[str, str]]:
+            invocations = await CommandInvocation.filter(
+                user_id=user_id, command=command, completed=True
+            ).order_by("-created_at").limit(RECENT_LOOKUPS_SCAN_LIMIT).values_list("kwargs", flat=True)
+
+            lookups: Deque[Tuple[str, str]] = deque(maxlen=RECENT_LOOKUPS_SIZE)
+            for kwargs in reversed(invocations): # oldest first, so the newest end up in front
+                name, platform = (kwargs or {}).get("username"), (kwargs or {}).get("platform")
+                if isinstance(name, str) and isinstance(platform, str):
+                    name = name.replace('"', '').replace("'", '').strip()
+                    if name:
+                        self._push(lookups, name, platform)
+            return lookups
+
+        return list(await self._lookups.get_or_fetch((user_id, command), fetch))
+
+
+recent_lookups = RecentLookups()
+
+VOTE_WINDOW = datetime.timedelta(hours=12)
+"""How often a user can vote on a site. Votes from the same user on the same site closer together than this are duplicates."""
 
 class Votes(Base):
     user_id = fields.BigIntField()
@@ -1426,12 +2200,116 @@ class Votes(Base):
         return await __class__.filter(user_id=self.user_id).order_by("-timestamp").first()
 
     @classmethod
-    async def voted_recently(cls, user_id: int, site: str, hours: int = 12):
+    async def bulk_record(cls, votes: List[Self]) -> List[Self]:
+        """Saves votes at once, skipping duplicates.
+        A vote is a duplicate if the same user voted on the same site within `VOTE_WINDOW`, e.g. when a site retries a webhook.
+
+        Args:
+            votes (List[Self]): The unsaved votes.
+
+        Returns:
+            List[Self]: The votes that were saved.
+        """
+        if not votes:
+            return []
+
+        since = min(vote.timestamp for vote in votes) - VOTE_WINDOW
+        last_votes: Dict[Tuple[str, int], datetime.datetime] = {}
+        for site, user_id, timestamp in await cls.filter(
+            user_id__in=list({vote.user_id for vote in votes}), timestamp__gt=since
+        ).values_list("site", "user_id", "timestamp"):
+            key = (site, user_id)
+            if key not in last_votes or timestamp > last_votes[key]:
+                last_votes[key] = timestamp
+
+        new_votes: List[Self] = []
+        for vote in sorted(votes, key=lambda vote: vote.timestamp):
+            key = (vote.site, vote.user_id)
+            last_vote = last_votes.get(key)
+            if last_vote is not None and abs(vote.timestamp - last_vote) < VOTE_WINDOW:
+                continue
+            last_votes[key] = vote.timestamp
+            new_votes.append(vote)
+
+        if new_votes:
+            await cls.bulk_create(new_votes)
+        return new_votes
+
+    @classmethod
+    async def voted_recently(cls, user_id: int, site: str, hours: int = 12) -> bool:
         delta = datetime.timedelta(hours=hours)
-        return await cls.filter(user_id=user_id, site=site, timestamp__gte=delta).exists()
+        if vote_index.loaded and delta <= VOTE_WINDOW:
+            return vote_index.voted(user_id, site, delta)
+        return await cls.filter(user_id=user_id, site=site, timestamp__gte=datetime.datetime.now(tz=datetime.timezone.utc) - delta).exists()
 
     class Meta:
         table = "Votes"
+        indexes = (("user_id", "site", "timestamp"),)
+
+
+class VoteIndex:
+    """Holds every vote from the last `VOTE_WINDOW` in memory, keyed by (user_id, site),
+    so checking whether a user voted doesn't need a query or a request to the vote site.
+
+    Kept up to date by `sync`, which only reads votes newer than the last one it saw. Votes are saved by the webserver,
+    a separate process, so a vote shows up here on the next sync."""
+
+    def __init__(self):
+        self._votes: Dict[Tuple[int, str], datetime.datetime] = {}
+        """The latest vote of each user on each site."""
+        self.last_id: int = 0
+        """The ID of the newest vote that's been read."""
+        self.loaded: bool = False
+        """Whether the votes have been loaded. Until they are, checks go to the database."""
+
+    def __len__(self) -> int:
+        return len(self._votes)
+
+    def _add(self, user_id: int, site: str, timestamp: datetime.datetime) -> None:
+        key = (user_id, site)
+        if key not in self._votes or timestamp > self._votes[key]:
+            self._votes[key] = timestamp
+
+    async def sync(self) -> int:
+        """Reads the votes saved since the last sync, or the last `VOTE_WINDOW` of votes the first time, and forgets ones older than that.
+
+        Returns:
+            int: How many votes were read.
+        """
+        if self.loaded:
+            query = Votes.filter(id__gt=self.last_id)
+        else:
+            query = Votes.filter(timestamp__gte=datetime.datetime.now(tz=datetime.timezone.utc) - VOTE_WINDOW)
+        rows = await query.order_by("id").values_list("id", "user_id", "site", "timestamp")
+        for id, user_id, site, timestamp in rows:
+            self._add(user_id, site, timestamp)
+            self.last_id = max(self.last_id, id)
+
+        cutoff = datetime.datetime.now(tz=datetime.timezone.utc) - VOTE_WINDOW
+        self._votes = {key: timestamp for key, timestamp in self._votes.items() if timestamp >= cutoff}
+        self.loaded = True
+        return len(rows)
+
+    def last_vote(self, user_id: int, site: str) -> Optional[datetime.datetime]:
+        """Gets when a user last voted on a site, if it was within `VOTE_WINDOW`."""
+        return self._votes.get((user_id, site))
+
+    def voted(self, user_id: int, site: Optional[str]=None, within: datetime.timedelta=VOTE_WINDOW) -> bool:
+        """Checks whether a user voted recently. `within` can't be more than `VOTE_WINDOW`.
+
+        Args:
+            user_id (int): The ID of the user.
+            site (Optional[str], optional): The site to check. If None, any site counts. Defaults to None.
+            within (datetime.timedelta, optional): How recently they had to vote. Defaults to VOTE_WINDOW.
+        """
+        since = datetime.datetime.now(tz=datetime.timezone.utc) - within
+        if site is not None:
+            timestamp = self._votes.get((user_id, site))
+            return timestamp is not None and timestamp >= since
+        return any(uid == user_id and timestamp >= since for (uid, _), timestamp in self._votes.items())
+
+
+vote_index = VoteIndex()
 
 class WebhookAuthorization(Base):
     site = fields.CharField(max_length=100)
@@ -1485,7 +2363,13 @@ class Commands(Base):
     transaction_id = fields.UUIDField(null=True)
 
     @classmethod
-    async def bulk_insert(cls, bulk_data: list[dict]):
+    async def bulk_insert(cls, bulk_data: list[dict], batch_size: int = 1000):
+        """Inserts many commands at once, using multi-row INSERTs of up to `batch_size` rows.
+
+        Args:
+            bulk_data (list[dict]): The commands to insert. `guild`, `channel` and `author` are accepted in place of their `_id` fields.
+            batch_size (int, optional): The maximum number of rows per INSERT. Defaults to 1000.
+        """
         # self._data_batch.append(
         #         {
         #             'guild': guild_id,
@@ -1503,23 +2387,105 @@ class Commands(Base):
         if not bulk_data:
             return
         
-        #models_list = []
+        models_list = []
 
         for data in bulk_data:
-            if data.get("guild",None):
-                data["guild_id"] = data.pop("guild")
-            if data.get("channel",None):
-                data["channel_id"] = data.pop("channel")
-            if data.get("author",None):
-                data["author_id"] = data.pop("author")
-            #models_list.append(cls(**data))
-            #data['uses'] = await cls.filter(guild_id=data.get("guild_id"), command=data.get("command")).count() + 1
-            await cls.create(**data)
-        #await cls.bulk_create(models_list, batch_size=1000)
+            data = dict(data) # don't change the caller's batch, it's kept if the insert fails
+            for key in ("guild", "channel", "author"):
+                if key in data:
+                    data[f"{key}_id"] = data.pop(key)
+            models_list.append(cls(**data))
+        # in one transaction, so a failed batch can be retried without inserting part of it twice
+        async with in_transaction() as conn:
+            await cls.bulk_create(models_list, batch_size=batch_size, using_db=conn)
+
+    @classmethod
+    async def prune(cls, before: datetime.datetime, batch_size: int = 10000) -> int:
+        """Deletes the commands used before a point in time. Their usage is kept in CommandRollups.
+
+        Args:
+            before (datetime.datetime): Commands used before this are deleted.
+            batch_size (int, optional): How many rows are deleted per query, so the table isn't locked for long. Defaults to 10000.
+
+        Returns:
+            int: How many commands were deleted.
+        """
+        conn = Tortoise.get_connection("default")
+        total = 0
+        while True:
+            deleted, _ = await conn.execute_query('DELETE FROM "Commands" WHERE id IN (SELECT id FROM "Commands" WHERE used < $1 LIMIT $2);', [before, batch_size])
+            total += deleted
+            if deleted < batch_size:
+                return total
         
     class Meta:
         table = "Commands"
 
+ROLLUP_GRANULARITIES = ("minute", "hour", "day")
+"""The periods command usage is rolled up into, smallest first."""
+
+class CommandRollups(Base):
+    """Command usage counted per minute, hour and day, so usage reports don't have to scan Commands."""
+    granularity = fields.CharField(max_length=6)
+    """One of ROLLUP_GRANULARITIES."""
+    bucket = fields.DatetimeField()
+    """The start of the minute, hour or day, in UTC."""
+    command = fields.CharField(max_length=100)
+    guild_id = fields.BigIntField(default=0)
+    """0 for private messages, NULL can't be part of the unique key."""
+    app_command = fields.BooleanField(default=False)
+    failed = fields.BooleanField(default=False)
+    uses = fields.BigIntField(default=0)
+
+    @staticmethod
+    def bucket_for(used: datetime.datetime, granularity: str) -> datetime.datetime:
+        """Gets the start of the minute, hour or day that a datetime is in, in UTC."""
+        used = used.astimezone(datetime.timezone.utc).replace(second=0, microsecond=0)
+        if granularity in ("hour", "day"):
+            used = used.replace(minute=0)
+        if granularity == "day":
+            used = used.replace(hour=0)
+        return used
+
+    @classmethod
+    async def record(cls, bulk_data: list[dict]) -> None:
+        """Adds commands to the rollups of every granularity, in one upsert.
+
+        Args:
+            bulk_data (list[dict]): The commands, in the same format as `Commands.bulk_insert`.
+        """
+        counts: Dict[Tuple[str, datetime.datetime, str, int, bool, bool], int] = {}
+        for data in bulk_data:
+            guild_id = data.get("guild_id", data.get("guild")) or 0
+            for granularity in ROLLUP_GRANULARITIES:
+                key = (granularity, cls.bucket_for(data["used"], granularity), data["command"], guild_id, bool(data.get("app_command")), bool(data.get("failed")))
+                counts[key] = counts.get(key, 0) + 1
+        if not counts:
+            return
+
+        columns = list(zip(*counts.keys()))
+        query = """INSERT INTO "CommandRollups" (granularity, bucket, command, guild_id, app_command, failed, uses, created_at, updated_at)
+                   SELECT x.*, now(), now()
+                   FROM unnest($1::text[], $2::timestamptz[], $3::text[], $4::bigint[], $5::boolean[], $6::boolean[], $7::bigint[]) AS x
+                   ON CONFLICT (granularity, bucket, command, guild_id, app_command, failed)
+                   DO UPDATE SET uses = "CommandRollups".uses + EXCLUDED.uses, updated_at = now();
+                """
+        conn = Tortoise.get_connection("default")
+        await conn.execute_query(query, [list(column) for column in columns] + [list(counts.values())])
+
+    @classmethod
+    async def prune(cls, granularity: str, before: datetime.datetime) -> int:
+        """Deletes the rollups of a granularity from before a point in time.
+
+        Returns:
+            int: How many rollups were deleted.
+        """
+        return await cls.filter(granularity=granularity, bucket__lt=before).delete()
+
+    class Meta:
+        table = "CommandRollups"
+        unique_together = ("granularity", "bucket", "command", "guild_id", "app_command", "failed")
+
 class Blacklist(Base):
     """Table relating blacklisted users and/or guilds."""
     offender_id = fields.BigIntField()
@@ -1533,14 +2499,15 @@ class Blacklist(Base):
     @classmethod
     async def add(cls, user: Union[discord.abc.User, discord.Guild], reason: Optional[str]=None) -> Self:
         instance, _ = await cls.update_or_create(
+            offender_id=user.id,
+            type='user' if isinstance(user, discord.abc.User) else 'guild',
             defaults={
-                'offender_id': user.id,
                 'offender_name': user.name,
-                'type': 'user' if isinstance(user, discord.abc.User) else 'guild',
                 'reason': reason,
                 'timestamp': datetime.datetime.now(),
             }
         )
+        blacklist_index.add(instance)
         return instance
 
     @classmethod
@@ -1548,19 +2515,53 @@ class Blacklist(Base):
         instance = await cls.filter(offender_id=id, type=type).first()
         if instance:
             await instance.delete()
-        return not instance
+        blacklist_index.remove(id, type)
+        return instance is not None
 
     @classmethod
     async def is_blacklisted(cls, id: int, type: str='user') -> bool:
-        return await cls.filter(offender_id=id, type=type).exists()
+        return await cls.blacklisted(id, type) is not None
 
     @classmethod
     async def blacklisted(cls, id: int, type: str='user') -> Optional[Self]:
+        if blacklist_index.loaded:
+            return blacklist_index.get(id, type) # type: ignore
         return await cls.filter(offender_id=id, type=type).first()
 
     class Meta:
         table = "Blacklist"
 
+class BlacklistIndex:
+    """Holds every blacklisted user and guild in memory, keyed by (type, offender_id), so checking one doesn't need a query.
+
+    Kept up to date by `Blacklist.add` and `Blacklist.remove`, and reconciled with the database by `load`."""
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, int], Blacklist] = {}
+        self.loaded: bool = False
+        """Whether the blacklist has been loaded. Until it is, lookups go to the database."""
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def load(self) -> None:
+        """Loads the blacklist from the database, replacing whatever is in memory."""
+        self._entries = {(entry.type, entry.offender_id): entry for entry in await Blacklist.all()}
+        self.loaded = True
+
+    def get(self, id: int, type: str='user') -> Optional[Blacklist]:
+        """Gets the blacklist entry for a user or guild, if it's blacklisted."""
+        return self._entries.get((type, id))
+
+    def add(self, entry: Blacklist) -> None:
+        self._entries[(entry.type, entry.offender_id)] = entry
+
+    def remove(self, id: int, type: str='user') -> None:
+        self._entries.pop((type, id), None)
+
+
+blacklist_index = BlacklistIndex()
+
 class ReportedErrors(Base):
     """Errors Reported to my private forum via that menu thing."""
 
@@ -1802,8 +2803,7 @@ class Alerts(Base):
     
     @classmethod
     async def unviewed_alerts(cls, user_id: int) -> List[Self]:
-        alerts_viewed = [x.alert for x in await AlertViewings.filter(user_id=user_id).prefetch_related('alert')]
-        return [x for x in await cls.active_alerts() if x not in alerts_viewed]
+        return await alert_state.unviewed(user_id) # type: ignore
 
     async def has_viewed_alert(self, user_id: int) -> int:
         """Returns number of unviewed alerts."""
@@ -1811,7 +2811,7 @@ class Alerts(Base):
 
     async def viewed_alert(self, user_id: int):
         """Method to mark alert as viewed by a user."""
-        return await AlertViewings.viewed_alert(user_id, self)
+        return await AlertViewings.viewed_alerts(user_id, [self])
 
     class Meta:
         table = "Alerts"
@@ -1828,11 +2828,67 @@ class AlertViewings(Base):
 
     @classmethod
     async def viewed_alert(cls, user_id: int, alert: Alerts):
-        await cls.create(user_id=user_id, alert=alert)
+        await cls.viewed_alerts(user_id, [alert])
+
+    @classmethod
+    async def viewed_alerts(cls, user_id: int, alerts: List[Alerts]):
+        """Marks alerts as viewed by a user, in one INSERT."""
+        if not alerts:
+            return
+        await cls.bulk_create([cls(user_id=user_id, alert=alert) for alert in alerts])
+        alert_state.viewed(user_id, alerts)
 
     class Meta:
         table = "AlertViewings"
 
+ALERT_STATE_ACTIVE_TTL = 300.0
+"""How long, in seconds, the active alerts are cached. Creating an alert through the bot refreshes them straight away."""
+ALERT_STATE_USER_TTL = 3600.0
+"""How long, in seconds, the alerts a user has viewed are cached."""
+ALERT_STATE_MAXSIZE = 10000
+"""How many users' viewed alerts are cached at once."""
+
+class AlertState:
+    """Caches the active alerts and which of them each user has viewed,
+    so checking for new alerts after every command doesn't need a query."""
+
+    def __init__(self):
+        self._active: Optional[List[Alerts]] = None
+        self._active_loaded_at: float = 0.0
+        self._viewed: TTLCache[int, Set[int]] = TTLCache(ttl=ALERT_STATE_USER_TTL, maxsize=ALERT_STATE_MAXSIZE)
+        """The IDs of the active alerts each user has viewed."""
+
+    def invalidate(self) -> None:
+        """Reloads the active alerts the next time they're needed. Call this when alerts are created or deactivated."""
+        self._active = None
+
+    async def active(self) -> List[Alerts]:
+        if self._active is None or time.monotonic() - self._active_loaded_at > ALERT_STATE_ACTIVE_TTL:
+            self._active = await Alerts.filter(is_active=True).order_by("id")
+            self._active_loaded_at = time.monotonic()
+        return self._active
+
+    async def unviewed(self, user_id: int) -> List[Alerts]:
+        """Gets the active alerts a user hasn't viewed yet."""
+        active = await self.active()
+        if not active:
+            return []
+
+        async def fetch_viewed() -> Set[int]:
+            return set(await AlertViewings.filter(user_id=user_id, alert_id__in=[alert.id for alert in active]).values_list("alert_id", flat=True))
+
+        viewed = await self._viewed.get_or_fetch(user_id, fetch_viewed)
+        return [alert for alert in active if alert.id not in viewed]
+
+    def viewed(self, user_id: int, alerts: List[Alerts]) -> None:
+        """Records that a user has viewed alerts."""
+        viewed = self._viewed.get(user_id)
+        if viewed is not None: # otherwise it's loaded with these the next time it's needed
+            viewed.update(alert.id for alert in alerts)
+
+
+alert_state = AlertState()
+
 
 async def setup(*args):
     env = environ.Env(
@@ -1845,4 +2901,6 @@ async def setup(*args):
     else:
         await Tortoise.init(config_file="db_beta.yml")
     await Tortoise.generate_schemas()
+    await blacklist_index.load()
+    await vote_index.sync()
 
@@ -1,18 +1,18 @@
 from __future__ import annotations
 import asyncio
+from collections import deque
 import datetime
 from datetime import timezone
 from enum import Enum
+import heapq
 import json
 import logging
 import re
 import time
-import traceback
-from typing import ClassVar, Dict, List, Literal, Optional, Tuple, Union
+from typing import Any, Awaitable, Callable, ClassVar, Deque, Dict, List, Literal, Optional, Set, Tuple, Union
 from urllib import parse
 
 import aiohttp
-import async_lru
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
@@ -31,11 +31,13 @@ import yaml
 
 from cogs.models import (
     AuthStorage,
-    CommandInvocation,
     R6User,
     R6UserConnections,
     RankedStats,
     Settings,
+    leaderboard_store,
+    recent_lookups,
+    username_registry,
 )
 from exceptions import FailedToConnect, InvalidRequest
 from utils import (
@@ -48,7 +50,10 @@ from utils import (
     CustomBaseView,
     FiveButtonPaginator,
     PROXY_URL,
+    SingleFlight,
+    TTLCache,
     TOURNEY_SERVER,
+    TokenBucket,
     URLButton,
     USERNAME_CHANNEL,
     create_paginator,
@@ -56,7 +61,6 @@ from utils import (
     dctimestamp,
     emojidict,
     generate_pages,
-    generic_autocomplete,
     handler,
     makeembed,
     makeembed_bot,
@@ -87,6 +91,38 @@ STEAM_API_KEY = None
 #API_BASE = 'http://localhost:4000'
 API_BASE = 'https://public-ubiservices.ubi.com/v3'
 
+AUTH_REQUESTS_PER_SECOND = 2.0
+"""How many requests a second each Ubisoft account is allowed to make."""
+AUTH_REQUEST_BURST = 10
+"""How many requests each Ubisoft account can make at once before being limited to AUTH_REQUESTS_PER_SECOND."""
+ENDPOINT_REQUESTS_PER_SECOND = 1.0
+"""How many requests a second each Ubisoft account is allowed to make to a single endpoint."""
+ENDPOINT_REQUEST_BURST = 5
+"""How many requests each Ubisoft account can make to a single endpoint at once."""
+RATELIMIT_DEFAULT_RETRY_AFTER = 15.0
+"""How long to back off for when Ubisoft ratelimits us without sending a Retry-After header."""
+RATELIMIT_MAX_RETRIES = 3
+"""How many times a ratelimited request is retried before giving up."""
+
+PLAYER_CACHE_TTL = datetime.timedelta(hours=12).total_seconds()
+"""How long a player is cached for. Matches how often `/lookup` refreshes a player."""
+PLAYER_CACHE_MAXSIZE = 5000
+"""How many players are cached at once."""
+PLAYER_CACHE_NEGATIVE_TTL = 60.0
+"""How long a player that couldn't be found is cached for."""
+USERNAME_SNAPSHOT_INTERVAL = 30
+"""How often, in minutes, the username registry is saved to disk."""
+USERNAME_RECONCILE_INTERVAL = 6
+"""How often, in hours, the username registry is checked against every connection."""
+STATUS_POLL_INTERVAL = 60
+"""How often, in seconds, the upstreams `/status` reports on are probed."""
+STATUS_PROBE_TIMEOUT = 10.0
+"""How long, in seconds, a probe can take before the upstream is counted as timed out."""
+STATUS_DEGRADED_LATENCY = 3.0
+"""How long, in seconds, an upstream can take to respond before it is counted as degraded."""
+STATUS_HISTORY_SIZE = 60
+"""How many polls are kept in the status history."""
+
 VALID_ROUTES = [
     '/status',
     
@@ -871,6 +907,253 @@ class PlatformConverter(commands.Converter, app_commands.Transformer):
     async def transform(self, interaction, value):
         return await self.convert(await ContextU.from_interaction(interaction), value)
 
+class AuthScheduler:
+    """Spreads Ubisoft API requests over the Auth pool.
+
+    Every account gets a token bucket, and so does every endpoint on every account.
+    Requests wait for a token from both before being sent, so when every account is exhausted they queue up instead of failing.
+    A 429 blocks every account until its Retry-After has passed, since Ubisoft's limits aren't only per account.
+    """
+
+    def __init__(
+            self,
+            rate: float = AUTH_REQUESTS_PER_SECOND,
+            burst: float = AUTH_REQUEST_BURST,
+            endpoint_rate: float = ENDPOINT_REQUESTS_PER_SECOND,
+            endpoint_burst: float = ENDPOINT_REQUEST_BURST,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.endpoint_rate = endpoint_rate
+        self.endpoint_burst = endpoint_burst
+
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._endpoint_buckets: Dict[Tuple[int, str], TokenBucket] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._waiting: Dict[int, int] = {}
+        self._retry_after_until: float = 0.0
+
+    @staticmethod
+    def endpoint_for(url: str) -> str:
+        """Gets the endpoint a URL is for, with any IDs in the path taken out.
+
+        Args:
+            url (str): The URL being requested.
+
+        Returns:
+            str: The endpoint.
+        """
+        segments = parse.urlparse(url).path.split('/')
+        return '/'.join(':id' if ID_RE.fullmatch(segment) or segment.isdigit() else segment for segment in segments)
+
+    def bucket(self, auth: Auth) -> TokenBucket:
+        if auth.instance_id not in self._buckets:
+            self._buckets[auth.instance_id] = TokenBucket(self.rate, self.burst)
+        return self._buckets[auth.instance_id]
+
+    def endpoint_bucket(self, auth: Auth, endpoint: str) -> TokenBucket:
+        key = (auth.instance_id, endpoint)
+        if key not in self._endpoint_buckets:
+            self._endpoint_buckets[key] = TokenBucket(self.endpoint_rate, self.endpoint_burst)
+        return self._endpoint_buckets[key]
+
+    @staticmethod
+    def is_healthy(auth: Auth) -> bool:
+        """Whether an account can currently log in."""
+        return auth._login_cooldown <= time.time()
+
+    def pick(self, auths: List[Auth]) -> Auth:
+        """Picks the least loaded healthy account.
+        If every account is exhausted, this is the one that will have a token soonest.
+
+        Args:
+            auths (List[Auth]): The accounts to pick from.
+
+        Returns:
+            Auth: The account to use.
+        """
+        healthy = [auth for auth in auths if self.is_healthy(auth)] or auths
+        return min(healthy, key=lambda auth: (
+            self._waiting.get(auth.instance_id, 0),
+            self.bucket(auth).time_until_available(),
+            -self.bucket(auth).tokens,
+        ))
+
+    async def acquire(self, auth: Auth, endpoint: str) -> None:
+        """Waits until an account is allowed to make a request to an endpoint, then takes a token for it.
+        Requests for the same account are let through in the order they came in.
+
+        Args:
+            auth (Auth): The account making the request.
+            endpoint (str): The endpoint being requested, from `endpoint_for`.
+        """
+        lock = self._locks.setdefault(auth.instance_id, asyncio.Lock())
+        self._waiting[auth.instance_id] = self._waiting.get(auth.instance_id, 0) + 1
+        try:
+            async with lock:
+                bucket = self.bucket(auth)
+                endpoint_bucket = self.endpoint_bucket(auth, endpoint)
+                while True:
+                    wait = max(
+                        self._retry_after_until - time.monotonic(),
+                        bucket.time_until_available(),
+                        endpoint_bucket.time_until_available(),
+                    )
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                bucket.try_acquire()
+                endpoint_bucket.try_acquire()
+        finally:
+            self._waiting[auth.instance_id] -= 1
+
+    def ratelimited(self, auth: Auth, endpoint: str, retry_after: float) -> None:
+        """Records a 429 from Ubisoft, holding back every request until `retry_after` has passed.
+
+        Args:
+            auth (Auth): The account that was ratelimited.
+            endpoint (str): The endpoint that was ratelimited.
+            retry_after (float): How long to wait, in seconds.
+        """
+        self._retry_after_until = max(self._retry_after_until, time.monotonic() + retry_after)
+        self.bucket(auth).block(retry_after)
+        self.endpoint_bucket(auth, endpoint).block(retry_after)
+
+auth_scheduler = AuthScheduler()
+"""Schedules the requests of every Auth object."""
+
+player_lookups: SingleFlight[Tuple, Any] = SingleFlight()
+"""Coalesces concurrent lookups of the same player, keyed by (platform, uid or name, endpoint)."""
+
+def is_player_not_found(e: BaseException) -> bool:
+    """Whether a failed lookup means the player doesn't exist, rather than Ubisoft failing (ratelimits, 5xx, bad responses).
+    `Auth.get` raises `InvalidRequest` with the HTTP code, siegeapi raises its own when a search has no results."""
+    if isinstance(e, InvalidRequest):
+        return e.code == 404
+    return isinstance(e, InvalidRequest2)
+
+player_cache: TTLCache[Tuple[str, str], Player] = TTLCache(
+    ttl=PLAYER_CACHE_TTL,
+    maxsize=PLAYER_CACHE_MAXSIZE,
+    negative_ttl=PLAYER_CACHE_NEGATIVE_TTL,
+    negative_exceptions=(InvalidRequest, InvalidRequest2),
+    negative_predicate=is_player_not_found,
+)
+"""Caches players by (platform, uid or name)."""
+
+
+class UpstreamStatus:
+    """The result of probing one upstream."""
+
+    __slots__ = ('name', 'status', 'latency', 'checked_at')
+
+    def __init__(self, name: str, status: str, latency: Optional[float], checked_at: datetime.datetime):
+        self.name = name
+        self.status = status
+        self.latency = latency
+        """How long the probe took, in seconds. None if it never got a response."""
+        self.checked_at = checked_at
+
+    @property
+    def latency_ms(self) -> Optional[int]:
+        return round(self.latency * 1000) if self.latency is not None else None
+
+
+class StatusPoller:
+    """Probes every upstream `/status` reports on at once and keeps the results in memory.
+
+    `/status` is served from the last poll, so a flood of invocations during an outage doesn't reach the upstreams.
+    A short history of polls is kept as well, so it can be seen how long an upstream has been down or slow for.
+    """
+
+    def __init__(self, history_size: int = STATUS_HISTORY_SIZE):
+        self.latest: Dict[str, UpstreamStatus] = {}
+        self.history: Deque[Dict[str, UpstreamStatus]] = deque(maxlen=history_size)
+        self.last_polled: Optional[datetime.datetime] = None
+
+    @staticmethod
+    def _classify(response: aiohttp.ClientResponse, latency: float) -> str:
+        if response.status in range(200,300):
+            return "Degraded" if latency > STATUS_DEGRADED_LATENCY else "Online"
+        elif response.status in range(400,500):
+            return "Client Error"
+        elif response.status in range(500,600):
+            return "Server Error"
+        return "Unknown"
+
+    async def probe_game_status(self, session: aiohttp.ClientSession) -> List[UpstreamStatus]:
+        """Probes Ubisoft's game status API, which reports on every platform at once."""
+        start = time.monotonic()
+        now = discord.utils.utcnow()
+        try:
+            async with session.get(
+                f"https://game-status-api.ubisoft.com/v1/instances?appIds={','.join(R6_GAME_APPIDS)}",
+                timeout=aiohttp.ClientTimeout(total=STATUS_PROBE_TIMEOUT),
+            ) as resp:
+                latency = time.monotonic() - start
+                if resp.status not in range(200,300):
+                    return [UpstreamStatus("Ubisoft", self._classify(resp, latency), latency, now)]
+                data = await resp.json()
+        except asyncio.TimeoutError:
+            return [UpstreamStatus("Ubisoft", "Timed Out", None, now)]
+        except Exception as e:
+            logger.debug(f"Failed to probe the game status API: {e}")
+            return [UpstreamStatus("Ubisoft", "Unreachable", None, now)]
+
+        statuses = []
+        for app in data:
+            platform = app['Platform'].title()
+            if platform == "Xboxone":
+                platform = "Xbox One"
+            statuses.append(UpstreamStatus(platform, app.get('Status') or "Unknown", latency, now))
+        return statuses
+
+    async def probe_url(self, session: aiohttp.ClientSession, name: str, url: str) -> List[UpstreamStatus]:
+        """Probes a website, counting it as degraded if it's slow to respond."""
+        start = time.monotonic()
+        now = discord.utils.utcnow()
+        try:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=STATUS_PROBE_TIMEOUT)) as resp:
+                latency = time.monotonic() - start
+                return [UpstreamStatus(name, self._classify(resp, latency), latency, now)]
+        except asyncio.TimeoutError:
+            return [UpstreamStatus(name, "Timed Out", None, now)]
+        except Exception as e:
+            logger.debug(f"Failed to probe {name}: {e}")
+            return [UpstreamStatus(name, "Unreachable", None, now)]
+
+    async def poll(self, session: aiohttp.ClientSession) -> Dict[str, UpstreamStatus]:
+        """Probes every upstream concurrently and records the results.
+
+        Args:
+            session (aiohttp.ClientSession): The session to probe with.
+
+        Returns:
+            Dict[str, UpstreamStatus]: The status of every upstream, by name.
+        """
+        results = await asyncio.gather(
+            self.probe_game_status(session),
+            self.probe_url(session, "R6 Tracker", "https://r6.tracker.network/"),
+        )
+        statuses = {status.name: status for result in results for status in result}
+        self.latest = statuses
+        self.history.append(statuses)
+        self.last_polled = discord.utils.utcnow()
+        return statuses
+
+    def downtime(self, name: str) -> int:
+        """Gets how many polls in a row, up to the latest, an upstream hasn't been online for."""
+        count = 0
+        for statuses in reversed(self.history):
+            status = statuses.get(name)
+            if status is None or status.status == "Online":
+                break
+            count += 1
+        return count
+
+status_poller = StatusPoller()
+"""Keeps the status of the upstreams, see `ApiCog.poll_status`."""
+
 class Auth(siegeapi.Auth):
     """ Holds the authentication information """
     auth_info: AuthStorage
@@ -1057,6 +1340,9 @@ class Auth(siegeapi.Auth):
         kwargs["headers"]["Connection"] = kwargs["headers"].get("Connection", "keep-alive")
         kwargs["headers"]["Expiration"] = kwargs["headers"].get("Expiration", self.auth_info.expiration.isoformat())
 
+        endpoint = auth_scheduler.endpoint_for(args[0])
+        await auth_scheduler.acquire(self, endpoint)
+
         session = await self.get_session()
         resp = await session.get(*args, **kwargs)
 
@@ -1088,9 +1374,15 @@ class Auth(siegeapi.Auth):
                     if data["httpCode"] == 404:
                         msg = f"Missing resource {data.get('resource', args[0])}"
                     if data["httpCode"] == 429:
+                        try:
+                            retry_after = float(resp.headers.get("Retry-After", RATELIMIT_DEFAULT_RETRY_AFTER))
+                        except ValueError:
+                            retry_after = RATELIMIT_DEFAULT_RETRY_AFTER
+                        auth_scheduler.ratelimited(self, endpoint, retry_after)
+                        if retries < RATELIMIT_MAX_RETRIES:
+                            # the scheduler holds this back until the ratelimit is over
+                            return await self.get(*args, retries=retries + 1, json_=json_, new=new, **kwargs)
                         msg = f"We are being ratelimited: {data.get('message', '')}"
-                        await asyncio.sleep(int(resp.headers.get("Retry-After")))
-                        await self.get(*args, retries=retries + 1, json_=json_, new=new, **kwargs)
 
                     raise InvalidRequest(f"HTTP {data['httpCode']}: {msg}", code=data["httpCode"])
 
@@ -1106,65 +1398,32 @@ class Auth(siegeapi.Auth):
         raise InvalidRequest("Received a text response, expected JSON response.")
 
 
-usernames: List[Tuple[str, Platform]] = []
-
-async def generate_usernames():
-    global usernames
-    for username, platform in await R6UserConnections.filter(is_third_party=False).values_list('name', 'platform'):
-        if platform not in [x.route for x in Platform]: continue
-        usernames.append((f"{username} ({Platform.from_str(platform).proper_name})", username))
-
 async def username_autocomplete(interaction: discord.Interaction, current: str) -> List[app_commands.Choice]:
     """Autocompletes a username based on the current input."""
-    global usernames
-
-    if not usernames:
-        await generate_usernames()
+    if not username_registry.loaded:
+        await username_registry.load()
 
     # if not is_username(current):
     #     return []
-    returnv2 = []
-    returnv3 = []
-
     current = current.strip()
 
     if not current:
-        for invocation in await CommandInvocation.filter(user_id=interaction.user.id, command=interaction.command.qualified_name, completed=True).order_by('-created_at'):
-            name = invocation.kwargs.get('username',None)
-            if name:
-                name = name.replace('"','').replace("'",'').strip()
-                if name.lower() not in returnv3:
-                    platform = Platform.from_str(invocation.kwargs.get('platform',None))
-                    returnv3.append(name.lower())
-                    returnv2.append(app_commands.Choice(name=f"{name} ({platform.proper_name})", value=name))
-            if len(returnv2) >= 25:
-                break
-
+        # the players the user looked up last
+        returnv = []
+        for name, platform in await recent_lookups.get(interaction.user.id, interaction.command.qualified_name):
+            try:
+                returnv.append(app_commands.Choice(name=f"{name} ({Platform.from_str(platform).proper_name})", value=name))
+            except ValueError:
+                continue
+        return returnv
 
-    returnv = await generic_autocomplete(current, usernames, interaction, cutoff=.2)
-
-    if returnv and returnv2:
-        seen_usernames = []
-        returnv3 = []
-        for list_ in [returnv2, returnv]: 
-            for x in list_:
-                if x.name not in seen_usernames:
-                    seen_usernames.append(x.name)
-                    returnv3.append(x)
-                if len(returnv3) >= 25:
-                    break
-            if len(returnv3) >= 25:
-                    break
-        returnv = returnv3
-        #returnv = returnv2 + returnv
-        #returnv = returnv[:25]
-    elif not returnv and returnv2:
-        returnv2 = returnv = None
-        
-    #elif returnv and not returnv2: pass
+    returnv = [
+        app_commands.Choice(name=f"{name} ({Platform.from_str(platform).proper_name})", value=name)
+        for name, platform in username_registry.search(current, limit=24, cutoff=.2)
+    ]
 
     if not returnv:
-        return [app_commands.Choice(name=current, value=current)]
+        return [app_commands.Choice(name=current, value=current)] if current else []
     return returnv
 
     #return await interaction.response.send_message("Please enter a valid username.", ephemeral=True)
@@ -1239,14 +1498,75 @@ class RefreshButton(discord.ui.DynamicItem[discord.ui.Button], template=refresh_
 
         await interaction.followup.edit_message(message_id=msg.id, embed=embed, view=view)
 
+
+LEADERBOARD_PAGE_SIZE = 14
+"""The number of players shown on each page of the global leaderboard."""
+
+LEADERBOARD_MEMBER_CHUNK_SIZE = 5000
+"""The number of member IDs sent in each server leaderboard query, asyncpg allows at most 32767 parameters."""
+
+LEADERBOARD_COLUMN_PREFIXES: Dict[str, str] = {
+    'ranked': 'ranked',
+    'casual': 'casual',
+    'warmup': 'warmup',
+    'unranked': 'standard',
+}
+"""Maps a leaderboard type to the prefix of its columns on the RankedStats table."""
+
+LEADERBOARD_FILTERS: Dict[str, Dict[str, str]] = {
+    'ranked': {
+        'current mmr': 'rank_points',
+        'current rank points': 'rank_points',
+        'current rank': 'rank_points',
+        'peak mmr': 'max_rank_points',
+        'peak rank points': 'max_rank_points',
+        'peak rank': 'max_rank_points',
+        'wins': 'wins',
+        'losses': 'losses',
+        'kills': 'kills',
+        'deaths': 'deaths',
+        'abandons': 'abandons',
+    },
+    'casual': {'wins': 'wins', 'losses': 'losses', 'kills': 'kills', 'deaths': 'deaths'},
+    'warmup': {'wins': 'wins', 'losses': 'losses', 'kills': 'kills', 'deaths': 'deaths'},
+    'unranked': {'wins': 'wins', 'losses': 'losses', 'kills': 'kills', 'deaths': 'deaths'},
+}
+"""The filters that are valid for each leaderboard type, mapped to the stat they sort by."""
+
+LEADERBOARD_STAT_NAMES: Dict[str, Tuple[str, str, str]] = {
+    'rank_points': ('Current MMR', 'MMR', ''),
+    'max_rank_points': ('Peak MMR', 'MMR', ''),
+    'wins': ('Wins', 'win', 's'),
+    'losses': ('Losses', 'loss', 'es'),
+    'kills': ('Kills', 'kill', 's'),
+    'deaths': ('Deaths', 'death', 's'),
+    'abandons': ('Abandons', 'abandon', 's'),
+}
+"""Maps a stat to its title, unit and plural suffix."""
+
+
+class LeaderboardPaginator(FiveButtonPaginator):
+    """A paginator that only loads the page that is currently being viewed.
+
+    The pages passed to this paginator should be the page numbers, the embed for each page
+    is built by `page_loader` the first time it is viewed."""
+
+    def __init__(self, *args, page_loader: Callable[[int], Awaitable[discord.Embed]], **kwargs):
+        self.page_loader = page_loader
+        self._loaded_pages: Dict[int, discord.Embed] = {}
+        super().__init__(*args, **kwargs)
+
+    async def format_page(self, page: int) -> discord.Embed: # type: ignore
+        if page not in self._loaded_pages:
+            self._loaded_pages[page] = await self.page_loader(page)
+        return super().format_page(self._loaded_pages[page])
+
+
 class ApiCog(CogU, name='R6 Commands'):
     bot: BotU
     #auth: Auth
     auths: List[Auth]
 
-    current_auth_index: int = 0
-    """The current index of the auth object in the auths list to use for requests."""
-
     def __init__(self, bot: BotU, auth: Optional[Auth]=None, auths: Optional[List[Auth]]=None):
         self.bot = bot
         if auth:
@@ -1255,7 +1575,16 @@ class ApiCog(CogU, name='R6 Commands'):
             self.auths = auths
         else:
             raise ValueError("No auth object(s) provided.")
+
+        self._missing_connections: asyncio.Queue[Tuple[str, Platform]] = asyncio.Queue()
+        self._pending_connections: Set[Tuple[str, Platform]] = set()
+        """Players that are queued to have their platform connection fetched, so they aren't queued twice."""
+
         self.reauth_session.start()
+        self.resolve_missing_connections.start()
+        self.save_username_snapshot.start()
+        self.reconcile_usernames.start()
+        self.poll_status.start()
 
         self.bot.tree.add_command(app_commands.ContextMenu(
             name='Get Ranked Stats (Xbox)',
@@ -1290,19 +1619,13 @@ class ApiCog(CogU, name='R6 Commands'):
 
     @property
     def auth(self) -> Auth:
-        """Get the current auth object to use for requests."""
-
-        auth = self.auths[self.current_auth_index]
-        if self.current_auth_index + 1 >= len(self.auths):
-            self.current_auth_index = 0
-        else:
-            self.current_auth_index += 1
-        return auth
+        """Get the auth object to use for requests. This is the least loaded one, see `AuthScheduler.pick`."""
+        return auth_scheduler.pick(self.auths)
 
     async def get_r6_user(self, name: Optional[str]=None, uid: Optional[str]=None, platform: Platform=Platform.UBI, fetch: bool=False, *args, **kwargs):
         """Get a Rainbow Six Siege user's information.
-        Uses an LRU cache to store the user's information.
-        This can be bypassed by passing True for the fetch kwarg.
+        Uses a TTL cache to store the user's information.
+        This can be bypassed by passing True for the fetch kwarg, which also refreshes the cached user.
 
         Args:
             name (Optional[str]): The username of the user.
@@ -1312,18 +1635,21 @@ class ApiCog(CogU, name='R6 Commands'):
         Returns:
             Optional[dict]: The user's information.
         """
+        if name:
+            username_registry.bump(name, platform.legacy_route)
         if fetch:
-            return await self.fetch_r6_user(name=name, uid=uid, platform=platform, *args, **kwargs)
+            key = (platform.route, uid or (name or '').lower())
+            player_cache.invalidate(key)
+            return await player_cache.get_or_fetch(key, lambda: self.fetch_r6_user(name=name, uid=uid, platform=platform, *args, **kwargs))
         else:
             p = await self.get_maybe_cached_r6_user(name=name, uid=uid, platform=platform, *args, **kwargs)
             #if not p: p = await self.fetch_r6_user(name=name, uid=uid, platform=platform, *args, **kwargs)
             return p
 
-    @async_lru.alru_cache(maxsize=128)
     async def get_maybe_cached_r6_user(self, name: Optional[str]=None, uid: Optional[str]=None, platform: Platform=Platform.UBI, *args, **kwargs):
         """Get a Rainbow Six Siege user's information.
-        Uses an LRU cache to store the user's information.
-        Calls the fetch_r6_user method.
+        Uses a TTL cache to store the user's information.
+        Calls the fetch_r6_user method if the user isn't cached.
 
         Args:
             name (Optional[str]): The username of the user.
@@ -1333,7 +1659,8 @@ class ApiCog(CogU, name='R6 Commands'):
         Returns:
             Optional[dict]: The user's information.
         """
-        return await self.fetch_r6_user(name=name, uid=uid, platform=platform, *args, **kwargs)
+        key = (platform.route, uid or (name or '').lower())
+        return await player_cache.get_or_fetch(key, lambda: self.fetch_r6_user(name=name, uid=uid, platform=platform, *args, **kwargs))
     
     async def fetch_r6_user(self, name: Optional[str]=None, uid: Optional[str]=None, platform: Platform=Platform.UBI, *args, **kwargs):
         """Get a Rainbow Six Siege user's information.
@@ -1347,40 +1674,26 @@ class ApiCog(CogU, name='R6 Commands'):
         Returns:
             Optional[dict]: The user's information.
         """
-        logger.debug(f"Fetching user: {name if name else uid} ({platform.route})")
-        player = await self.auth.get_player(name=name, uid=uid, platform=platform.legacy_route) # type: ignore
-        await RankedStats.from_player(player)
-        return player
-
-    async def status(self) -> Optional[dict]:
-        r = await self._get_json_or_empty(f"https://game-status-api.ubisoft.com/v1/instances?appIds={','.join(R6_GAME_APPIDS)}")
-
-        rr = await self._get("https://r6.tracker.network/")
-
-        returnv = {}
-        for app in r:
-            app['Platform'] = app['Platform'].title()
-            if app['Platform'] == "Xboxone":
-                app['Platform'] = "Xbox One"
-            returnv[app['Platform']] = app.get('Status')
-        
-        if rr.status in range(200,300):
-            returnv['R6 Tracker'] = "Online"
-        elif rr.status in range(400,500):
-            returnv['R6 Tracker'] = "Client Error"
-        elif rr.status in range(500,600):
-            returnv['R6 Tracker'] = "Server Error"
-        else:
-            returnv['R6 Tracker'] = "Unknown"
-        return returnv
+        async def fetch() -> Player:
+            logger.debug(f"Fetching user: {name if name else uid} ({platform.route})")
+            player = await self.auth.get_player(name=name, uid=uid, platform=platform.legacy_route) # type: ignore
+            await RankedStats.from_player(player)
+            return player
+
+        return await player_lookups.do((platform.route, uid or (name or '').lower(), 'player'), fetch)
+
+    async def status(self) -> Dict[str, UpstreamStatus]:
+        """Gets the status of the upstreams from the last poll, polling now only if nothing has been polled yet."""
+        if not status_poller.latest:
+            return await status_poller.poll(self.bot.session)
+        return status_poller.latest
 
     async def xbox_get_user(self, username: str) -> Optional[dict]:
-        session = aiohttp.ClientSession()
         headers = {
             'x-authorization': XBOX_API_KEY,
         }
-        r = await session.get(f"https://xbl.io/api/v2/search/{parse.quote(username)}", headers=headers)
-        data = await r.json()
+        async with self.bot.session.get(f"https://xbl.io/api/v2/search/{parse.quote(username)}", headers=headers) as r:
+            data = await r.json()
         data = data.get('people')[0]
         return data
     
@@ -1408,9 +1721,8 @@ class ApiCog(CogU, name='R6 Commands'):
         return pfp_url
 
     async def steam_get_user(self, steamid: int) -> Optional[dict]:
-        session = aiohttp.ClientSession()
-        r = await session.get(f"https://api.steampowered.com/ISteamUser/GetPlayerSummaries/v2/?key={STEAM_API_KEY}&steamids={steamid}")
-        data = await r.json()
+        async with self.bot.session.get(f"https://api.steampowered.com/ISteamUser/GetPlayerSummaries/v2/?key={STEAM_API_KEY}&steamids={steamid}") as r:
+            data = await r.json()
         return data.get('response').get('players')[0]
 
     async def get_ubi_id(self, platformtype: Union[Platform, str], username: str, fetch: bool=False) -> Optional[str]:
@@ -1428,32 +1740,35 @@ class ApiCog(CogU, name='R6 Commands'):
 
         if not platform.username_re.match(username):
             raise ValueError("Invalid Username")
-        
-        connection = await R6UserConnections.filter(name=username, platform=platform.route).first()
-        player = None
-        #accounts = None
 
-        if fetch or not connection:
-            try:
-                player = await self.auth.get_player(name=username, platform=platform.legacy_route) # type: ignore
-            except (InvalidRequest, FailedToConnect, InvalidRequest2):
-                player = None
-            #accounts = await player.load_linked_accounts()
+        async def lookup() -> Optional[str]:
             connection = await R6UserConnections.filter(name=username, platform=platform.route).first()
+            player = None
+            #accounts = None
 
-        if not connection and not player:
-            raise ValueError("Failed to get user id. Doesn't exist")
-        # if accounts:
-        #     for account in accounts:
-        #         await R6UserConnections.create_from_api_obj(account)
-        
-        if connection:
-            return connection.userid
-        elif player:
-            return player.uid
-        #else:
-        #    return r['profiles'][0]['profileId']
-        return None
+            if fetch or not connection:
+                try:
+                    player = await self.auth.get_player(name=username, platform=platform.legacy_route) # type: ignore
+                except (InvalidRequest, FailedToConnect, InvalidRequest2):
+                    player = None
+                #accounts = await player.load_linked_accounts()
+                connection = await R6UserConnections.filter(name=username, platform=platform.route).first()
+
+            if not connection and not player:
+                raise ValueError("Failed to get user id. Doesn't exist")
+            # if accounts:
+            #     for account in accounts:
+            #         await R6UserConnections.create_from_api_obj(account)
+            
+            if connection:
+                return connection.userid
+            elif player:
+                return player.uid
+            #else:
+            #    return r['profiles'][0]['profileId']
+            return None
+
+        return await player_lookups.do((platform.route, username.lower(), 'ubi_id', fetch), lookup)
 
     async def get_id(self, platformtype: Union[Platform, str], username: str, fetch: bool=False) -> Optional[str]:
         """Get a user's id by their username.
@@ -1511,18 +1826,21 @@ class ApiCog(CogU, name='R6 Commands'):
         if not platform.id_re.match(id):
             raise ValueError("Invalid ID")
         
-        r = {}
-        connection = await R6UserConnections.filter(userid=id, platform=platform.route).first()
-        if fetch or not connection:
-            r = await self._get_json_or_empty(f"/users/{id}/profiles?platformType={parse.quote(platform.route)}")
-            if r:
-                await R6UserConnections.create_from_api_resp(r)
-            else:
-                return None
+        async def lookup() -> Optional[str]:
+            r = {}
             connection = await R6UserConnections.filter(userid=id, platform=platform.route).first()
-        if not connection and not r.get('profiles',[]):
-            raise ValueError("Failed to get user id. Doesn't exist?")
-        return connection.name if connection else r['profiles'][0]['nameOnPlatform']
+            if fetch or not connection:
+                r = await self._get_json_or_empty(f"/users/{id}/profiles?platformType={parse.quote(platform.route)}")
+                if r:
+                    await R6UserConnections.create_from_api_resp(r)
+                else:
+                    return None
+                connection = await R6UserConnections.filter(userid=id, platform=platform.route).first()
+            if not connection and not r.get('profiles',[]):
+                raise ValueError("Failed to get user id. Doesn't exist?")
+            return connection.name if connection else r['profiles'][0]['nameOnPlatform']
+
+        return await player_lookups.do((platform.route, id, 'username', fetch), lookup)
 
 
     async def get_id_or_reply(self, ctx: ContextU, id_or_username: str, platform: Platform, fetch: bool=False, ubi_id: bool=True):
@@ -1564,18 +1882,22 @@ class ApiCog(CogU, name='R6 Commands'):
             data = await self.status()
             if not data:
                 raise ValueError("Failed to load server status.")
-            embed = makeembed_bot(title="Rainbow Six Siege Server Status", color=discord.Color.blurple())
-            for key, value in data.items():
+            embed = makeembed_bot(title="Rainbow Six Siege Server Status", color=discord.Color.blurple(), timestamp=status_poller.last_polled)
+            for key, upstream in data.items():
+                value = upstream.status
                 emoji = ''
                 if value == "Online":
                     emoji = emojidict.get('green_circle')
                 elif value in ["Degraded", "Client Error"] :
                     emoji = emojidict.get('yellow_circle')
-                elif value in ["Maintenance","Offline","Server Error"]:
+                elif value in ["Maintenance","Offline","Server Error","Timed Out","Unreachable"]:
                     emoji = emojidict.get('red_circle')
                 else:
                     emoji = emojidict.get('blue_circle')
-                embed.add_field(name=key, value=f"{emoji+' ' if emoji else ''}{value}", inline=False)
+                latency = f" ({upstream.latency_ms}ms)" if upstream.latency_ms is not None else ''
+                polls_down = status_poller.downtime(key)
+                since = f" for {humanize.naturaldelta(polls_down * STATUS_POLL_INTERVAL)}" if polls_down > 1 else ''
+                embed.add_field(name=key, value=f"{emoji+' ' if emoji else ''}{value}{latency}{since}", inline=False)
             await ctx.reply(embed=embed)
         except Exception as e:
             return await ctx.send(f"Failed to load status: {e}")
@@ -2205,158 +2527,160 @@ class ApiCog(CogU, name='R6 Commands'):
         else:
             platform_ = platform
 
-        _filter_by = ''
+        if platform_ is Platform.ALL:
+            platform_ = None
+
+        if leaderboard_type not in LEADERBOARD_FILTERS:
+            return await ctx.reply(embed=makeembed_bot(title="Invalid Leaderboard Type", description=f"Leaderboard type `{leaderboard_type}` is invalid.",color=discord.Color.red()))
 
         filter_by: str = str(filter_by).lower().strip()
 
-        if ordering.lower().strip() == 'descending':
-            _direction = '-'
-        else:
-            _direction = ''
-
-        # if filter_by == 'mmr':
-        #     _filter_by = 'ranked_rank_points'
-        # elif filter_by == 'mmr' or filter_by == 'rank points':
-        #     _filter_by = 'ranked_rank_points'
-        # elif filter_by == 'rank' or filter_by == 'rank points':
-        #     _filter_by = 'ranked_rank'
-        if leaderboard_type == 'ranked':
-            if filter_by in ['current mmr', 'current rank points','current rank']:
-                _filter_by = 'ranked_rank_points'
-            elif filter_by in ['peak mmr', 'peak rank points', 'peak rank']:
-                _filter_by = 'ranked_max_rank_points'
-            elif filter_by == 'wins':
-                _filter_by = 'ranked_wins'
-            elif filter_by == 'losses':
-                _filter_by = 'ranked_losses'
-            elif filter_by == 'kills':
-                _filter_by = 'ranked_kills'
-            elif filter_by == 'deaths':
-                _filter_by = 'ranked_deaths'
-            elif filter_by == 'abandons':
-                _filter_by = 'ranked_abandons'
-            else:
-                return await ctx.reply(embed=makeembed_bot(title="Invalid Filter By", description=f"Filter by `{filter_by}` is invalid.",color=discord.Color.red()))
-        elif leaderboard_type == 'casual':
-            if filter_by == 'wins':
-                _filter_by = 'casual_wins'
-            elif filter_by == 'losses':
-                _filter_by = 'casual_losses'
-            elif filter_by == 'kills':
-                _filter_by = 'casual_kills'
-            elif filter_by == 'deaths':
-                _filter_by = 'casual_deaths'
-            else:
-                return await ctx.reply(embed=makeembed_bot(title="Invalid Filter By", description=f"Filter by `{filter_by}` is invalid.",color=discord.Color.red()))
-        elif leaderboard_type == 'warmup':
-            if filter_by == 'wins':
-                _filter_by = 'warmup_wins'
-            elif filter_by == 'losses':
-                _filter_by = 'warmup_losses'
-            elif filter_by == 'kills':
-                _filter_by = 'warmup_kills'
-            elif filter_by == 'deaths':
-                _filter_by = 'warmup_deaths'
-            else:
-                return await ctx.reply(embed=makeembed_bot(title="Invalid Filter By", description=f"Filter by `{filter_by}` is invalid.",color=discord.Color.red()))
-        elif leaderboard_type == 'unranked':
-            if filter_by == 'wins':
-                _filter_by = 'unranked_wins'
-            elif filter_by == 'losses':
-                _filter_by = 'unranked_losses'
-            elif filter_by == 'kills':
-                _filter_by = 'unranked_kills'
-            elif filter_by == 'deaths':
-                _filter_by = 'unranked_deaths'
-            else:
-                return await ctx.reply(embed=makeembed_bot(title="Invalid Filter By", description=f"Filter by `{filter_by}` is invalid.",color=discord.Color.red()))
-        else:
-            return await ctx.reply(embed=makeembed_bot(title="Invalid Leaderboard Type", description=f"Leaderboard type `{leaderboard_type}` is invalid.",color=discord.Color.red()))
-        
-        # if _filter_by == 'ranked_losses' and ordering.lower().strip() == 'ascending':
-        #     _direction = '-'
-        #     ordering = 'Descending'
-        
-        ranked_stats = RankedStats.filter(season_number=CURRENT_SEASON)
-        if platform_ is not Platform.ALL:
-            ranked_stats = ranked_stats.filter(platform=platform_.route)
-        ranked_stats = await ranked_stats.order_by(f'{_direction}{_filter_by}','created_at','request_id').all().prefetch_related('user')
+        stat = LEADERBOARD_FILTERS[leaderboard_type].get(filter_by)
+        if not stat:
+            return await ctx.reply(embed=makeembed_bot(title="Invalid Filter By", description=f"Filter by `{filter_by}` is invalid.",color=discord.Color.red()))
+
+        _filter_by = f'{LEADERBOARD_COLUMN_PREFIXES[leaderboard_type]}_{stat}'
+
+        descending = ordering.lower().strip() == 'descending'
 
-        if not ranked_stats or len(ranked_stats) == 0:
+        hidden = await leaderboard_store.hidden_users()
+
+        total, first_page = await self.get_leaderboard_rows(leaderboard_type, stat, descending, platform_, hidden, offset=0, limit=LEADERBOARD_PAGE_SIZE)
+
+        if total == 0:
             if platform_:
                 return await ctx.reply(embed=makeembed_bot(title="No Data", description=f"No players on {platform_.proper_name} have been looked up.",color=discord.Color.red()))
             else:
                 return await ctx.reply(embed=makeembed_bot(title="No Data", description="No players have been looked up.",color=discord.Color.red()))
 
-        if not platform_:
-            users = []
-            ranked_stats2 = []
-            for stats in ranked_stats:
-                #await stats.fetch_related('user')
-                if stats.user not in users:
-                    users.append(stats.user)
-                    ranked_stats2.append(stats)
-            ranked_stats = ranked_stats2
-            
-        pages = []
+        title = f"{leaderboard_type.title()} Leaderboard"
+        if platform_:
+            title += f" for {platform_.proper_name}"
+        else:
+            title += " for All Platforms"
+        title += f" by {LEADERBOARD_STAT_NAMES[stat][0]}"
+        
+        if platform_:
+            color = platform_.color
+        else:
+            color = discord.Color.blurple()
 
-        tr = 0
-        for stats in ranked_stats:
-            # member = await self.bot.getorfetch_user(stats.user_id, None)
-            # if not member:
-            #     continue
+        url = get_r6_leaderboard_url(platform_, season=CURRENT_SEASON_NUM, gamemode=leaderboard_type)
 
-            #await stats.fetch_related('user')
-            if not stats.user: continue
+        cmd_mention = await self.get_command_mention(f'lookup {leaderboard_type}')
 
-            if stats.platform == 'uplay':
-                _platform = Platform.UPLAY
+        total_pages, left_over = divmod(total, LEADERBOARD_PAGE_SIZE)
+        if left_over:
+            total_pages += 1
+
+        async def load_page(page: int) -> discord.Embed:
+            if page == 0:
+                rows = first_page
             else:
-                _platform = Platform.from_route(stats.platform)
-            assert _platform is not None
+                _, rows = await self.get_leaderboard_rows(leaderboard_type, stat, descending, platform_, hidden, offset=page*LEADERBOARD_PAGE_SIZE, limit=LEADERBOARD_PAGE_SIZE)
 
-            if _filter_by in ['ranked_rank_points', 'ranked_max_rank_points']:
-                if stats.ranked_max_rank_points == 1000: # unranked
-                    continue
-            
-            elif _filter_by in [f'{leaderboard_type}_abandons', f'{leaderboard_type}_kills', f'{leaderboard_type}_deaths', f'{leaderboard_type}_wins', f'{leaderboard_type}_losses']:
-                if (getattr(stats, f'{leaderboard_type}_kills') == 0 and getattr(stats, f'{leaderboard_type}_deaths') == 0): # skip inactive accs this season
-                    continue
-            
-            tr += 1
-            
-            connections = R6UserConnections.filter(userid=stats.user.userid).order_by('is_third_party','created_at')
+            lines = await self.generate_leaderboard_lines(rows, page*LEADERBOARD_PAGE_SIZE, _filter_by, stat, show_platform=platform_ is None)
 
-            discord_connection = await connections.filter(platform='discord').first()
+            description = "".join(f"{line}\n" for line in lines)
+            description += f"\n> {emojidict.get('pencil')} The leaderboard shows everybody that has been looked up using the bot. If you see people missing on this leaderboard, look them up with {cmd_mention}."
 
-            preferred_platform = None
-            if discord_connection:
-                if user_settings := await Settings.filter(user_id=discord_connection.platform_id).first():
-                    if not user_settings.show_on_leaderboard:
-                        continue
-                    elif user_settings.preferred_platform != 'N/A':
-                        try:
-                            preferred_platform = Platform.from_str(user_settings.preferred_platform)
-                            assert preferred_platform is not None
-                        except Exception as e: pass                   
+            embed = makeembed_bot(title=title, description=description, color=color, url=url)
+            if total_pages > 1 and embed.footer.text:
+                embed.set_footer(text=f"{embed.footer.text} | Page {page+1}/{total_pages}")
+            return embed
 
-            if preferred_platform:
-                platform_connection = await connections.filter(platform=preferred_platform.route).first()
-            else:
-                platform_connection = await connections.filter(platform=_platform.route).first()
+        paginator = LeaderboardPaginator(range(total_pages), page_loader=load_page, author_id=ctx.author.id, go_to_button=True)
+        await paginator.start(ctx)
+        return paginator
 
-            #platform_connection = await connections.filter(platform=_platform.route).first()
+    async def get_leaderboard_rows(self, leaderboard_type: str, stat: str, descending: bool, platform: Optional[Platform], hidden: Set[int], offset: int, limit: int) -> Tuple[int, List[dict]]:
+        """Gets a single page of the global leaderboard.
 
-            #if not platform_connection: continue
-            if not platform_connection:
-                platform_connection = await self.fetch_platform_connection(stats, _platform)
+        The ranking is read from `leaderboard_store`, so only the rows on this page are loaded from the database.
 
-            assert platform_connection is not None
+        Args:
+            leaderboard_type (str): The type of leaderboard.
+            stat (str): The stat to sort by.
+            descending (bool): Whether the highest values are first.
+            platform (Optional[Platform]): The platform to show, or None for all platforms.
+            hidden (Set[int]): The R6User IDs of players that have turned off `show_on_leaderboard`.
+            offset (int): The number of players to skip.
+            limit (int): The maximum number of rows to return.
 
-            # if discord_connection:
-            #     member = f'<@{discord_connection.platform_id}>'
-            # else:
-            #     member = None
+        Returns:
+            Tuple[int, List[dict]]: The total number of players on the leaderboard, and the rows for this page.
+        """
+        index = await leaderboard_store.get_index(CURRENT_SEASON, LEADERBOARD_COLUMN_PREFIXES[leaderboard_type], stat, platform.route if platform else None, descending)
+        total, ids = index.page(offset, limit, hidden)
+        if not ids:
+            return total, []
+
+        rows = {
+            row['id']: row 
+            for row in await RankedStats.filter(id__in=ids).values(
+                'id', 'platform', 'request_id', 'ranked_rank', 'ranked_rank_points', index.column,
+                profile_userid='user__userid', profile_name='user__name',
+            )
+        }
+        return total, [rows[id] for id in ids if id in rows]
+
+    async def generate_leaderboard_lines(self, rows: List[dict], start: int, _filter_by: str, stat: str, show_platform: bool) -> List[str]:
+        """Generates the lines for one page of the global leaderboard.
+
+        The connections and settings for every player on the page are loaded at once.
+        Players without a connection on their platform are shown by their Ubisoft name,
+        and their connection is fetched in the background.
+
+        Args:
+            rows (List[dict]): The rows returned by `get_leaderboard_rows`.
+            start (int): The number of players on the previous pages.
+            _filter_by (str): The RankedStats column the leaderboard is sorted by.
+            stat (str): The stat the leaderboard is sorted by.
+            show_platform (bool): Whether to show the platform emoji of each player.
+
+        Returns:
+            List[str]: A line for each row.
+        """
+        userids = list({str(row['profile_userid']) for row in rows})
+
+        connections: Dict[str, Dict[str, dict]] = {}
+        for connection in await R6UserConnections.filter(userid__in=userids).order_by('is_third_party','created_at').values('userid', 'platform', 'platform_id', 'name'):
+            connections.setdefault(connection['userid'], {}).setdefault(connection['platform'], connection)
+
+        discord_ids: Dict[str, int] = {}
+        for userid, user_connections in connections.items():
+            discord_connection = user_connections.get('discord')
+            if discord_connection and str(discord_connection['platform_id']).isdigit():
+                discord_ids[userid] = int(discord_connection['platform_id'])
+
+        preferred_platforms: Dict[str, Platform] = {}
+        if discord_ids:
+            user_settings = dict(await Settings.filter(user_id__in=list(discord_ids.values())).exclude(preferred_platform='N/A').values_list('user_id', 'preferred_platform'))
+            for userid, discord_id in discord_ids.items():
+                if discord_id in user_settings:
+                    try:
+                        preferred_platforms[userid] = Platform.from_str(user_settings[discord_id])
+                    except Exception as e: pass
+
+        lines = []
+        for tr, stats in enumerate(rows, start=start+1):
+            if stats['platform'] == 'uplay':
+                _platform = Platform.UPLAY
+            else:
+                _platform = Platform.from_route(stats['platform'])
+            assert _platform is not None
+
+            userid = str(stats['profile_userid'])
+            user_connections = connections.get(userid, {})
+
+            connection_platform = preferred_platforms.get(userid, _platform)
+            platform_connection = user_connections.get(connection_platform.route) or user_connections.get(connection_platform.legacy_route)
+
+            if platform_connection:
+                name = platform_connection['name']
+            else:
+                self.queue_missing_connection(userid, connection_platform)
+                name = stats['profile_name'] or userid
             
             if tr in range(1,4):
                 emoji = emojidict.get(str(humanize.ordinal(tr)))
@@ -2367,103 +2691,37 @@ class ApiCog(CogU, name='R6 Commands'):
             
             desc = f"{emoji} "
             
-            if _filter_by in ['ranked_rank_points', 'ranked_max_rank_points']: # don't have to change this to be for gamemode, we don't show rank anyway for non ranked
-                rank = R6Rank.from_mmr(stats.ranked_rank_points)
+            if stat in ['rank_points', 'max_rank_points']: # don't have to change this to be for gamemode, we don't show rank anyway for non ranked
+                rank = R6Rank.from_mmr(stats['ranked_rank_points'] or 0)
 
                 desc += f"{rank.emoji} "
             
-            if not platform_:
+            if show_platform:
                 desc += f"{_platform.emoji} "
             
-            #desc += f"{platform_connection.name} "
-            #desc += dchyperlink(get_r6_tracker_url(platform_connection.name, _platform), platform_connection.name, f'View R6 Stats for {platform_connection.name}', suppress_embed=True) + " "
-            desc += dchyperlink(get_perma_r6_tracker_url(str(stats.request_id), _platform), platform_connection.name, f'View R6 Stats for {platform_connection.name}', suppress_embed=True) + " "
-            # if member:
-            #     desc += f" ({member}) "
-            
-            if leaderboard_type == 'ranked':
-                if _filter_by in ['ranked_rank_points', 'ranked_max_rank_points']:
-                    desc += f"(`{stats.ranked_rank}`, `{stats.ranked_rank_points}` MMR)"
-                
-                elif _filter_by == 'ranked_wins':
-                    desc += f"(`{stats.ranked_wins}` win{plural(stats.ranked_wins)})"
-                elif _filter_by == 'ranked_losses':
-                    desc += f"(`{stats.ranked_losses}` loss{plural(stats.ranked_losses,'es')})"
-                elif _filter_by == 'ranked_kills':
-                    desc += f"(`{stats.ranked_kills}` kill{plural(stats.ranked_kills)})"
-                elif _filter_by == 'ranked_deaths':
-                    desc += f"(`{stats.ranked_deaths}` death{plural(stats.ranked_deaths)})"
-                elif _filter_by == 'ranked_abandons':
-                    desc += f"(`{stats.ranked_abandons}` abandon{plural(stats.ranked_abandons)})"
-            elif leaderboard_type == 'casual':
-                if _filter_by == 'casual_wins':
-                    desc += f"(`{stats.casual_wins}` win{plural(stats.casual_wins)})"
-                elif _filter_by == 'casual_losses':
-                    desc += f"(`{stats.casual_losses}` loss{plural(stats.casual_losses,'es')})"
-                elif _filter_by == 'casual_kills':
-                    desc += f"(`{stats.casual_kills}` kill{plural(stats.casual_kills)})"
-                elif _filter_by == 'casual_deaths':
-                    desc += f"(`{stats.casual_deaths}` death{plural(stats.casual_deaths)}"
-            elif leaderboard_type == 'warmup':
-                if _filter_by == 'warmup_wins':
-                    desc += f"(`{stats.warmup_wins}` win{plural(stats.warmup_wins)})"
-                elif _filter_by == 'warmup_losses':
-                    desc += f"(`{stats.warmup_losses}` loss{plural(stats.warmup_losses,'es')})"
-                elif _filter_by == 'warmup_kills':
-                    desc += f"(`{stats.warmup_kills}` kill{plural(stats.warmup_kills)})"
-                elif _filter_by == 'warmup_deaths':
-                    desc += f"(`{stats.warmup_deaths}` death{plural(stats.warmup_deaths)}"
-            # elif leaderboard_type == 'unranked':
-            #     if _filter_by == 'unranked_wins':
-            #         desc += f"(`{stats.unranked_wins}` win{plural(stats.unranked_wins)})"
-            #     elif _filter_by == 'unranked_losses':
-            #         desc += f"(`{stats.unranked_losses}` loss{plural(stats.unranked_losses,'es')})"
-            #     elif _filter_by == 'unranked_kills':
-            #         desc += f"(`{stats.unranked_kills}` kill{plural(stats.unranked_kills)})"
-            #     elif _filter_by == 'unranked_deaths':
-            #         desc += f"(`{stats.unranked_deaths}` death{plural(stats.unranked_deaths)}"
+            desc += dchyperlink(get_perma_r6_tracker_url(str(stats['request_id']), _platform), name, f'View R6 Stats for {name}', suppress_embed=True) + " "
+
+            if stat in ['rank_points', 'max_rank_points']:
+                desc += f"(`{stats['ranked_rank']}`, `{stats['ranked_rank_points']}` MMR)"
             else:
-                desc += f"(`{stats.ranked_rank}`, `{stats.ranked_rank_points}` MMR)"
+                _, unit, suffix = LEADERBOARD_STAT_NAMES[stat]
+                value = stats[_filter_by] or 0
+                desc += f"(`{value}` {unit}{plural(value, suffix)})"
             
-            pages.append(desc)
-            #desc = f"{emoji} {rank.emoji}({' '+member if member else ''}) ({stats.ranked_rank}, `{stats.ranked_rank_points}` MMR)"
-            #desc += f"> {emoji}: `{user.username}` (`{user.lookup_count}` lookup{'s' if abs(user.lookup_count) != 1 else ''})\n"
-        title = f"{leaderboard_type.title()} Leaderboard"
-        if platform_:
-            title += f" for {platform_.proper_name}"
-        else:
-            title += " for All Platforms"
-        
-        if _filter_by == f'{leaderboard_type}_rank_points':
-            title += " by Current MMR"
-        elif _filter_by == f'{leaderboard_type}_max_rank_points':
-            title += " by Peak MMR"
-        elif _filter_by == f'{leaderboard_type}_wins':
-            title += " by Wins"
-        elif _filter_by == f'{leaderboard_type}_losses':
-            title += " by Losses"
-        elif _filter_by == f'{leaderboard_type}_kills':
-            title += " by Kills"
-        elif _filter_by == f'{leaderboard_type}_deaths':
-            title += " by Deaths"
-        elif _filter_by == f'{leaderboard_type}_abandons':
-            title += " by Abandons"
-        else:
-            title += " by Current MMR"
-        
-        if platform_:
-            color = platform_.color
-        else:
-            color = discord.Color.blurple()
+            lines.append(desc)
+        return lines
 
-        pages = generate_pages(pages, title=title, color=color, items_per_page=15-1, url=get_r6_leaderboard_url(platform_, season=CURRENT_SEASON_NUM, gamemode=leaderboard_type))
+    def queue_missing_connection(self, userid: str, platform: Platform) -> None:
+        """Queues a player to have their platform connection fetched by `resolve_missing_connections`.
 
-        cmd_mention = await self.get_command_mention(f'lookup {leaderboard_type}')
-
-        for emb in pages:
-            emb.description = f"{emb.description}\n> {emojidict.get('pencil')} The leaderboard shows everybody that has been looked up using the bot. If you see people missing on this leaderboard, look them up with {cmd_mention}."
-
-        return await create_paginator(ctx, pages, paginator=FiveButtonPaginator, author_id=ctx.author.id, go_to_button=True)
+        Args:
+            userid (str): The Ubisoft ID of the player.
+            platform (Platform): The platform of the connection that is missing.
+        """
+        if (userid, platform) in self._pending_connections:
+            return
+        self._pending_connections.add((userid, platform))
+        self._missing_connections.put_nowait((userid, platform))
 
     async def r6_leaderboard_server_cmd(self, ctx: ContextU, 
         platform: Optional[Platform],
@@ -2475,151 +2733,26 @@ class ApiCog(CogU, name='R6 Commands'):
 
         assert ctx.guild is not None
 
-        _filter_by = ''
-
-        filter_by: str = str(filter_by).lower().strip()
+        if platform is Platform.ALL:
+            platform = None
 
-        if ordering.lower().strip() == 'descending':
-            _direction = '-'
-        else:
-            _direction = ''
-
-        # if filter_by == 'mmr':
-        #     _filter_by = 'ranked_rank_points'
-        # elif filter_by == 'mmr' or filter_by == 'rank points':
-        #     _filter_by = 'ranked_rank_points'
-        # elif filter_by == 'rank' or filter_by == 'rank points':
-        #     _filter_by = 'ranked_rank'
-        if leaderboard_type == 'ranked':
-            if filter_by in ['current mmr', 'current rank points','current rank']:
-                _filter_by = 'ranked_rank_points'
-            elif filter_by in ['peak mmr', 'peak rank points', 'peak rank']:
-                _filter_by = 'ranked_max_rank_points'
-            elif filter_by == 'wins':
-                _filter_by = 'ranked_wins'
-            elif filter_by == 'losses':
-                _filter_by = 'ranked_losses'
-            elif filter_by == 'kills':
-                _filter_by = 'ranked_kills'
-            elif filter_by == 'deaths':
-                _filter_by = 'ranked_deaths'
-            elif filter_by == 'abandons':
-                _filter_by = 'ranked_abandons'
-            else:
-                return await ctx.reply(embed=makeembed_bot(title="Invalid Filter By", description=f"Filter by `{filter_by}` is invalid.",color=discord.Color.red()))
-        elif leaderboard_type == 'casual':
-            if filter_by == 'wins':
-                _filter_by = 'casual_wins'
-            elif filter_by == 'losses':
-                _filter_by = 'casual_losses'
-            elif filter_by == 'kills':
-                _filter_by = 'casual_kills'
-            elif filter_by == 'deaths':
-                _filter_by = 'casual_deaths'
-            else:
-                return await ctx.reply(embed=makeembed_bot(title="Invalid Filter By", description=f"Filter by `{filter_by}` is invalid.",color=discord.Color.red()))
-        elif leaderboard_type == 'warmup':
-            if filter_by == 'wins':
-                _filter_by = 'warmup_wins'
-            elif filter_by == 'losses':
-                _filter_by = 'warmup_losses'
-            elif filter_by == 'kills':
-                _filter_by = 'warmup_kills'
-            elif filter_by == 'deaths':
-                _filter_by = 'warmup_deaths'
-            else:
-                return await ctx.reply(embed=makeembed_bot(title="Invalid Filter By", description=f"Filter by `{filter_by}` is invalid.",color=discord.Color.red()))
-        elif leaderboard_type == 'unranked':
-            if filter_by == 'wins':
-                _filter_by = 'unranked_wins'
-            elif filter_by == 'losses':
-                _filter_by = 'unranked_losses'
-            elif filter_by == 'kills':
-                _filter_by = 'unranked_kills'
-            elif filter_by == 'deaths':
-                _filter_by = 'unranked_deaths'
-            else:
-                return await ctx.reply(embed=makeembed_bot(title="Invalid Filter By", description=f"Filter by `{filter_by}` is invalid.",color=discord.Color.red()))
-        else:
+        if leaderboard_type not in LEADERBOARD_FILTERS:
             return await ctx.reply(embed=makeembed_bot(title="Invalid Leaderboard Type", description=f"Leaderboard type `{leaderboard_type}` is invalid.",color=discord.Color.red()))
-        
-
-        member_count = ctx.guild.member_count if ctx.guild.member_count else ctx.guild.approximate_member_count
-        if not member_count:
-            return await ctx.reply("Error occured while fetching member count. Please try again later.")
-
-        if member_count > 100:
-            return await ctx.reply("This command is not available for servers with more than 100 members.")
-        
-        # if platform not in ['Any','All']:
-        #     platform_ = Platform.from_str(platform)
-        #     assert platform_ is not None
-        # else:
-        #     platform_ = None
-
-        members = [m for m in ctx.guild.members if not m.bot]
-        
-        #connections = await R6UserConnections.filter(platform='discord').all()
-
-        ranked_stats_dict: Dict[discord.Member, RankedStats] = {}
-        #for connection in connections:
-        for member in members:
-            #connection = discord.utils.find(lambda x: x.platform_id == member.id and x.platform == 'discord', connections)
-            connection = await R6UserConnections.filter(platform_id=member.id, platform='discord').first().prefetch_related('profile')
-            if connection:
-                #await connection.fetch_related('profile')
-                linked_acc = R6UserConnections.filter(profile=connection.profile)
-
-                user_settings = await Settings.filter(user_id=member.id).first()
-
-                if user_settings:
-                    if not user_settings.show_on_leaderboard:
-                        continue
-                    if user_settings.preferred_platform != "N/A":
-                        preferred_platform = Platform.from_str(user_settings.preferred_platform)
-                        assert preferred_platform is not None
-
-                        if platform and platform != preferred_platform:
-                            continue
 
-                        linked_acc = await linked_acc.filter(platform=preferred_platform.route).exists()
-                elif platform:
-                    linked_acc = await linked_acc.filter(platform=platform.route).exists()
-                else:
-                    linked_acc = await linked_acc.exists()
+        filter_by: str = str(filter_by).lower().strip()
 
-                if not linked_acc: # if the discord connection doesn't have a linked account on the platform
-                    continue
+        stat = LEADERBOARD_FILTERS[leaderboard_type].get(filter_by)
+        if not stat:
+            return await ctx.reply(embed=makeembed_bot(title="Invalid Filter By", description=f"Filter by `{filter_by}` is invalid.",color=discord.Color.red()))
 
-                user = await R6User.filter(userid=connection.profile.userid).first()
-                ranked_stats = RankedStats.filter(user=user, season_number=CURRENT_SEASON).order_by(f'{_direction}{_filter_by}', 'created_at', 'request_id').prefetch_related('user')
-                if platform:
-                    ranked_stats = await ranked_stats.filter(platform=platform.route).first()
-                else:
-                    ranked_stats = await ranked_stats.first()
+        _filter_by = f'{LEADERBOARD_COLUMN_PREFIXES[leaderboard_type]}_{stat}'
+        descending = ordering.lower().strip() == 'descending'
 
-                if not ranked_stats:
-                    continue
-                
-                if _filter_by in ['ranked_rank_points', 'ranked_max_rank_points']:
-                    if ranked_stats.ranked_max_rank_points == 1000: # unranked
-                        continue
-                
-                elif _filter_by in [f'{leaderboard_type}_abandons', f'{leaderboard_type}_kills', f'{leaderboard_type}_deaths', f'{leaderboard_type}_wins', f'{leaderboard_type}_losses']:
-                    if (getattr(ranked_stats, f'{leaderboard_type}_kills') == 0 and getattr(ranked_stats, f'{leaderboard_type}_deaths') == 0): # skip inactive accs this season
-                        continue
-                # if not ranked_stats:
-                #     player = await self.get_r6_user(uid=connection.profile.userid, platform=platform if platform else Platform.UPLAY)
-                #     #await player.load_ranked_v2()
-                #     ranked_stats = await RankedStats.from_player(player)
-                ranked_stats_dict[member] = ranked_stats
+        members = {m.id: m for m in ctx.guild.members if not m.bot}
 
-        # def key(x: Tuple[discord.Member, RankedStats]):
-        #     return getattr(x[1], f"{_filter_by}")
+        ranked_stats = await self.get_server_leaderboard_rows(list(members.keys()), leaderboard_type, stat, descending, platform)
 
-        ranked_stats_dict = dict(sorted(ranked_stats_dict.items(), key=lambda x: getattr(x[1], f"{_filter_by}"), reverse=True)) # type: ignore
-
-        if not ranked_stats_dict or len(ranked_stats_dict) == 0:
+        if not ranked_stats:
             link_cmd = await self.get_command_mention('link')
 
             proper_name = platform.proper_name if platform else 'All Platforms'
@@ -2632,25 +2765,16 @@ class ApiCog(CogU, name='R6 Commands'):
                 desc += f"> If you are on {proper_name}, you can link your Discord to your Ubisoft by running {link_cmd}."
 
             return await ctx.reply(embed=makeembed_bot(title="No Data", description=desc,color=discord.Color.red()))
-        
-        if not platform:
-            users = []
-            ranked_stats2 = {}
-            for member, stats in ranked_stats_dict.items():
-                #await stats.fetch_related('user')
-                if stats.user not in users:
-                    users.append(stats.user)
-                    #ranked_stats2.append(stats)
-                    ranked_stats2[member] = stats
-            ranked_stats = ranked_stats2
+
+        connections: Dict[Tuple[str, str], dict] = {}
+        for connection in await R6UserConnections.filter(userid__in=list({str(stats['profile_userid']) for stats in ranked_stats}), is_third_party=False).order_by('id').values('userid', 'platform', 'name'):
+            connections.setdefault((connection['userid'], connection['platform']), connection)
 
         pages = []
 
-        tr = 0
-        for member, stats in ranked_stats_dict.items():
-            # member = kv[0]
-            # stats = kv[1]
-            tr += 1
+        for tr, stats in enumerate(ranked_stats, start=1):
+            member = members.get(int(stats['discord_id']))
+            if not member: continue
 
             if tr in range(1,4):
                 emoji = emojidict.get(str(humanize.ordinal(tr)))
@@ -2658,81 +2782,40 @@ class ApiCog(CogU, name='R6 Commands'):
                 emoji = emojidict.get(str(tr))
             else:
                 emoji = f'`{tr}`'
-            
-            #await stats.fetch_related('user')
-
-            platform_connection = await R6UserConnections.filter(userid=stats.user.userid, platform=stats.platform).order_by('id').first()
-            if not platform_connection:
-                platform_connection = await self.fetch_platform_connection(stats, platform if platform else Platform.from_str(stats.platform))
-                if not platform_connection: continue
 
-            rank = R6Rank.from_mmr(stats.ranked_rank_points)
+            userid = str(stats['profile_userid'])
+            platform_connection = connections.get((userid, stats['platform']))
+            if platform_connection:
+                name = platform_connection['name']
+            else:
+                self.queue_missing_connection(userid, platform if platform else Platform.from_str(stats['platform']))
+                name = stats['profile_name'] or userid
 
             desc = f"{emoji} "
             
-            if _filter_by in ['ranked_rank_points', 'ranked_max_rank_points']:
+            if stat in ['rank_points', 'max_rank_points']:
+                rank = R6Rank.from_mmr(stats['ranked_rank_points'] or 0)
                 desc += f"{rank.emoji} "
             
-            platform_emoji = Platform.from_str(platform_connection.platform).emoji
-
             if not platform:
-                desc += f"{platform_emoji} "
-
-            #desc += f"{platform_connection.name} "
-            #desc += dchyperlink(get_r6_tracker_url(platform_connection.name, _platform), platform_connection.name, f'View R6 Stats for {platform_connection.name}', suppress_embed=True) + " "
-            desc += f"{member.mention} ({dchyperlink(get_perma_r6_tracker_url(str(stats.request_id)), platform_connection.name, f'View R6 Stats for {platform_connection.name}', suppress_embed=True)}) "
-
-            if _filter_by in ['ranked_rank_points', 'ranked_max_rank_points']:
-                desc += f" `{stats.ranked_rank}`, `{stats.ranked_rank_points}` MMR"
-
-            elif _filter_by == f'{leaderboard_type}_wins':
-                desc += f"`{getattr(stats, f'{leaderboard_type}_wins')}` win{plural(getattr(stats, f'{leaderboard_type}_wins'))}"
-            elif _filter_by == f'{leaderboard_type}_losses':
-                desc += f"`{getattr(stats, f'{leaderboard_type}_losses')}` loss{plural(getattr(stats, f'{leaderboard_type}_losses'),'es')}"
-            elif _filter_by == f'{leaderboard_type}_kills':
-                desc += f"`{getattr(stats, f'{leaderboard_type}_kills')}` kill{plural(getattr(stats, f'{leaderboard_type}_kills'))}"
-            elif _filter_by == f'{leaderboard_type}_deaths':
-                desc += f"`{getattr(stats, f'{leaderboard_type}_deaths')}` death{plural(getattr(stats, f'{leaderboard_type}_deaths'))}"
-            elif _filter_by == f'{leaderboard_type}_abandons':
-                desc += f"`{getattr(stats, f'{leaderboard_type}_abandons')}` abandon{plural(getattr(stats, f'{leaderboard_type}_abandons'))}"
+                desc += f"{Platform.from_str(stats['platform']).emoji} "
+
+            desc += f"{member.mention} ({dchyperlink(get_perma_r6_tracker_url(str(stats['request_id']), Platform.from_str(stats['platform'])), name, f'View R6 Stats for {name}', suppress_embed=True)}) "
+
+            if stat in ['rank_points', 'max_rank_points']:
+                desc += f" `{stats['ranked_rank']}`, `{stats['ranked_rank_points']}` MMR"
+            else:
+                _, unit, suffix = LEADERBOARD_STAT_NAMES[stat]
+                value = stats[_filter_by] or 0
+                desc += f"`{value}` {unit}{plural(value, suffix)}"
             
             pages.append(desc)
-            #desc = f"{emoji} {rank.emoji}({' '+member if member else ''}) ({stats.ranked_rank}, `{stats.ranked_rank_points}` MMR)"
-            #desc += f"> {emoji}: `{user.username}` (`{user.lookup_count}` lookup{'s' if abs(user.lookup_count) != 1 else ''})\n"
-        title = f"{leaderboard_type.title()} Leaderboard"
-        if platform:
-            title += f" for {platform.proper_name}"
-        else:
-            title += " for All Platforms"
-        if _filter_by == f'{leaderboard_type}_rank_points':
-            title += " by Current MMR"
-        elif _filter_by == f'{leaderboard_type}_max_rank_points':
-            title += " by Peak MMR"
-        elif _filter_by == f'{leaderboard_type}_wins':
-            title += " by Wins"
-        elif _filter_by == f'{leaderboard_type}_losses':
-            title += " by Losses"
-        elif _filter_by == f'{leaderboard_type}_kills':
-            title += " by Kills"
-        elif _filter_by == f'{leaderboard_type}_deaths':
-            title += " by Deaths"
-        elif _filter_by == f'{leaderboard_type}_abandons':
-            title += " by Abandons"
-        else:
-            title += " by Current MMR"
-        
+
         if platform:
             color = platform.color
         else:
             color = discord.Color.blurple()
 
-        #pages = generate_pages(pages, title=title, color=color, items_per_page=15-1, url=get_r6_leaderboard_url(platform, gamemode=leaderboard_type) if platform else None)
-            
-        # if leaderboard_type == 'ranked':
-        #     desc += f"({getattr(stats, _filter_by)}, `{getattr(stats, _filter_by)}` MMR)"
-        #     #desc += f"> {emoji}: `{user.username}` (`{user.lookup_count}` lookup{'s' if abs(user.lookup_count) != 1 else ''})\n"
-        #     pages.append(desc)
-        # #embed = makeembed_bot(title=f"Ranked Leaderboard for {platform_.proper_name}", color=discord.Color.blurple())
         if platform:
             pages = generate_pages(pages, title=f"{platform.emoji} {platform.proper_name} {leaderboard_type.title()} Leaderboard in {ctx.guild.name}", color=color, items_per_page=10)
         else:
@@ -2740,7 +2823,6 @@ class ApiCog(CogU, name='R6 Commands'):
         link_cmd = await self.get_command_mention('link')
 
         for emb in pages:
-            #emb.description = f"{emb.description}\n> {emojidict.get('discord')} To appear on this leaderboard, link your account with {link_cmd}."
             if ctx.guild.id == TOURNEY_SERVER:
                 emb.description = f"{emb.description}\n> {emojidict.get('discord')} To appear on this leaderboard, link your account by following the instructions in <#{USERNAME_CHANNEL}>."
             else:
@@ -2748,6 +2830,85 @@ class ApiCog(CogU, name='R6 Commands'):
 
         return await create_paginator(ctx, pages, paginator=FiveButtonPaginator, author_id=ctx.author.id, go_to_button=True)
 
+    async def get_server_leaderboard_rows(self, member_ids: List[int], leaderboard_type: str, stat: str, descending: bool, platform: Optional[Platform]) -> List[dict]:
+        """Gets the current season stats of every member that has linked their Discord, sorted for the leaderboard.
+
+        The member IDs are sent to the database in chunks of `LEADERBOARD_MEMBER_CHUNK_SIZE`,
+        each chunk is one query that joins the members' settings, linked accounts and stats.
+
+        Args:
+            member_ids (List[int]): The Discord IDs of the members in the server.
+            leaderboard_type (str): The type of leaderboard.
+            stat (str): The stat to sort by.
+            descending (bool): Whether the highest values are first.
+            platform (Optional[Platform]): The platform to show, or None for all platforms.
+
+        Returns:
+            List[dict]: The best row of each member, in leaderboard order. `discord_id` is the Discord ID of the member.
+        """
+        prefix = LEADERBOARD_COLUMN_PREFIXES[leaderboard_type]
+        _filter_by = f'{prefix}_{stat}'
+        _direction = 'DESC' if descending else 'ASC'
+
+        conditions = ""
+        if stat in ['rank_points', 'max_rank_points']:
+            conditions += 'AND s."ranked_max_rank_points" IS DISTINCT FROM 1000 ' # unranked
+        else:
+            conditions += f'AND (s."{prefix}_kills" IS DISTINCT FROM 0 OR s."{prefix}_deaths" IS DISTINCT FROM 0) ' # skip inactive accs this season
+
+        if platform:
+            # members with a preferred platform only show up on that platform's leaderboard
+            conditions += """AND s."platform" = $2
+                             AND (st."preferred_platform" IS NULL OR st."preferred_platform" IN ('N/A', $2))
+                             AND EXISTS (SELECT 1 FROM "R6UserConnections" l WHERE l."profile_id" = u."id" AND l."platform" = $2) """
+
+        conn = Tortoise.get_connection('default')
+
+        results: List[List[dict]] = []
+        for i in range(0, len(member_ids), LEADERBOARD_MEMBER_CHUNK_SIZE):
+            chunk = [str(x) for x in member_ids[i:i+LEADERBOARD_MEMBER_CHUNK_SIZE]]
+
+            values: List[str] = [CURRENT_SEASON]
+            if platform:
+                values.append(platform.route)
+            placeholders = ", ".join(f"${n}" for n in range(len(values)+1, len(values)+len(chunk)+1))
+            values.extend(chunk)
+
+            query = f"""SELECT *
+                       FROM (
+                           SELECT DISTINCT ON (c."platform_id")
+                                  s.*,
+                                  c."platform_id" AS "discord_id",
+                                  u."userid" AS "profile_userid",
+                                  u."name" AS "profile_name"
+                           FROM "R6UserConnections" c
+                           JOIN "R6User" u ON u."id" = c."profile_id"
+                           JOIN "RankedStats" s ON s."user_id" = u."id"
+                           LEFT JOIN "Settings" st ON st."user_id"::text = c."platform_id"
+                           WHERE c."platform" = 'discord'
+                           AND c."platform_id" IN ({placeholders})
+                           AND s."season_number" = $1
+                           AND (st."show_on_leaderboard" IS NULL OR st."show_on_leaderboard")
+                           AND (
+                               st."preferred_platform" IS NULL
+                               OR st."preferred_platform" = 'N/A'
+                               OR EXISTS (SELECT 1 FROM "R6UserConnections" l WHERE l."profile_id" = u."id" AND l."platform" = st."preferred_platform")
+                           )
+                           {conditions}
+                           ORDER BY c."platform_id", s."{_filter_by}" {_direction} NULLS LAST, s."created_at", s."request_id"
+                       ) AS t
+                       ORDER BY t."{_filter_by}" {_direction} NULLS LAST, t."created_at", t."request_id";
+                    """
+            _, rows = await conn.execute_query(query, values)
+            results.append([dict(row) for row in rows])
+
+        def key(row: dict):
+            value = row[_filter_by]
+            return (value is None, -(value or 0) if descending else (value or 0), row['created_at'], str(row['request_id']))
+
+        # every chunk is already sorted, so they only have to be merged
+        return list(heapq.merge(*results, key=key))
+
     @commands.command(name='importusers',hidden=True)
     @commands.is_owner()
     async def import_users(self, ctx: ContextU, attachment: discord.Attachment):
@@ -2798,7 +2959,6 @@ class ApiCog(CogU, name='R6 Commands'):
                         id = None
                     p = await self.get_r6_user(name=username, uid=id, platform=platform)
                     sucesses.append(p)
-                    await asyncio.sleep(.5)
                 except Exception as e:
                     failures.append(username)
                     continue
@@ -2815,40 +2975,31 @@ class ApiCog(CogU, name='R6 Commands'):
             sentry_sdk.capture_exception(e)
             return await ctx.reply("Error occured while importing users.")
 
-    async def fetch_platform_connection(self, stats, _platform: Platform) -> Optional[R6UserConnections]:
-        platform_connection = None
+    async def fetch_platform_connection(self, userid: str, _platform: Platform) -> Optional[R6UserConnections]:
+        # ratelimits are waited out by the auth scheduler, so there is no need to sleep or retry here
         try: 
-            player: Player = await self.get_r6_user(uid=str(stats.user.userid), platform=_platform)
+            player: Player = await self.get_r6_user(uid=userid, platform=_platform)
             stats = await RankedStats.from_player(player)
-            player_uplay = await self.get_r6_user(uid=str(stats.user.userid), platform=Platform.UBI)
+            player_uplay = await self.get_r6_user(uid=userid, platform=Platform.UBI)
             linked_accs = await player_uplay.load_linked_accounts()
 
-            await asyncio.sleep(.25) # ratelimiting
-
             for acc in linked_accs:
                 await R6UserConnections.create_from_api_obj(acc)
-            platform_connection = await R6UserConnections.filter(userid=stats.user.userid, platform=_platform.route).first()
+            return await R6UserConnections.filter(userid=userid, platform=_platform.route).first()
         except Exception as e:
-            trace = traceback.format_exc()
+            return None
 
-            times = 0
-            while "HTTP 429: Too many calls per profile." in trace and times < 5:
-                try:
-                    await asyncio.sleep(15)
-                    times += 5
-                    player: Player = await self.get_r6_user(uid=str(stats.user.userid), platform=_platform)
-                    stats = await RankedStats.from_player(player)
-                    player_uplay = await self.get_r6_user(uid=str(stats.user.userid), platform=Platform.UBI)
-                    linked_accs = await player_uplay.load_linked_accounts()
-                    for acc in linked_accs:
-                        await R6UserConnections.create_from_api_obj(acc)
-                    platform_connection = await R6UserConnections.filter(userid=stats.user.userid, platform=_platform.route).first()
-                except Exception as e:
-                    trace = traceback.format_exc()
-                    continue
-                if times >= 5:
-                    continue
-        return platform_connection
+    @tasks.loop(seconds=10)
+    async def resolve_missing_connections(self):
+        """Fetches the platform connections that were missing when a leaderboard was shown."""
+        while not self._missing_connections.empty():
+            userid, platform = self._missing_connections.get_nowait()
+            try:
+                await self.fetch_platform_connection(userid, platform)
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+            finally:
+                self._pending_connections.discard((userid, platform))
 
     @tasks.loop(time=[datetime.time(hour=h, minute=_STARTUP.minute) for h in range(0,24)])
     async def reauth_session(self):
@@ -2856,6 +3007,43 @@ class ApiCog(CogU, name='R6 Commands'):
             await auth.connect()
         #await self.auth.connect()
 
+    @tasks.loop(minutes=USERNAME_SNAPSHOT_INTERVAL)
+    async def save_username_snapshot(self):
+        """Saves the username registry, so the next startup only has to read the connections made since."""
+        await username_registry.save_snapshot()
+
+    @tasks.loop(hours=USERNAME_RECONCILE_INTERVAL)
+    async def reconcile_usernames(self):
+        """Catches the username registry up on renames and deletes that didn't go through `R6UserConnections.save`.
+        Runs straight away too, since a registry loaded from a snapshot can be missing those from before it was saved."""
+        if self.reconcile_usernames.current_loop == 0 and username_registry.snapshot_time is None:
+            return # just read from the database, so there's nothing to catch up on
+        try:
+            added, removed = await username_registry.reconcile()
+            logger.info(f"Reconciled the username registry: {added} added, {removed} removed")
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+
+    @tasks.loop(seconds=STATUS_POLL_INTERVAL)
+    async def poll_status(self):
+        """Probes the upstreams, so `/status` never has to."""
+        try:
+            await status_poller.poll(self.bot.session)
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+
+    @poll_status.before_loop
+    async def before_poll_status(self):
+        await self.bot.wait_until_ready()
+
+    async def cog_unload(self):
+        self.resolve_missing_connections.cancel()
+        self.reauth_session.cancel()
+        self.save_username_snapshot.cancel()
+        self.reconcile_usernames.cancel()
+        self.poll_status.cancel()
+        await username_registry.save_snapshot()
+
     # @commands.Cog.listener()
     # async def on_ready(self):
     #     await self.bot.tree.fetch_commands()
@@ -2895,7 +3083,7 @@ async def setup(bot: BotU):
     for auth in auths:
         await auth.connect()
         auth.get_player_batch
-    await generate_usernames()
+    await username_registry.load()
     cog = ApiCog(bot, auths=auths)
     await bot.add_cog(cog)
     pass
\ No newline at end of file
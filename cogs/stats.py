@@ -24,7 +24,7 @@ import re
 import sys
 import textwrap
 import traceback
-from typing import Any, Dict, Optional, TypedDict
+from typing import Any, List, Optional, Tuple, TypedDict, Union
 
 import asyncpg
 import discord
@@ -35,11 +35,12 @@ import pkg_resources
 import psutil
 import pygit2
 from tortoise import Tortoise
-from tortoise.functions import Count
+from tortoise.functions import Sum
 from typing_extensions import Annotated
 
-from cogs.models import Blacklist, CommandInvocation, Commands
-from cogs.ranks import Platform, SUPPORT_SERVER, plural
+from cogs.logging import command_transactions
+from cogs.models import Blacklist, CommandInvocation, CommandRollups, Commands
+from cogs.ranks import Platform, SUPPORT_SERVER, player_cache, player_lookups, plural
 from cogs.ranksv2 import Platform as PlatformV2
 from utils import (
     BotU,
@@ -62,6 +63,32 @@ log = logging.getLogger(__name__)
 
 LOGGING_CHANNEL = 309632009427222529
 
+BULK_INSERT_INTERVAL = 10.0
+"""How often, in seconds, the command batch is written to the database."""
+
+BULK_INSERT_BATCH_SIZE = 500
+"""The maximum number of rows per INSERT. The batch is also written early once it reaches this size."""
+
+BULK_INSERT_MAX_PENDING = 5000
+"""The maximum number of commands waiting to be written. Once it's full, the oldest are dropped, so a database outage can't block commands."""
+
+TRANSACTION_ID_TIMEOUT = 30.0
+"""How long, in seconds, to wait for a command's CommandInvocation before logging it without a transaction ID."""
+
+USAGE_COLUMNS = ('command', 'guild_id', 'author_id')
+"""The Commands columns that usage can be grouped by."""
+
+MINUTE_ROLLUP_RETENTION = datetime.timedelta(days=2)
+"""How long per-minute command rollups are kept."""
+
+HOUR_ROLLUP_RETENTION = datetime.timedelta(days=90)
+"""How long per-hour command rollups are kept. Per-day rollups are kept forever."""
+
+COMMANDS_RETENTION: Optional[datetime.timedelta] = None
+"""How long raw Commands rows are kept, their usage is still counted in the rollups afterwards. None keeps them forever.
+Per-author reports (member stats, top users, `usage_summary` by author) still read raw Commands, since the rollups aren't split by author,
+so setting this cuts those reports off at the retention."""
+
 
 class DataBatchEntry(TypedDict):
     guild: Optional[int]
@@ -112,10 +139,16 @@ class Stats(CogU):
         self.process = psutil.Process()
         self._batch_lock = asyncio.Lock()
         self._data_batch: list[DataBatchEntry] = []
+        self.dropped_commands: int = 0
+        """How many commands were dropped without being written, because too many were waiting."""
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_failing: bool = False
+        self.bulk_insert_batch_size: int = BULK_INSERT_BATCH_SIZE
         self.bulk_insert_loop.add_exception_type(asyncpg.PostgresConnectionError)
         self.bulk_insert_loop.start()
         self._logging_queue = asyncio.Queue()
         self.logging_worker.start()
+        self.prune_command_usage.start()
 
     @property
     def display_emoji(self) -> discord.PartialEmoji:
@@ -144,29 +177,85 @@ class Stats(CogU):
         #         log.info('Registered %s commands to the database.', total)
         #     self._data_batch.clear()
         if self._data_batch:
-            await Commands.bulk_insert(self._data_batch) # type: ignore
-            total = len(self._data_batch)
+            # commands logged while this is inserting go in a new batch
+            batch = self._data_batch
+            self._data_batch = []
+            try:
+                await Commands.bulk_insert(batch, batch_size=self.bulk_insert_batch_size) # type: ignore
+            except Exception:
+                # put them back in front of anything logged since, to be retried on the next flush
+                log.exception('Failed to register %s commands, retrying on the next flush.', len(batch))
+                self._data_batch[:0] = batch
+                self._trim_batch()
+                self._flush_failing = True
+                return
+            self._flush_failing = False
+            try:
+                await CommandRollups.record(batch) # type: ignore
+            except Exception:
+                # the commands are already saved, retrying the batch would insert them twice
+                log.exception('Failed to update the command rollups for %s commands.', len(batch))
+            total = len(batch)
             if total > 1:
                 log.info('Registered %s commands to the database.', total)
-            self._data_batch.clear()
+
+    def _trim_batch(self) -> None:
+        """Drops the oldest commands waiting to be written once there are more than `BULK_INSERT_MAX_PENDING`."""
+        excess = len(self._data_batch) - BULK_INSERT_MAX_PENDING
+        if excess > 0:
+            del self._data_batch[:excess]
+            self.dropped_commands += excess
+            log.warning('Dropped %s commands that were waiting to be registered.', excess)
+
+    async def flush_batch(self) -> None:
+        async with self._batch_lock:
+            await self.bulk_insert()
+
+    @staticmethod
+    def _log_flush_error(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            log.error('Early command flush failed.', exc_info=task.exception())
 
     async def cog_unload(self):
         self.bulk_insert_loop.stop()
         self.logging_worker.cancel()
+        self.prune_command_usage.cancel()
 
-    @tasks.loop(seconds=10.0)
+    @tasks.loop(seconds=BULK_INSERT_INTERVAL)
     async def bulk_insert_loop(self):
         if not self._data_batch:
             return
-        async with self._batch_lock:
-            await self.bulk_insert()
+        await self.flush_batch()
+
+    @tasks.loop(hours=1)
+    async def prune_command_usage(self):
+        """Deletes rollups and raw commands that are past their retention."""
+        now = discord.utils.utcnow()
+        minutes = await CommandRollups.prune('minute', now - MINUTE_ROLLUP_RETENTION)
+        hours = await CommandRollups.prune('hour', now - HOUR_ROLLUP_RETENTION)
+        commands_deleted = 0
+        if COMMANDS_RETENTION is not None:
+            commands_deleted = await Commands.prune(now - COMMANDS_RETENTION)
+        if minutes or hours or commands_deleted:
+            log.info('Pruned %s minute rollups, %s hour rollups and %s commands.', minutes, hours, commands_deleted)
+
+    @prune_command_usage.before_loop
+    async def before_prune_command_usage(self):
+        await self.bot.wait_until_ready()
 
     @tasks.loop(seconds=0.0)
     async def logging_worker(self):
         record = await self._logging_queue.get()
         await self.send_log_record(record)
 
-    async def register_command(self, ctx: ContextU) -> None:
+    async def register_command(self, ctx: ContextU, wait_for_transaction: bool = True) -> None:
+        """Buffers a command to be logged.
+
+        Args:
+            ctx (ContextU): The context of the command.
+            wait_for_transaction (bool, optional): Whether to wait for the command's CommandInvocation to get its transaction ID.
+                Pure app commands don't get one, so there's nothing to wait for. Defaults to True.
+        """
         if ctx.command is None:
             return
 
@@ -210,30 +299,35 @@ class Stats(CogU):
             except TypeError:
                 continue
         
-        while True:
-            transaction = (await CommandInvocation.filter(command_id=ctx.interaction.id if ctx.interaction else ctx.message.id, user_id=ctx.author.id, timestamp=message.created_at).first())
-            if transaction:
-                transaction_id = transaction.transaction_id
-                break
-            await asyncio.sleep(5)
+        command_id = ctx.interaction.id if ctx.interaction else ctx.message.id
+
+        # set by CmdLoggingCog once the CommandInvocation is created
+        transaction_id = None
+        if wait_for_transaction:
+            transaction_id = await command_transactions.wait_for(command_id, timeout=TRANSACTION_ID_TIMEOUT)
+
+        self._data_batch.append(
+            {
+                'guild': guild_id,
+                'channel': ctx.channel.id,
+                'author': ctx.author.id,
+                'used': message.created_at, # created_at 
+                'prefix': ctx.prefix,
+                'command': command,
+                'failed': ctx.command_failed,
+                'app_command': is_app_command,
+                'args': args,
+                'kwargs': kwargs,
+                'command_id': command_id,
+                'transaction_id': transaction_id,
+            } # type: ignore
+        )
+        self._trim_batch()
 
-        async with self._batch_lock:
-            self._data_batch.append(
-                {
-                    'guild': guild_id,
-                    'channel': ctx.channel.id,
-                    'author': ctx.author.id,
-                    'used': message.created_at, # created_at 
-                    'prefix': ctx.prefix,
-                    'command': command,
-                    'failed': ctx.command_failed,
-                    'app_command': is_app_command,
-                    'args': args,
-                    'kwargs': kwargs,
-                    'command_id': ctx.interaction.id if ctx.interaction else ctx.message.id,
-                    'transaction_id': transaction_id,
-                } # type: ignore
-            )
+        # while the database is failing, only the loop retries, so every command doesn't start another failing flush
+        if len(self._data_batch) >= self.bulk_insert_batch_size and not self._flush_failing and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush_batch())
+            self._flush_task.add_done_callback(self._log_flush_error)
         # await Commands.create(
         #     guild_id=guild_id,
         #     channel=ctx.channel.id,
@@ -269,7 +363,7 @@ class Stats(CogU):
             # available on all types of commands then it's fine
             ctx = await ContextU.from_interaction(interaction)
             ctx.command_failed = interaction.command_failed or ctx.command_failed
-            await self.register_command(ctx)
+            await self.register_command(ctx, wait_for_transaction=False)
 
     @commands.Cog.listener()
     async def on_socket_event_type(self, event_type: str):
@@ -430,6 +524,98 @@ class Stats(CogU):
             return '[censored]'
         return censor_invite(obj)
 
+    @staticmethod
+    def _rollup_granularity(since: datetime.datetime) -> str:
+        """Gets the smallest rollup granularity that still has data going back to `since`."""
+        age = discord.utils.utcnow() - since
+        if age < MINUTE_ROLLUP_RETENTION:
+            return 'minute'
+        if age < HOUR_ROLLUP_RETENTION:
+            return 'hour'
+        return 'day'
+
+    @classmethod
+    def _rollup_since(cls, since: datetime.datetime) -> Tuple[str, datetime.datetime]:
+        """Gets the rollup granularity to use for usage since a point in time, and the bucket that point is in."""
+        granularity = cls._rollup_granularity(since)
+        return granularity, CommandRollups.bucket_for(since, granularity)
+
+    @classmethod
+    def _usage_filters(cls, since: Optional[datetime.datetime] = None, guild_id: Optional[int] = None, author_id: Optional[int] = None, raw: bool = False) -> Tuple[str, str, List[Any]]:
+        """Builds the WHERE clause for a usage query.
+        Usage not split by author is read from CommandRollups, anything else (or anything with `raw`) from Commands.
+
+        Returns:
+            Tuple[str, str, List[Any]]: The table, the WHERE clause and its values.
+        """
+        values: List[Any] = []
+        if author_id is None and not raw:
+            table = 'CommandRollups'
+            if since is None:
+                granularity = 'day'
+            else:
+                granularity, since = cls._rollup_since(since)
+            values.append(granularity)
+            conditions = ['granularity = $1']
+            filters = (('bucket >= ${}', since), ('guild_id = ${}', guild_id))
+        else:
+            table = 'Commands'
+            conditions = []
+            filters = (('used > ${}', since), ('guild_id = ${}', guild_id), ('author_id = ${}', author_id))
+        for condition, value in filters:
+            if value is not None:
+                values.append(value)
+                conditions.append(condition.format(len(values)))
+        return table, (f'WHERE {" AND ".join(conditions)}' if conditions else ''), values
+
+    async def usage_summary(self, *, since: Optional[datetime.datetime] = None, guild_id: Optional[int] = None, author_id: Optional[int] = None) -> Tuple[int, Optional[datetime.datetime]]:
+        """Counts the commands used, and when the first one was used.
+
+        Args:
+            since (Optional[datetime.datetime], optional): Only count commands used after this. Defaults to None.
+            guild_id (Optional[int], optional): Only count commands used in this guild. Defaults to None.
+            author_id (Optional[int], optional): Only count commands used by this user. Defaults to None.
+
+        Returns:
+            Tuple[int, Optional[datetime.datetime]]: The number of commands used and when the first one was used.
+            Unless `author_id` is passed, this comes from the rollups so the time is rounded down to the day.
+        """
+        table, where, values = self._usage_filters(since, guild_id, author_id)
+        if table == 'CommandRollups':
+            query = f'SELECT COALESCE(SUM(uses), 0) AS "uses", MIN(bucket) AS "first" FROM "CommandRollups" {where};'
+        else:
+            query = f'SELECT COUNT(*) AS "uses", MIN(used) AS "first" FROM "Commands" {where};'
+        conn = Tortoise.get_connection('default')
+        _, rows = await conn.execute_query(query, values)
+        return int(rows[0]['uses']), rows[0]['first']
+
+    async def top_usage(self, column: str, *, since: Optional[datetime.datetime] = None, guild_id: Optional[int] = None, author_id: Optional[int] = None, limit: Optional[int] = 5) -> List[Tuple[Any, int]]:
+        """Gets the most used values of a column, counted by the database.
+
+        Args:
+            column (str): What to group by, one of USAGE_COLUMNS.
+            since (Optional[datetime.datetime], optional): Only count commands used after this. Defaults to None.
+            guild_id (Optional[int], optional): Only count commands used in this guild. Defaults to None.
+            author_id (Optional[int], optional): Only count commands used by this user. Defaults to None.
+            limit (Optional[int], optional): How many to return, None for all of them. Defaults to 5.
+
+        Returns:
+            List[Tuple[Any, int]]: The values and how many times they were used, most used first.
+        """
+        if column not in USAGE_COLUMNS:
+            raise ValueError(f"Can't group command usage by {column}")
+        # the rollups aren't split by author
+        table, where, values = self._usage_filters(since, guild_id, author_id, raw=column == 'author_id')
+        uses = 'SUM(uses)' if table == 'CommandRollups' else 'COUNT(*)'
+        query = f'SELECT {column} AS "key", {uses} AS "uses" FROM "{table}" {where} GROUP BY {column} ORDER BY "uses" DESC'
+        if limit is not None:
+            values.append(limit)
+            query += f' LIMIT ${len(values)}'
+        conn = Tortoise.get_connection('default')
+        _, rows = await conn.execute_query(query + ';', values)
+        # private messages are stored as guild 0 in the rollups
+        return [(row['key'] if column != 'guild_id' or row['key'] else None, int(row['uses'])) for row in rows]
+
     async def show_guild_stats(self, ctx: ContextU) -> None:
         lookup = (
             '\N{FIRST PLACE MEDAL}',
@@ -445,9 +631,7 @@ class Stats(CogU):
         # query = "SELECT COUNT(*), MIN(used) FROM "Commands" WHERE guild_id=$1;"
         # count: tuple[int, datetime.datetime] = await ctx.db.fetchrow(query, ctx.guild.id)  # type: ignore
 
-        qs = Commands.filter(guild_id=ctx.guild.id).order_by('used')
-
-        count = await qs.count(), getattr((await qs.first()), 'used', None)
+        count = await self.usage_summary(guild_id=ctx.guild.id)
 
         embed.description = f'`{intcomma(count[0])}` commands used.'
         if count[1]:
@@ -470,22 +654,10 @@ class Stats(CogU):
         # records = await ctx.db.fetch(query, ctx.guild.id)
 
         
-        records = await Commands.filter(guild_id=ctx.guild.id).group_by('command').order_by('-used')
-
-        records_dict = {}
-        for record in records:
-            if record.command not in records_dict.keys():
-                records_dict[record.command] = 1
-            else:
-                records_dict[record.command] += 1
-            if len(records_dict) >= 5:
-                break
-        # records_dict: Dict[Commands, int] = {
-        #     record: await Commands.filter(guild_id=ctx.guild.id, command=record.command).count() for record in records
-        # }
+        records = await self.top_usage('command', guild_id=ctx.guild.id)
 
         value = (
-            '\n'.join(f'{lookup[index]}: {command} (`{intcomma(uses)}` uses)' for (index, (command, uses)) in enumerate(records_dict.items()))
+            '\n'.join(f'{lookup[index]}: {command} (`{intcomma(uses)}` uses)' for (index, (command, uses)) in enumerate(records))
             or 'No Commands'
         )
 
@@ -503,20 +675,10 @@ class Stats(CogU):
 
         # records = await ctx.db.fetch(query, ctx.guild.id)
         
-        records = await Commands.filter(guild_id=ctx.guild.id, used__gt=(discord.utils.utcnow() - datetime.timedelta(days=1))).group_by('command').order_by('-used')
-        
-        records_dict = {}
-        for record in records:
-            if record.command not in records_dict.keys():
-                records_dict[record.command] = 1
-            else:
-                records_dict[record.command] += 1
-            if len(records_dict) >= 5:
-                break
-        
+        records = await self.top_usage('command', guild_id=ctx.guild.id, since=discord.utils.utcnow() - datetime.timedelta(days=1))
 
         value = (
-            '\n'.join(f'{lookup[index]}: {command} (`{intcomma(uses)}` use{plural(uses)})' for (index, (command, uses)) in enumerate(records_dict.items()))
+            '\n'.join(f'{lookup[index]}: {command} (`{intcomma(uses)}` use{plural(uses)})' for (index, (command, uses)) in enumerate(records))
             or 'No Commands.'
         )
         embed.add_field(name='Top Commands Today', value=value, inline=True)
@@ -533,20 +695,11 @@ class Stats(CogU):
 
         # records = await ctx.db.fetch(query, ctx.guild.id)
 
-        records = await Commands.filter(guild_id=ctx.guild.id).group_by('author').order_by('-used')
-        records_dict = {}
-        for record in records:
-            if record.author_id not in records_dict.keys():
-                records_dict[record.author_id] = 1
-            else:
-                records_dict[record.author_id] += 1
-            if len(records_dict) >= 5:
-                break
-        
+        records = await self.top_usage('author_id', guild_id=ctx.guild.id)
 
         value = (
             '\n'.join(
-                f'{lookup[index]}: <@{author_id}> (`{intcomma(uses)}` bot use{plural(uses)})' for (index, (author_id, uses)) in enumerate(records_dict.items())
+                f'{lookup[index]}: <@{author_id}> (`{intcomma(uses)}` bot use{plural(uses)})' for (index, (author_id, uses)) in enumerate(records)
             )
             or 'No bot users.'
         )
@@ -565,20 +718,11 @@ class Stats(CogU):
 
         # records = await ctx.db.fetch(query, ctx.guild.id)
 
-        records = await Commands.filter(guild_id=ctx.guild.id, used__gt=(discord.utils.utcnow() - datetime.timedelta(days=1))).group_by('author').order_by('-used')
-
-        records_dict = {}
-        for record in records:
-            if record.author_id not in records_dict.keys():
-                records_dict[record.author_id] = 1
-            else:
-                records_dict[record.author_id] += 1
-            if len(records_dict) >= 5:
-                break
+        records = await self.top_usage('author_id', guild_id=ctx.guild.id, since=discord.utils.utcnow() - datetime.timedelta(days=1))
 
         value = (
             '\n'.join(
-                f'{lookup[index]}: <@{author_id}> (`{intcomma(uses)}` bot use{plural(uses)})' for (index, (author_id, uses)) in enumerate(records_dict.items())
+                f'{lookup[index]}: <@{author_id}> (`{intcomma(uses)}` bot use{plural(uses)})' for (index, (author_id, uses)) in enumerate(records)
             )
             or 'No command users.'
         )
@@ -603,8 +747,7 @@ class Stats(CogU):
         # query = "SELECT COUNT(*), MIN(used) FROM "Commands" WHERE guild_id=$1 AND author_id=$2;"
         # count: tuple[int, datetime.datetime] = await ctx.db.fetchrow(query, ctx.guild.id, member.id)  # type: ignore
 
-        qs = Commands.filter(guild_id=ctx.guild.id, author_id=member.id).order_by('used')
-        count = await qs.count(), getattr((await qs.first()), 'used', None)
+        count = await self.usage_summary(guild_id=ctx.guild.id, author_id=member.id)
 
         embed.description = f'`{intcomma(count[0])}` commands used.'
         if count[1]:
@@ -625,19 +768,10 @@ class Stats(CogU):
 
         # records = await ctx.db.fetch(query, ctx.guild.id, member.id)
 
-        records = await Commands.filter(guild_id=ctx.guild.id, author_id=member.id).group_by('command').order_by('-used')
-        records_dict = {}
-        for record in records:
-            if record.command not in records_dict.keys():
-                records_dict[record.command] = 1
-            else:
-                records_dict[record.command] += 1
-            if len(records_dict) >= 5:
-                break
-
+        records = await self.top_usage('command', guild_id=ctx.guild.id, author_id=member.id)
 
         value = (
-            '\n'.join(f'{lookup[index]}: {record} (`{intcomma(uses)}` uses)' for (index, (record, uses)) in enumerate(records_dict.items()))
+            '\n'.join(f'{lookup[index]}: {record} (`{intcomma(uses)}` uses)' for (index, (record, uses)) in enumerate(records))
             or 'No Commands'
         )
 
@@ -656,19 +790,10 @@ class Stats(CogU):
 
         # records = await ctx.db.fetch(query, ctx.guild.id, member.id)
 
-        records = await Commands.filter(guild_id=ctx.guild.id, author_id=member.id, used__gt=(discord.utils.utcnow() - datetime.timedelta(days=1))).group_by('command').order_by('-used')
-
-        records_dict = {}
-        for record in records:
-            if record.command not in records_dict.keys():
-                records_dict[record.command] = 1
-            else:
-                records_dict[record.command] += 1
-            if len(records_dict) >= 5:
-                break
+        records = await self.top_usage('command', guild_id=ctx.guild.id, author_id=member.id, since=discord.utils.utcnow() - datetime.timedelta(days=1))
 
         value = (
-            '\n'.join(f'{lookup[index]}: {command} (`{intcomma(uses)}` uses)' for (index, (command, uses)) in enumerate(records_dict.items()))
+            '\n'.join(f'{lookup[index]}: {command} (`{intcomma(uses)}` uses)' for (index, (command, uses)) in enumerate(records))
             or 'No Commands'
         )
 
@@ -694,7 +819,7 @@ class Stats(CogU):
 
         # query = "SELECT COUNT(*) FROM "Commands";"
         # total: tuple[int] = await ctx.db.fetchrow(query)  # type: ignore
-        total = await Commands.all().count()
+        total, _ = await self.usage_summary()
 
         e = discord.Embed(title='Command Stats', colour=discord.Colour.blurple())
         e.description = f'`{intcomma(total)}` commands used.'
@@ -715,17 +840,9 @@ class Stats(CogU):
         #         """
 
         # records = await ctx.db.fetch(query)
-        records = await Commands.all().group_by('command').order_by('-used')
-        records_dict = {}
-        for record in records:
-            if record.command not in records_dict.keys():
-                records_dict[record.command] = 1
-            else:
-                records_dict[record.command] += 1
-            if len(records_dict) >= 5:
-                break
-    
-        value = '\n'.join(f'{lookup[index]}: {command} (`{intcomma(uses)}` uses)' for (index, (command, uses)) in enumerate(records_dict.items()))
+        records = await self.top_usage('command')
+
+        value = '\n'.join(f'{lookup[index]}: {command} (`{intcomma(uses)}` uses)' for (index, (command, uses)) in enumerate(records))
         e.add_field(name='Top Commands', value=value, inline=False)
 
         # query = """SELECT guild_id, COUNT(*) AS "uses"
@@ -737,19 +854,10 @@ class Stats(CogU):
 
         # records = await ctx.db.fetch(query)
 
-        records = await Commands.all().group_by('guild').order_by('-used')
-
-        records_dict = {}
-        for record in records:
-            if record.guild_id not in records_dict.keys():
-                records_dict[record.guild_id] = 1
-            else:
-                records_dict[record.guild_id] += 1
-            if len(records_dict) >= 5:
-                break
+        records = await self.top_usage('guild_id')
 
         value = []
-        for (index, (guild_id, uses)) in enumerate(records_dict.items()):
+        for (index, (guild_id, uses)) in enumerate(records):
             if guild_id is None:
                 guild = 'Private Message'
             else:
@@ -769,19 +877,10 @@ class Stats(CogU):
 
         # records = await ctx.db.fetch(query)
         
-        records = await Commands.all().group_by('author').order_by('-used')
-        
-        records_dict = {}
-        for record in records:
-            if record.author_id not in records_dict.keys():
-                records_dict[record.author_id] = 1
-            else:
-                records_dict[record.author_id] += 1
-            if len(records_dict) >= 5:
-                break
-        
+        records = await self.top_usage('author_id')
+
         value = []
-        for (index, (author_id, uses)) in enumerate(records_dict.items()):
+        for (index, (author_id, uses)) in enumerate(records):
             user = await self.censor_object(self.bot.get_user(author_id) or f'<Unknown {author_id}>')
             emoji = lookup[index]
             value.append(f'{emoji}: {user} (`{intcomma(uses)}` uses)')
@@ -797,8 +896,10 @@ class Stats(CogU):
         # query = "SELECT failed, COUNT(*) FROM "Commands" WHERE used > (CURRENT_TIMESTAMP - INTERVAL '1 day') GROUP BY failed;"
         # total = await ctx.db.fetch(query)
         
-        records = await Commands.filter(used__gt=(discord.utils.utcnow() - datetime.timedelta(days=1))).group_by('failed').annotate(count=Count('failed')).values('failed', 'count')
-        total = [(record.get('failed'), int(record.get('count'))) for record in records]
+        since = discord.utils.utcnow() - datetime.timedelta(days=1)
+        granularity, bucket = self._rollup_since(since)
+        records = await CommandRollups.filter(granularity=granularity, bucket__gte=bucket).group_by('failed').annotate(count=Sum('uses')).values('failed', 'count')
+        total = [(record.get('failed'), int(record.get('count') or 0)) for record in records]
         failed = 0
         success = 0
         question = 0
@@ -833,18 +934,9 @@ class Stats(CogU):
         #         """
 
         # records = await ctx.db.fetch(query)
-        records = await Commands.filter(used__gt=(discord.utils.utcnow() - datetime.timedelta(days=1))).group_by('command').order_by('-used')
+        records = await self.top_usage('command', since=since)
 
-        records_dict: Dict[str, int] = {}
-        for record in records:
-            if record.command not in records_dict.keys():
-                records_dict[record.command] = 1
-            else:
-                records_dict[record.command] += 1
-            if len(records_dict) >= 5:
-                break
-
-        value = '\n'.join(f'{lookup[index]}: {command} (`{intcomma(uses)}` uses)' for (index, (command, uses)) in enumerate(records_dict.items()))
+        value = '\n'.join(f'{lookup[index]}: {command} (`{intcomma(uses)}` uses)' for (index, (command, uses)) in enumerate(records))
         e.add_field(name='Top Commands', value=value, inline=False)
 
         # query = """SELECT guild_id, COUNT(*) AS "uses"
@@ -857,16 +949,11 @@ class Stats(CogU):
 
         # records = await ctx.db.fetch(query)
 
-        records_dict = {}
-        for record in records:
-            if record.guild_id not in records_dict.keys():
-                records_dict[record.guild_id] = 1
-            else:
-                records_dict[record.guild_id] += 1
-        
+        records = await self.top_usage('guild_id', since=since)
+
         value = []
 
-        for (index, (guild_id, uses)) in enumerate(records_dict.items()):
+        for (index, (guild_id, uses)) in enumerate(records):
             if guild_id is None:
                 guild = 'Private Message'
             else:
@@ -886,19 +973,10 @@ class Stats(CogU):
 
         # records = await ctx.db.fetch(query)
 
-        records = await Commands.filter(used__gt=(discord.utils.utcnow() - datetime.timedelta(days=1))).group_by('author').order_by('-used')
-        
-        records_dict = {}
-        for record in records:
-            if record.author_id not in records_dict.keys():
-                records_dict[record.author_id] = 1
-            else:
-                records_dict[record.author_id] += 1
-            if len(records_dict) >= 5:
-                break
+        records = await self.top_usage('author_id', since=since)
 
         value = []
-        for (index, (author_id, uses)) in enumerate(records_dict.items()):
+        for (index, (author_id, uses)) in enumerate(records):
             user = await self.censor_object(await self.bot.getorfetch_user(author_id, None) or f'<Unknown {author_id}>')
             emoji = lookup[index]
             value.append(f'{emoji}: {user} (`{intcomma(uses)}` uses)')
@@ -1062,7 +1140,9 @@ class Stats(CogU):
 
         command_waiters = len(self._data_batch)
         is_locked = self._batch_lock.locked()
-        description.append(f'Commands Waiting: `{command_waiters}`, Batch Locked: {emojidict.get(is_locked)}')
+        description.append(f'Commands Waiting: `{command_waiters}`, Dropped: `{self.dropped_commands}`, Batch Locked: {emojidict.get(is_locked)}')
+        description.append(f'Player Lookups: `{player_lookups.calls}` made, `{player_lookups.coalesced}` coalesced, `{len(player_lookups)}` in flight')
+        description.append(f'Player Cache: `{len(player_cache)}`/`{player_cache.maxsize}` cached, `{player_cache.hits}` hits, `{player_cache.misses}` misses, `{player_cache.evictions}` evictions')
 
         memory_usage = self.process.memory_full_info().uss / 1024**2
         cpu_usage = self.process.cpu_percent() / psutil.cpu_count()
@@ -1183,19 +1263,20 @@ class Stats(CogU):
         for page in paginator.pages:
             await ctx.send(page)
 
-    async def tabulate_query(self, ctx: ContextU, records: list[Commands], *args: Any):
+    async def tabulate_query(self, ctx: ContextU, records: List[Union[Commands, dict]], *args: Any):
         #records = await ctx.db.fetch(query, *args)
 
         if len(records) == 0:
             return await ctx.reply('No results found.')
-        headers = list(records[0].__dict__.keys())
+        rows = [r if isinstance(r, dict) else r.__dict__ for r in records]
+        headers = list(rows[0].keys())
         table = danny_formats.TabularData()
         table.set_columns(headers)
 
         # def format_datetimes(dt: datetime.datetime) -> str:
         #     return dctimestamp(dt)
         
-        table.add_rows(list(r.__dict__.values()) for r in records)
+        table.add_rows(list(r.values()) for r in rows)
         render = table.render()
 
         fmt = f'```\n{render}\n```'
@@ -1240,29 +1321,43 @@ class Stats(CogU):
 
         query = """SELECT *, t.success + t.failed AS "total"
                    FROM (
-                       SELECT guild_id,
-                              SUM(CASE WHEN failed THEN 0 ELSE 1 END) AS "success",
-                              SUM(CASE WHEN failed THEN 1 ELSE 0 END) AS "failed"
-                       FROM "Commands"
+                       SELECT NULLIF(guild_id, 0) AS "guild_id",
+                              SUM(CASE WHEN failed THEN 0 ELSE uses END) AS "success",
+                              SUM(CASE WHEN failed THEN uses ELSE 0 END) AS "failed"
+                       FROM "CommandRollups"
                        WHERE command=$1
-                       AND used > (CURRENT_TIMESTAMP - $2::interval)
+                       AND granularity=$2
+                       AND bucket >= $3
                        GROUP BY guild_id
                    ) AS t
                    ORDER BY "total" DESC
                    LIMIT 30;
                 """
         
+        granularity, since = self._rollup_since(discord.utils.utcnow() - datetime.timedelta(days=days))
         conn = Tortoise.get_connection('default')
-        query = await conn.execute_query(query, [command, days])
-        results = []
-        for row in query[1]:
-            results.append(await Commands.get(id=row.get('id')))
+        _, rows = await conn.execute_query(query, [command, granularity, since])
+        await self.tabulate_query(ctx, [dict(row) for row in rows])
 
-        #await self.tabulate_query(ctx, await Commands.filter(author_id=user_id).group_by('command').order_by('-used').limit(20))
-        await self.tabulate_query(ctx, results)
+    @command_history.command(name='daily')
+    @commands.is_owner()
+    async def command_history_daily(self, ctx: ContextU, days: int = 7):
+        """Daily command totals for the last N days."""
+
+        query = """SELECT to_char(bucket, 'Mon DD') AS "day",
+                          SUM(CASE WHEN failed THEN 0 ELSE uses END) AS "success",
+                          SUM(CASE WHEN failed THEN uses ELSE 0 END) AS "failed",
+                          SUM(uses) AS "total"
+                   FROM "CommandRollups"
+                   WHERE granularity='day'
+                   AND bucket >= $1
+                   GROUP BY bucket
+                   ORDER BY bucket DESC;
+                """
 
-        # await self.tabulate_query(ctx, query, command, datetime.timedelta(days=days))
-        await self.tabulate_query(ctx, await Commands.filter(command=command, used__gt=(discord.utils.utcnow() - datetime.timedelta(days=days))).group_by('guild').order_by('-used').limit(30))
+        conn = Tortoise.get_connection('default')
+        _, rows = await conn.execute_query(query, [CommandRollups.bucket_for(discord.utils.utcnow() - datetime.timedelta(days=days), 'day')])
+        await self.tabulate_query(ctx, [dict(row) for row in rows])
 
     @command_history.command(name='guild', aliases=['server'])
     @commands.is_owner()
@@ -1339,15 +1434,10 @@ class Stats(CogU):
         all_commands = {c.qualified_name: 0 for c in self.bot.walk_commands()}
 
         #records = await ctx.db.fetch(query, datetime.timedelta(days=days))
-        records = await Commands.filter(used__gt=(discord.utils.utcnow() - datetime.timedelta(days=days))).group_by('command','used', 'kwargs', 'uses', 'args').order_by('-used')
-        records_dict = {}
-        for record in records:
-            if record.command not in records_dict.keys():
-                records_dict[record.command] = 1
-            else:
-                records_dict[record.command] += 1
+        # one row per command name, so this doesn't need a limit
+        records = await self.top_usage('command', since=discord.utils.utcnow() - datetime.timedelta(days=days), limit=None)
 
-        for name, uses in records_dict.items():
+        for name, uses in records:
             if name in all_commands:
                 all_commands[name] = uses
 
@@ -1384,63 +1474,51 @@ class Stats(CogU):
             if cog is None:
                 return await ctx.reply(f'Unknown cog: {cog_name}')
 
-            # query = """SELECT *, t.success + t.failed AS "total"
-            #            FROM (
-            #                SELECT command,
-            #                       SUM(CASE WHEN failed THEN 0 ELSE 1 END) AS "success",
-            #                       SUM(CASE WHEN failed THEN 1 ELSE 0 END) AS "failed"
-            #                FROM "Commands"
-            #                WHERE command = any($1::text[])
-            #                AND used > (CURRENT_TIMESTAMP - $2::interval)
-            #                GROUP BY command
-            #            ) AS t
-            #            ORDER BY "total" DESC
-            #            LIMIT 30;
-            #         """
-            # return await self.tabulate_query(ctx, query, [c.qualified_name for c in cog.walk_commands()], interval)
-            return await self.tabulate_query(ctx, await Commands.filter(command__in=[c.qualified_name for c in cog.walk_commands()], used__gt=(discord.utils.utcnow() - interval)).group_by('command').order_by('-used').limit(30))
-
-        # A more manual query with a manual grouper.
-        # query = """SELECT *, t.success + t.failed AS "total"
-        #            FROM (
-        #                SELECT command,
-        #                       SUM(CASE WHEN failed THEN 0 ELSE 1 END) AS "success",
-        #                       SUM(CASE WHEN failed THEN 1 ELSE 0 END) AS "failed"
-        #                FROM "Commands"
-        #                WHERE used > (CURRENT_TIMESTAMP - $1::interval)
-        #                GROUP BY command
-        #            ) AS t;
-        #         """
+            query = """SELECT *, t.success + t.failed AS "total"
+                       FROM (
+                           SELECT command,
+                                  SUM(CASE WHEN failed THEN 0 ELSE uses END) AS "success",
+                                  SUM(CASE WHEN failed THEN uses ELSE 0 END) AS "failed"
+                           FROM "CommandRollups"
+                           WHERE command = any($1::text[])
+                           AND granularity = $2
+                           AND bucket >= $3
+                           GROUP BY command
+                       ) AS t
+                       ORDER BY "total" DESC
+                       LIMIT 30;
+                    """
+            granularity, since = self._rollup_since(discord.utils.utcnow() - interval)
+            conn = Tortoise.get_connection('default')
+            _, rows = await conn.execute_query(query, [[c.qualified_name for c in cog.walk_commands()], granularity, since])
+            return await self.tabulate_query(ctx, [dict(row) for row in rows])
+
+        # one row per command name, grouped into cogs here
+        query = """SELECT command,
+                          SUM(CASE WHEN failed THEN 0 ELSE uses END) AS "success",
+                          SUM(CASE WHEN failed THEN uses ELSE 0 END) AS "failed"
+                   FROM "CommandRollups"
+                   WHERE granularity = $1
+                   AND bucket >= $2
+                   GROUP BY command;
+                """
 
-        # class Count:
-        #     __slots__ = ('success', 'failed', 'total')
-
-        #     def __init__(self):
-        #         self.success = 0
-        #         self.failed = 0
-        #         self.total = 0
-
-        #     def add(self, record):
-        #         self.success += record['success']
-        #         self.failed += record['failed']
-        #         self.total += record['total']
-
-        # data = defaultdict(Count)
-        # records = await ctx.db.fetch(query, interval)
-        # for record in records:
-        #     command = self.bot.get_command(record['command'])
-        #     if command is None or command.cog is None:
-        #         data['No Cog'].add(record)
-        #     else:
-        #         data[command.cog.qualified_name].add(record)
-
-        # table = formats.TabularData()
-        # table.set_columns(['Cog', 'Success', 'Failed', 'Total'])
-        # data = sorted([(cog, e.success, e.failed, e.total) for cog, e in data.items()], key=lambda t: t[-1], reverse=True)
-
-        # table.add_rows(data)
-        # render = table.render()
-        # await ctx.safe_send(f'```\n{render}\n```')
+        success: Counter[str] = Counter()
+        failed: Counter[str] = Counter()
+        conn = Tortoise.get_connection('default')
+        _, rows = await conn.execute_query(query, [*self._rollup_since(discord.utils.utcnow() - interval)])
+        for row in rows:
+            command = self.bot.get_command(row['command'])
+            cog_name = 'No Cog' if command is None or command.cog is None else command.cog.qualified_name
+            success[cog_name] += int(row['success'])
+            failed[cog_name] += int(row['failed'])
+
+        table = danny_formats.TabularData()
+        table.set_columns(['Cog', 'Success', 'Failed', 'Total'])
+        data = sorted([(cog, success[cog], failed[cog], success[cog] + failed[cog]) for cog in success.keys() | failed.keys()], key=lambda t: t[-1], reverse=True)
+        table.add_rows(data)
+        render = table.render()
+        await ctx.reply(f'```\n{render}\n```')
 
 
 old_on_error = commands.AutoShardedBot.on_error
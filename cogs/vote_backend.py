@@ -1,15 +1,29 @@
 from __future__ import annotations
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
 
-from typing import Dict, List, Optional, Union
-
+import aiohttp
 import discord
 from discord.ext import commands, tasks
 
 from main import PROD
 import yaml
 import dateparser
+from cogs.models import Votes, vote_index
 from utils import BotU, CogU, ContextU
-import traceback
+
+logger = logging.getLogger(__name__)
+
+VOTE_SYNC_INTERVAL = 30
+"""How often, in seconds, new votes are read into the vote index."""
+STATS_POST_TIMEOUT = 15.0
+"""How long, in seconds, posting stats to one site can take before it's given up on."""
+STATS_POST_BACKOFF = 60.0
+"""How long, in seconds, a site is skipped after posting to it fails. Doubles after every failure in a row."""
+STATS_POST_MAX_BACKOFF = 3600.0
+"""The longest a site is skipped after failures."""
 
 class MultiURLButton(discord.ui.View):
     def __init__(self, buttons: dict[str, str]):
@@ -37,6 +51,12 @@ class VoteBackend(CogU, name='Voting Backend', hidden=True):
 
     def __init__(self, bot: BotU):
         self.bot = bot
+        self._posted_counts: Dict[str, Tuple[int, int]] = {}
+        """The (guild count, shard count) last posted to each site."""
+        self._failures: Dict[str, int] = {}
+        """How many times in a row posting to each site failed."""
+        self._retry_at: Dict[str, float] = {}
+        """When each site that failed can be posted to again, from time.monotonic()."""
     
     async def topgg_get_votes(self) -> List[Dict[str, Union[str, int]]]:
         """
@@ -81,7 +101,8 @@ class VoteBackend(CogU, name='Voting Backend', hidden=True):
         return await self._get_json_or_empty(url, headers=headers)
 
     async def topgg_get_user_voted(self, user: discord.abc.User) -> bool:
-        """Check if a user has voted for your bot.
+        """Check if a user has voted for your bot in the last 12 hours.
+        This is checked against the votes the webhook saved, so it doesn't make a request to top.gg.
 
         Args:
             user (discord.abc.User): The user to check.
@@ -89,17 +110,19 @@ class VoteBackend(CogU, name='Voting Backend', hidden=True):
         Returns:
             bool: Whether the user has voted for your bot.
         """        
-        url = f"{TOPGG_API}/bots/{self.bot.user.id}/check"
-
-        r = await self._get_json_or_empty(url, params={"userId": user.id})
+        return await Votes.voted_recently(user.id, 'topgg')
 
-        voted = dict(r).get("voted", False)
+    async def dcbotlist_get_user_voted(self, user: discord.abc.User) -> bool:
+        """Check if a user has voted for your bot on discordbotlist.com in the last 12 hours.
+        This is checked against the votes the webhook saved, so it doesn't make a request to discordbotlist.com.
 
-        if voted == 1: voted = True
-        elif voted == 0: voted = False
-        else: raise ValueError(f"Unexpected value for voted: {voted}")
+        Args:
+            user (discord.abc.User): The user to check.
 
-        return voted
+        Returns:
+            bool: Whether the user has voted for your bot.
+        """
+        return await Votes.voted_recently(user.id, 'dcbotlist')
 
     async def dcbotlist_get_votes(self) -> List[Dict[str, Union[str, int]]]:
         """Get the last 500 voters for your bot.
@@ -304,18 +327,57 @@ class VoteBackend(CogU, name='Voting Backend', hidden=True):
         botlistme_post_stats,
     ]
 
-    @tasks.loop(minutes=1)
-    async def post_stats(self):
+    async def _post_stats_to(self, func: Callable[[VoteBackend], Awaitable[aiohttp.ClientResponse]], counts: Tuple[int, int], force: bool=False) -> bool:
+        """Posts the bot's stats to one site, unless they haven't changed since the last post or the site is backed off after failing.
+
+        Returns:
+            bool: Whether the stats were posted.
+        """
+        site = func.__name__
+        if not force and (self._posted_counts.get(site) == counts or self._retry_at.get(site, 0) > time.monotonic()):
+            return False
+
         try:
-            if not hasattr(self.bot.user, 'id'): return
-            for func in self.stats_funcs:
-                try:
-                    await func(self)
-                except Exception as e:
-                    continue
+            r = await asyncio.wait_for(func(self), STATS_POST_TIMEOUT)
+            r.release()
         except Exception as e:
-            traceback.print_exc()
-            raise e
+            failures = self._failures[site] = self._failures.get(site, 0) + 1
+            backoff = min(STATS_POST_BACKOFF * 2 ** (failures - 1), STATS_POST_MAX_BACKOFF)
+            self._retry_at[site] = time.monotonic() + backoff
+            logger.warning(f"Posting stats with {site} failed {failures} time(s) in a row ({e.__class__.__name__}: {e}). Retrying in {backoff} seconds.")
+            return False
+
+        self._posted_counts[site] = counts
+        self._failures.pop(site, None)
+        self._retry_at.pop(site, None)
+        return True
+
+    async def post_stats_to_all(self, force: bool=False) -> int:
+        """Posts the bot's stats to every site at once.
+
+        Args:
+            force (bool, optional): Post even if the stats haven't changed or a site is backed off. Defaults to False.
+
+        Returns:
+            int: How many sites the stats were posted to.
+        """
+        if not hasattr(self.bot.user, 'id'): return 0
+        counts = (len(self.bot.guilds), self.bot.shard_count or 1)
+        results = await asyncio.gather(*(self._post_stats_to(func, counts, force) for func in self.stats_funcs))
+        return sum(results)
+
+    @tasks.loop(minutes=1)
+    async def post_stats(self):
+        await self.post_stats_to_all()
+
+    @tasks.loop(seconds=VOTE_SYNC_INTERVAL)
+    async def sync_votes(self):
+        """Reads the votes the webhook saved since the last sync into the vote index."""
+        await vote_index.sync()
+
+    @sync_votes.before_loop
+    async def before_sync_votes(self):
+        await self.bot.wait_until_ready()
     # @tasks.loop(hours=1)
     # async def post_command_data(self):
     #     await self.dcbotlist_post_command_data()
@@ -329,17 +391,8 @@ class VoteBackend(CogU, name='Voting Backend', hidden=True):
     @commands.command(name='poststats', hidden=True)
     @commands.is_owner()
     async def poststats(self, ctx: ContextU):
-        try:
-            if not hasattr(self.bot.user, 'id'): return
-            for func in self.stats_funcs:
-                try:
-                    await func(self)
-                except Exception as e:
-                    continue
-        except Exception as e:
-            traceback.print_exc()
-            raise e
-        await ctx.reply("done")
+        posted = await self.post_stats_to_all(force=True)
+        await ctx.reply(f"done, posted to {posted}/{len(self.stats_funcs)} sites")
 
     async def _get_json(self, url: str, *args, **kwargs) -> Optional[dict]:
         r = await self._get(url, *args, **kwargs)
@@ -354,6 +407,7 @@ async def setup(bot: BotU):
     if PROD:    
         cog = VoteBackend(bot)
         cog.post_stats.start()
+        cog.sync_votes.start()
         #cog.post_command_data.start()
         await bot.add_cog(cog)
     else:
@@ -12,7 +12,7 @@ import yaml
 
 from cogs import EXTENSIONS
 from cogs.help_cmd import Help
-from cogs.models import Blacklist
+from cogs.models import blacklist_index
 from utils import BotU, MentionableTree, SENTRY_URL, bot_logger, handler
 
 import environ
@@ -66,7 +66,7 @@ async def on_ready():
 
 @bot.check
 async def ensure_not_on_blacklist(ctx):
-    if blacklist := (await Blacklist.blacklisted(ctx.author.id)):
+    if blacklist := blacklist_index.get(ctx.author.id):
         desc = "You are currently blacklisted from using the bot. Please reach out to the bot developer on the support server for more information."
         if blacklist.reason:
             desc += f"\nReason: `{blacklist.reason}`"
@@ -110,21 +110,17 @@ async def main():
         before_send=before_send
     )
 
-    async with aiohttp.ClientSession() as session:
-        async with aiohttp.ClientSession() as session2:
-            async with aiohttp.ClientSession() as session3:
-                bot.session = session
-                bot.session2 = session2
-                bot.session3 = session3
-                discord.utils.setup_logging(handler=handler)
-                for file in EXTENSIONS:
-                    await bot.load_extension(file)
-                    bot_logger.debug(f"Loaded extension {file}")
-                await bot.load_extension("jishaku")
-                bot_logger.debug("Loaded extension jishaku")
-                # await bot.load_extension("utils.cogs.error_handler")
-                # bot_logger.debug("Loaded extension utils.cogs.error_handler")
-                await bot.start(token)
+    async with bot:
+        # bot.session is created on first use and closed with the bot
+        discord.utils.setup_logging(handler=handler)
+        for file in EXTENSIONS:
+            await bot.load_extension(file)
+            bot_logger.debug(f"Loaded extension {file}")
+        await bot.load_extension("jishaku")
+        bot_logger.debug("Loaded extension jishaku")
+        # await bot.load_extension("utils.cogs.error_handler")
+        # bot_logger.debug("Loaded extension utils.cogs.error_handler")
+        await bot.start(token)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,37 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "CommandRollups" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "created_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "granularity" VARCHAR(6) NOT NULL,
+    "bucket" TIMESTAMPTZ NOT NULL,
+    "command" VARCHAR(100) NOT NULL,
+    "guild_id" BIGINT NOT NULL  DEFAULT 0,
+    "app_command" BOOL NOT NULL  DEFAULT False,
+    "failed" BOOL NOT NULL  DEFAULT False,
+    "uses" BIGINT NOT NULL  DEFAULT 0,
+    CONSTRAINT "uid_CommandRoll_granula_3f1c2a" UNIQUE ("granularity", "bucket", "command", "guild_id", "app_command", "failed")
+);
+        INSERT INTO "CommandRollups" ("granularity", "bucket", "command", "guild_id", "app_command", "failed", "uses")
+    SELECT 'day', date_trunc('day', "used" AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', "command", COALESCE("guild_id", 0), "app_command", "failed", COUNT(*)
+    FROM "Commands"
+    GROUP BY 2, 3, 4, 5, 6;
+        INSERT INTO "CommandRollups" ("granularity", "bucket", "command", "guild_id", "app_command", "failed", "uses")
+    SELECT 'hour', date_trunc('hour', "used" AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', "command", COALESCE("guild_id", 0), "app_command", "failed", COUNT(*)
+    FROM "Commands"
+    WHERE "used" > CURRENT_TIMESTAMP - INTERVAL '90 days'
+    GROUP BY 2, 3, 4, 5, 6;
+        INSERT INTO "CommandRollups" ("granularity", "bucket", "command", "guild_id", "app_command", "failed", "uses")
+    SELECT 'minute', date_trunc('minute', "used" AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', "command", COALESCE("guild_id", 0), "app_command", "failed", COUNT(*)
+    FROM "Commands"
+    WHERE "used" > CURRENT_TIMESTAMP - INTERVAL '2 days'
+    GROUP BY 2, 3, 4, 5, 6;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "CommandRollups";"""
@@ -0,0 +1,44 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "RawPayloads" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "created_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "model" VARCHAR(50) NOT NULL,
+    "object_id" BIGINT NOT NULL,
+    "data" JSONB,
+    CONSTRAINT "uid_RawPayloads_model_8b1f3d" UNIQUE ("model", "object_id")
+);
+        INSERT INTO "RawPayloads" ("model", "object_id", "data")
+    SELECT 'RankedStatsV2', "id", "_raw" FROM "RankedStatsV2" WHERE "_raw" IS NOT NULL;
+        INSERT INTO "RawPayloads" ("model", "object_id", "data")
+    SELECT 'RankedStatsSeasonal', "id", "_raw" FROM "RankedStatsSeasonal" WHERE "_raw" IS NOT NULL;
+        INSERT INTO "RawPayloads" ("model", "object_id", "data")
+    SELECT 'PastRankedPoints', "id", "_raw" FROM "pastrankedpoints" WHERE "_raw" IS NOT NULL;
+        INSERT INTO "RawPayloads" ("model", "object_id", "data")
+    SELECT 'Matches', "id", "_raw" FROM "Matches" WHERE "_raw" IS NOT NULL;
+        INSERT INTO "RawPayloads" ("model", "object_id", "data")
+    SELECT 'MatchSegments', "id", "_raw" FROM "MatchSegments" WHERE "_raw" IS NOT NULL;
+        ALTER TABLE "RankedStatsV2" DROP COLUMN "_raw";
+        ALTER TABLE "RankedStatsSeasonal" DROP COLUMN "_raw";
+        ALTER TABLE "pastrankedpoints" DROP COLUMN "_raw";
+        ALTER TABLE "Matches" DROP COLUMN "_raw";
+        ALTER TABLE "MatchSegments" DROP COLUMN "_raw";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "RankedStatsV2" ADD "_raw" JSONB;
+        ALTER TABLE "RankedStatsSeasonal" ADD "_raw" JSONB;
+        ALTER TABLE "pastrankedpoints" ADD "_raw" JSONB;
+        ALTER TABLE "Matches" ADD "_raw" JSONB;
+        ALTER TABLE "MatchSegments" ADD "_raw" JSONB;
+        UPDATE "RankedStatsV2" AS t SET "_raw" = r."data" FROM "RawPayloads" AS r WHERE r."model" = 'RankedStatsV2' AND r."object_id" = t."id";
+        UPDATE "RankedStatsSeasonal" AS t SET "_raw" = r."data" FROM "RawPayloads" AS r WHERE r."model" = 'RankedStatsSeasonal' AND r."object_id" = t."id";
+        UPDATE "pastrankedpoints" AS t SET "_raw" = r."data" FROM "RawPayloads" AS r WHERE r."model" = 'PastRankedPoints' AND r."object_id" = t."id";
+        UPDATE "Matches" AS t SET "_raw" = r."data" FROM "RawPayloads" AS r WHERE r."model" = 'Matches' AND r."object_id" = t."id";
+        UPDATE "MatchSegments" AS t SET "_raw" = r."data" FROM "RawPayloads" AS r WHERE r."model" = 'MatchSegments' AND r."object_id" = t."id";
+        DROP TABLE IF EXISTS "RawPayloads";"""
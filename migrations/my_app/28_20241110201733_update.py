@@ -0,0 +1,26 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "StatsSnapshots" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "platform" VARCHAR(20) NOT NULL,
+    "timestamp" TIMESTAMPTZ NOT NULL,
+    "rank_points" INT,
+    "wins" INT,
+    "losses" INT,
+    "kills" INT,
+    "deaths" INT,
+    "user_id" BIGINT NOT NULL REFERENCES "R6User" ("id") ON DELETE CASCADE
+);
+        CREATE INDEX IF NOT EXISTS "idx_StatsSnaps_user_id_4e7a21" ON "StatsSnapshots" ("user_id", "platform", "timestamp");
+        INSERT INTO "StatsSnapshots" ("user_id", "platform", "timestamp", "rank_points", "wins", "losses", "kills", "deaths")
+    SELECT "user_id", "platform", "updated_at", "ranked_rank_points", "ranked_wins", "ranked_losses", "ranked_kills", "ranked_deaths"
+    FROM "RankedStats"
+    WHERE COALESCE("ranked_rank_points", "ranked_wins", "ranked_losses", "ranked_kills", "ranked_deaths") IS NOT NULL;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "StatsSnapshots";"""
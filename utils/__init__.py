@@ -2,6 +2,9 @@ from .constants import * # logger
 from .logger import *
 from .methods import *
 from .tree import *
+from .cache import *
+from .ratelimit import *
+from .search import *
 from .help_command import *
 
 from .checks import * # context
@@ -0,0 +1,214 @@
+from __future__ import annotations
+import asyncio
+from collections import OrderedDict
+import copy
+import time
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Optional, Tuple, Type, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class ExpiringFutureMap(Generic[K, V]):
+    """A map of keys to values that may not have been set yet.
+
+    One task sets the value for a key, other tasks can wait for it.
+    Entries are removed `ttl` seconds after they are created, whether they were set or not.
+    """
+
+    def __init__(self, ttl: float = 300.0):
+        """Initializes the map.
+
+        Args:
+            ttl (float, optional): How long an entry is kept, in seconds. Defaults to 300.0.
+        """
+        self.ttl = ttl
+        self._entries: OrderedDict[K, Tuple[float, asyncio.Future[V]]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._entries:
+            key, (created, future) = next(iter(self._entries.items()))
+            if now - created < self.ttl:
+                break
+            del self._entries[key]
+            if not future.done():
+                future.cancel()
+
+    def _get_future(self, key: K) -> asyncio.Future[V]:
+        self._evict()
+        if key not in self._entries:
+            self._entries[key] = (time.monotonic(), asyncio.get_running_loop().create_future())
+        return self._entries[key][1]
+
+    def set(self, key: K, value: V) -> None:
+        """Sets the value for a key, waking up anything waiting for it.
+
+        Args:
+            key (K): The key.
+            value (V): The value.
+        """
+        future = self._get_future(key)
+        if not future.done():
+            future.set_result(value)
+
+    async def wait_for(self, key: K, timeout: Optional[float] = None) -> Optional[V]:
+        """Waits for the value of a key to be set.
+
+        Args:
+            key (K): The key.
+            timeout (Optional[float], optional): How long to wait, in seconds. Defaults to waiting until the entry expires.
+
+        Returns:
+            Optional[V]: The value, or None if it wasn't set in time.
+        """
+        future = self._get_future(key)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self.ttl if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            return None
+        except asyncio.CancelledError:
+            if future.cancelled(): # expired
+                return None
+            raise
+
+
+class SingleFlight(Generic[K, V]):
+    """Coalesces concurrent calls for the same key into one call.
+
+    The first caller for a key starts the call, anyone else asking for that key while it is running waits for the same result.
+    The call runs in its own task, so it still finishes for the others if the first caller is cancelled.
+    """
+
+    def __init__(self):
+        self._calls: Dict[K, asyncio.Task[V]] = {}
+        self.calls: int = 0
+        """How many calls were actually made."""
+        self.coalesced: int = 0
+        """How many calls were coalesced into a call that was already running."""
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: K, func: Callable[[], Awaitable[V]]) -> V:
+        """Runs `func`, unless a call for `key` is already running, then waits for that one instead.
+
+        Args:
+            key (K): The key identifying the call.
+            func (Callable[[], Awaitable[V]]): Makes the call.
+
+        Returns:
+            V: The result of the call. If the call raised, every caller gets the exception.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+
+class TTLCache(Generic[K, V]):
+    """A size bounded LRU cache where every entry expires after a while.
+
+    Failed lookups (None, or one of `negative_exceptions` that `negative_predicate` accepts) can be cached too, for `negative_ttl` seconds.
+    """
+
+    def __init__(
+            self,
+            ttl: float,
+            maxsize: int = 1024,
+            negative_ttl: float = 0.0,
+            negative_exceptions: Tuple[Type[BaseException], ...] = (),
+            negative_predicate: Optional[Callable[[BaseException], bool]] = None,
+    ):
+        """Initializes the cache.
+
+        Args:
+            ttl (float): How long an entry is kept, in seconds.
+            maxsize (int, optional): How many entries are kept before the least recently used ones are evicted. Defaults to 1024.
+            negative_ttl (float, optional): How long a failed lookup is kept, in seconds. Defaults to 0.0, which doesn't keep them.
+            negative_exceptions (Tuple[Type[BaseException], ...], optional): The exceptions that count as failed lookups. Defaults to ().
+            negative_predicate (Optional[Callable[[BaseException], bool]], optional): Decides whether one of `negative_exceptions` is cached,
+                so e.g. a ratelimit isn't cached as if the value didn't exist. Defaults to caching all of them.
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.negative_ttl = negative_ttl
+        self.negative_exceptions = negative_exceptions
+        self.negative_predicate = negative_predicate
+        self._entries: OrderedDict[K, Tuple[float, Any, bool]] = OrderedDict()
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        """How many entries were removed to make room for new ones, or because they expired."""
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, key: K, value: Any, ttl: float, error: bool = False) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value, error)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """Gets a cached value without fetching it, or `default` if it isn't cached.
+        This doesn't count as a hit or a miss."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic() or entry[2]:
+            return default
+        return entry[1]
+
+    def set(self, key: K, value: V) -> None:
+        """Caches a value."""
+        self._store(key, value, self.negative_ttl if value is None else self.ttl)
+
+    def invalidate(self, key: K) -> None:
+        """Removes a key from the cache, if it's in it."""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_or_fetch(self, key: K, fetch: Callable[[], Awaitable[V]]) -> V:
+        """Gets a value from the cache, or fetches and caches it if it isn't there.
+
+        Args:
+            key (K): The key.
+            fetch (Callable[[], Awaitable[V]]): Fetches the value.
+
+        Returns:
+            V: The value. If the lookup failed with one of `negative_exceptions`, that exception is raised again until it expires.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value, error = entry
+            if expires > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(key)
+                if error:
+                    # raise a copy, so the cached exception's traceback doesn't grow with every hit
+                    raise copy.copy(value)
+                return value
+            del self._entries[key]
+            self.evictions += 1
+
+        self.misses += 1
+        try:
+            value = await fetch()
+        except self.negative_exceptions as e:
+            if self.negative_ttl > 0 and (self.negative_predicate is None or self.negative_predicate(e)):
+                self._store(key, e, self.negative_ttl, error=True)
+            raise
+        if value is not None or self.negative_ttl > 0:
+            self.set(key, value)
+        return value
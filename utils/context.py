@@ -39,7 +39,20 @@ from discord.ext.commands import AutoShardedBot, Cog
 
 from . import USE_DEFER_EMOJI
 from .constants import LOADING_EMOJI
-from .requests_http import _delete, _get, _patch, _post, _put
+from .requests_http import (
+    HTTP_CONNECTION_LIMIT,
+    HTTP_CONNECTION_LIMIT_PER_HOST,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_TIMEOUT,
+    _delete,
+    _get,
+    _patch,
+    _post,
+    _put,
+    create_http_session,
+    set_http_session,
+)
 from .tree import MentionableTree
 
 if TYPE_CHECKING:
@@ -63,22 +76,27 @@ class CogU(Cog):
 
     async def _get(self, url: str, **kwargs) -> aiohttp.ClientResponse:
         """Performs a GET request on the given URL."""
+        kwargs.setdefault("session", self.bot.session)
         return await _get(url, **kwargs)
 
     async def _post(self, url: str, **kwargs) -> aiohttp.ClientResponse:
         """Performs a POST request on the given URL."""
+        kwargs.setdefault("session", self.bot.session)
         return await _post(url, **kwargs)
 
     async def _patch(self, url: str, **kwargs) -> aiohttp.ClientResponse:
         """Performs a PATCH request on the given URL."""
+        kwargs.setdefault("session", self.bot.session)
         return await _patch(url, **kwargs)
 
     async def _put(self, url: str, **kwargs) -> aiohttp.ClientResponse:
         """Performs a PUT request on the given URL."""
+        kwargs.setdefault("session", self.bot.session)
         return await _put(url, **kwargs)
 
     async def _delete(self, url: str, **kwargs) -> aiohttp.ClientResponse:
         """Performs a DELETE request on the given URL."""
+        kwargs.setdefault("session", self.bot.session)
         return await _delete(url, **kwargs)
 
     async def get_command_mention(self, command: Union[str, commands.Command]):
@@ -232,6 +250,11 @@ class BotU(AutoShardedBot):
 
     def __init__(self, 
         *args, 
+        http_timeout: aiohttp.ClientTimeout = HTTP_TIMEOUT,
+        http_connection_limit: int = HTTP_CONNECTION_LIMIT,
+        http_connection_limit_per_host: int = HTTP_CONNECTION_LIMIT_PER_HOST,
+        http_dns_cache_ttl: int = HTTP_DNS_CACHE_TTL,
+        http_keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
         **kwargs
     ) -> None:
         if kwargs.get("cls", None):
@@ -239,6 +262,15 @@ class BotU(AutoShardedBot):
         #kwargs["pm_help"] = None
         super().__init__(*args, **kwargs)
 
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_options = {
+            "timeout": http_timeout,
+            "limit": http_connection_limit,
+            "limit_per_host": http_connection_limit_per_host,
+            "dns_cache_ttl": http_dns_cache_ttl,
+            "keepalive_timeout": http_keepalive_timeout,
+        }
+
         # shard_id: List[datetime.datetime]
         # shows the last attempted IDENTIFYs and RESUMEs
         self.resumes: defaultdict[int, List[datetime.datetime]] = defaultdict(list)
@@ -264,6 +296,19 @@ class BotU(AutoShardedBot):
         #self.owner_id = self.bot_app_info.owner.id
         # DO NOT UNCOMMENT, THIS WILL BREAK IS_OWNER CHECKS
     
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The HTTP session shared by the bot and its cogs. It's created the first time it's used, and closed when the bot closes."""
+        if self._session is None or self._session.closed:
+            self._session = create_http_session(**self._session_options)
+            set_http_session(self._session)
+        return self._session
+
+    async def close(self) -> None:
+        await super().close()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
     async def on_shard_resumed(self, shard_id: int):
         #log.info('Shard ID %s has resumed...', shard_id)
         self.resumes[shard_id].append(discord.utils.utcnow())
@@ -0,0 +1,61 @@
+from __future__ import annotations
+import time
+
+
+class TokenBucket:
+    """A token bucket rate limiter.
+
+    The bucket holds up to `capacity` tokens and refills at `rate` tokens per second.
+    Every request takes a token, so requests can burst up to `capacity` and then go at `rate`.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """Initializes the bucket. It starts full.
+
+        Args:
+            rate (float): How many tokens are added every second.
+            capacity (float): The maximum number of tokens.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens: float = capacity
+        self._updated: float = time.monotonic()
+        self._blocked_until: float = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def tokens(self) -> float:
+        """The number of tokens left. Always 0 while the bucket is blocked."""
+        self._refill()
+        if self._blocked_until > time.monotonic():
+            return 0.0
+        return self._tokens
+
+    def time_until_available(self, tokens: float = 1.0) -> float:
+        """How long, in seconds, until `tokens` can be taken. 0 if they can be taken now."""
+        self._refill()
+        now = time.monotonic()
+        wait = max(0.0, (tokens - self._tokens) / self.rate) if self.rate else float("inf")
+        return max(wait, self._blocked_until - now, 0.0)
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Takes `tokens` if they are available.
+
+        Returns:
+            bool: Whether they were taken.
+        """
+        if self.time_until_available(tokens) > 0:
+            return False
+        self._tokens -= tokens
+        return True
+
+    def block(self, seconds: float) -> None:
+        """Stops tokens from being taken for `seconds`, e.g. after a 429 with a Retry-After header.
+        The bucket is also emptied, so requests are let back in slowly afterwards."""
+        self._refill()
+        self._tokens = 0.0
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
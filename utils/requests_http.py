@@ -1,6 +1,6 @@
 from __future__ import annotations
 import asyncio
-from typing import Union
+from typing import Optional, Union
 
 import aiohttp
 
@@ -8,10 +8,86 @@ from .constants import BLOXLINK_API_KEY, HTTPCode, ROVER_API_KEY, RequestType
 from .logger import requests_logger
 
 
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=30, sock_connect=10)
+"""The default timeout for requests made with the shared session."""
+
+HTTP_CONNECTION_LIMIT = 100
+"""The maximum number of open connections in the shared session."""
+
+HTTP_CONNECTION_LIMIT_PER_HOST = 20
+"""The maximum number of open connections to a single host in the shared session."""
+
+HTTP_DNS_CACHE_TTL = 300
+"""How long, in seconds, DNS lookups are cached for."""
+
+HTTP_KEEPALIVE_TIMEOUT = 30.0
+"""How long, in seconds, an idle connection is kept open to be reused."""
+
+HTTP_MAX_RETRIES = 3
+"""How many times a request is attempted before giving up."""
+
+HTTP_BACKOFF = 0.5
+"""The base delay, in seconds, between retries. It doubles after every attempt."""
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def create_http_session(
+    *,
+    timeout: aiohttp.ClientTimeout = HTTP_TIMEOUT,
+    limit: int = HTTP_CONNECTION_LIMIT,
+    limit_per_host: int = HTTP_CONNECTION_LIMIT_PER_HOST,
+    dns_cache_ttl: int = HTTP_DNS_CACHE_TTL,
+    keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+) -> aiohttp.ClientSession:
+    """Creates a session with a pooled, keep-alive connector and a DNS cache.
+
+    Args:
+        timeout (aiohttp.ClientTimeout, optional): The timeout for requests. Defaults to HTTP_TIMEOUT.
+        limit (int, optional): The maximum number of open connections. Defaults to HTTP_CONNECTION_LIMIT.
+        limit_per_host (int, optional): The maximum number of open connections to a single host. Defaults to HTTP_CONNECTION_LIMIT_PER_HOST.
+        dns_cache_ttl (int, optional): How long DNS lookups are cached, in seconds. Defaults to HTTP_DNS_CACHE_TTL.
+        keepalive_timeout (float, optional): How long idle connections are kept open, in seconds. Defaults to HTTP_KEEPALIVE_TIMEOUT.
+
+    Returns:
+        aiohttp.ClientSession: The session.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        use_dns_cache=True,
+        ttl_dns_cache=dns_cache_ttl,
+        keepalive_timeout=keepalive_timeout,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Gets the shared session. If one hasn't been set, one is created with the default settings."""
+    global _session
+    if _session is None or _session.closed:
+        _session = create_http_session()
+    return _session
+
+
+def set_http_session(session: aiohttp.ClientSession) -> None:
+    """Sets the shared session used by requests that don't pass their own."""
+    global _session
+    _session = session
+
+
 async def _request(
-    _method: Union[str, RequestType], /, url: str, **kwargs
+    _method: Union[str, RequestType],
+    /,
+    url: str,
+    *,
+    session: Optional[aiohttp.ClientSession] = None,
+    retries: int = HTTP_MAX_RETRIES,
+    **kwargs,
 ) -> aiohttp.ClientResponse:
-    """Performs a GET request on the given URL."""
+    """Performs a request on the given URL, retrying with backoff on connection errors, 429s and 5__ errors.
+
+    Every attempt is made on the same session, so connections are reused. The shared session is used if `session` isn't passed."""
     method: RequestType
     if isinstance(_method, str):
         method = RequestType(_method.upper())
@@ -21,7 +97,8 @@ async def _request(
     rover = kwargs.pop("rover", False)
     bloxlink = kwargs.pop("bloxlink", False)
 
-    SESSIONS = [aiohttp.ClientSession() for _ in range(3)]
+    if session is None:
+        session = get_http_session()
 
     if rover:
         kwargs["headers"] = {"Authorization": f"Bearer {ROVER_API_KEY}"}
@@ -29,30 +106,27 @@ async def _request(
     if bloxlink:
         kwargs["headers"] = {"Authorization": f"{BLOXLINK_API_KEY}"}
 
-    tr = 0
+    request = method.get_method_callable(session)
 
-    async def close_sessions():
-        for session in SESSIONS:
-            await session.close()
+    tr = 0
 
-    for tr, session in enumerate(SESSIONS, 1):
-        request = method.get_method_callable(session)
+    for tr in range(1, retries + 1):
+        backoff = HTTP_BACKOFF * 2 ** (tr - 1)
 
         try:
             response = await request(url, **kwargs)
-        except aiohttp.ServerDisconnectedError:
-            requests_logger.warning(f"Server disconnected on session {tr}.")
-            # await asyncio.sleep(5)
+        except (aiohttp.ServerDisconnectedError, aiohttp.ClientConnectorError, asyncio.TimeoutError) as e:
+            requests_logger.warning(f"{e.__class__.__name__} on attempt {tr}. Retrying in {backoff} seconds.")
+            await asyncio.sleep(backoff)
             continue
 
         status = response.status
         status_ = HTTPCode(status)
         requests_logger.info(
-            f"[{method}] {status} {status_.name} from {response.url} (Session {tr})"
+            f"[{method}] {status} {status_.name} from {response.url} (Attempt {tr})"
         )
 
         if status_.is_2xx:
-            await close_sessions()
             return response
 
         if status_.is_1xx:
@@ -65,24 +139,23 @@ async def _request(
                 if not retry_after:
                     retry_after = response.headers.get("X-Ratelimit-Remaining", None)
 
-                if retry_after:
+                try:
+                    backoff = float(retry_after) # type: ignore
                     requests_logger.info(
                         f"We are being rate limited. Retrying in {retry_after} seconds."
                     )
-                    await asyncio.sleep(retry_after)
-                else:
+                except (TypeError, ValueError):
                     requests_logger.info(
-                        "We are being rate limited but no Retry-After header was found. Retrying in 5 seconds."
+                        f"We are being rate limited but no Retry-After header was found. Retrying in {backoff} seconds."
                     )
-                    await asyncio.sleep(5)
             else:
                 requests_logger.info("Got a 4__ Client Error.")
                 raise aiohttp.ClientResponseError(
                     response.request_info,
                     response.history,
-                    status,
-                    response.reason,
-                    response.headers,
+                    status=status,
+                    message=str(response.reason),
+                    headers=response.headers,
                 )
         elif status_.is_5xx:
             requests_logger.info("Got a 5__ Server Error. Retrying request...")
@@ -91,7 +164,8 @@ async def _request(
                 f"Got an unknown status code {status}. Retrying request..."
             )
 
-        await session.close()
+        response.release()
+        await asyncio.sleep(backoff)
 
     raise aiohttp.ClientConnectionError(
         f"Failed to get a 2__ Success response after {tr} tries."
@@ -0,0 +1,228 @@
+from __future__ import annotations
+from array import array
+import bisect
+from collections import Counter
+import heapq
+import math
+from typing import Dict, Generic, Hashable, Iterable, List, Optional, Set, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+def trigrams(text: str) -> Set[str]:
+    """Gets the trigrams of a string, padded like pg_trgm so the start and end of words count more."""
+    padded = f"  {text} "
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex(Generic[K, V]):
+    """An in-memory fuzzy search index.
+
+    Entries are found by prefix through a sorted array and by similarity through a trigram inverted index.
+    Prefix matches come first, then similar entries, each ranked by similarity and popularity.
+    Removed entries are only marked as removed, so IDs in the inverted index stay valid,
+    until they make up `compact_ratio` of the index and it is compacted.
+    """
+
+    def __init__(
+            self,
+            prefix_scan_limit: int = 500,
+            candidate_limit: int = 200,
+            posting_scan_limit: int = 5000,
+            popularity_weight: float = 0.05,
+            compact_ratio: float = 0.25,
+    ):
+        """Initializes the index.
+
+        Args:
+            prefix_scan_limit (int, optional): The most prefix matches that are ranked for one search. Defaults to 500.
+            candidate_limit (int, optional): The most trigram matches that are checked against trigrams too common to scan. Defaults to 200.
+            posting_scan_limit (int, optional): How many trigram postings one search scans before only checking the candidates it has. Defaults to 5000.
+            popularity_weight (float, optional): How much popularity counts for compared to similarity. Defaults to 0.05.
+            compact_ratio (float, optional): The share of removed entries at which the index is compacted. Defaults to 0.25.
+        """
+        self.prefix_scan_limit = prefix_scan_limit
+        self.candidate_limit = candidate_limit
+        self.posting_scan_limit = posting_scan_limit
+        self.popularity_weight = popularity_weight
+        self.compact_ratio = compact_ratio
+
+        self._ids: Dict[K, int] = {}
+        self._keys: List[Optional[K]] = []
+        self._texts: List[Optional[str]] = []
+        self._values: List[Optional[V]] = []
+        self._popularity: List[int] = []
+        self._prefixes: List[Tuple[str, int]] = []
+        """(text, id) pairs, sorted."""
+        self._trigrams: Dict[str, array] = {}
+        """Trigram to the IDs of the entries that have it, in ascending order."""
+        self._removed: int = 0
+        """How many IDs belong to removed entries."""
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._ids
+
+    def keys(self) -> List[K]:
+        """Gets the key of every entry."""
+        return list(self._ids)
+
+    def add(self, key: K, text: str, value: V) -> bool:
+        """Adds an entry. If an entry with the same key exists, it is replaced.
+
+        Args:
+            key (K): Identifies the entry.
+            text (str): What the entry is searched by.
+            value (V): What a search returns for the entry.
+
+        Returns:
+            bool: Whether anything changed.
+        """
+        text = text.lower().strip()
+        popularity = 0
+        if key in self._ids:
+            id = self._ids[key]
+            if self._texts[id] == text:
+                self._values[id] = value
+                return False
+            popularity = self._popularity[id]
+            self.remove(key)
+
+        self._append(key, text, value, popularity)
+        bisect.insort(self._prefixes, (text, self._ids[key]))
+        return True
+
+    def _append(self, key: K, text: str, value: V, popularity: int = 0) -> None:
+        id = len(self._keys)
+        self._ids[key] = id
+        self._keys.append(key)
+        self._texts.append(text)
+        self._values.append(value)
+        self._popularity.append(popularity)
+        for trigram in trigrams(text):
+            self._trigrams.setdefault(trigram, array("I")).append(id)
+
+    def add_many(self, entries: Iterable[Tuple[K, str, V]]) -> int:
+        """Adds many entries at once. This is much faster than `add` for loading the index,
+        since the prefixes are sorted once at the end instead of for every entry.
+
+        Args:
+            entries (Iterable[Tuple[K, str, V]]): (key, text, value) for every entry.
+
+        Returns:
+            int: How many entries were added or changed.
+        """
+        changed = 0
+        existing: List[Tuple[K, str, V]] = []
+        for key, text, value in entries:
+            if key in self._ids:
+                existing.append((key, text, value))
+                continue
+            text = text.lower().strip()
+            self._append(key, text, value)
+            self._prefixes.append((text, self._ids[key]))
+            changed += 1
+        self._prefixes.sort()
+        for key, text, value in existing:
+            changed += self.add(key, text, value)
+        return changed
+
+    def remove(self, key: K) -> None:
+        """Removes an entry, if it's in the index."""
+        id = self._ids.pop(key, None)
+        if id is None:
+            return
+        text = self._texts[id]
+        index = bisect.bisect_left(self._prefixes, (text, id))
+        if index < len(self._prefixes) and self._prefixes[index] == (text, id):
+            del self._prefixes[index]
+        self._keys[id] = self._texts[id] = self._values[id] = None
+        self._removed += 1
+        if self._removed > 1000 and self._removed > self.compact_ratio * len(self._keys):
+            self.compact()
+
+    def compact(self) -> None:
+        """Drops removed entries, giving the rest new IDs and rebuilding the inverted index."""
+        keys, texts, values, popularity = self._keys, self._texts, self._values, self._popularity
+        self._ids, self._keys, self._texts, self._values, self._popularity = {}, [], [], [], []
+        self._trigrams = {}
+        self._removed = 0
+        for key, text, value, pop in zip(keys, texts, values, popularity):
+            if text is not None:
+                self._append(key, text, value, pop) # type: ignore
+        self._prefixes = sorted((text, id) for id, text in enumerate(self._texts)) # type: ignore
+
+    def bump(self, key: K, amount: int = 1) -> None:
+        """Makes an entry more popular, so it ranks higher."""
+        id = self._ids.get(key)
+        if id is not None:
+            self._popularity[id] += amount
+
+    def _score(self, similarity: float, id: int) -> float:
+        return similarity + self.popularity_weight * math.log1p(self._popularity[id])
+
+    def search(self, query: str, limit: int = 25, cutoff: float = 0.2) -> List[V]:
+        """Searches the index.
+
+        Args:
+            query (str): What to search for.
+            limit (int, optional): The most results to return. Defaults to 25.
+            cutoff (float, optional): How similar, from 0 to 1, an entry that doesn't start with the query has to be. Defaults to 0.2.
+
+        Returns:
+            List[V]: The values of the best matches, best first.
+        """
+        query = query.lower().strip()
+        if not query:
+            return []
+
+        # prefix matches
+        start = bisect.bisect_left(self._prefixes, (query, -1))
+        prefix_ids: List[int] = []
+        for text, id in self._prefixes[start:start + self.prefix_scan_limit]:
+            if not text.startswith(query):
+                break
+            prefix_ids.append(id)
+        best = heapq.nlargest(limit, prefix_ids, key=lambda id: self._score(len(query) / len(self._texts[id]), id)) # type: ignore
+        if len(best) >= limit or len(query) < 3:
+            return [self._values[id] for id in best] # type: ignore
+
+        # trigram matches. the rarest trigrams are scanned in full to find candidates,
+        # trigrams too common to scan are only checked against the best candidates so far
+        query_trigrams = trigrams(query)
+        counts: Counter[int] = Counter()
+        budget = self.posting_scan_limit
+        candidates: Optional[List[int]] = None
+        for trigram in sorted(query_trigrams, key=lambda t: len(self._trigrams.get(t, ()))):
+            postings = self._trigrams.get(trigram)
+            if not postings:
+                continue
+            if candidates is None and (not counts or len(postings) <= budget):
+                counts.update(postings)
+                budget -= len(postings)
+                continue
+            if candidates is None: # every trigram from here on is too common to scan
+                candidates = [id for id, _ in counts.most_common(self.candidate_limit)]
+            size = len(postings)
+            for id in candidates:
+                index = bisect.bisect_left(postings, id)
+                if index < size and postings[index] == id:
+                    counts[id] += 1
+
+        seen = set(best)
+        scored: List[Tuple[float, int]] = []
+        for id, _ in counts.most_common(limit * 4):
+            text = self._texts[id]
+            if text is None or id in seen:
+                continue
+            # the counts only cover the trigrams used above, so work out the real overlap
+            text_trigrams = trigrams(text)
+            shared = len(query_trigrams & text_trigrams)
+            similarity = shared / (len(query_trigrams) + len(text_trigrams) - shared)
+            if similarity >= cutoff:
+                scored.append((self._score(similarity, id), id))
+        best += [id for _, id in heapq.nlargest(limit - len(best), scored)]
+        return [self._values[id] for id in best] # type: ignore
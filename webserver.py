@@ -1,11 +1,12 @@
+import asyncio
 from contextlib import asynccontextmanager
 import datetime
+import hmac
 import random
 import string
 from typing import List, Optional, Union
 
 import aiohttp
-import dateparser
 from fastapi import FastAPI, Request
 from fastapi.responses import Response
 from fastapi.security import OAuth2PasswordBearer
@@ -16,6 +17,8 @@ from slowapi.util import get_remote_address
 from tortoise import Tortoise
 
 from cogs.models import Votes, WebhookAuthorization
+from utils.cache import TTLCache
+from utils.ratelimit import TokenBucket
 
 
 #from cogs.models import 
@@ -46,6 +49,83 @@ sentry_sdk.init(
     profiles_sample_rate=1.0,
 )
 
+AUTHORIZATION_REFRESH_INTERVAL = 60
+"""How often, in seconds, the webhook authorizations are reloaded from the database."""
+REQUESTS_PER_SECOND = 1.0
+"""How many requests an IP can make per second, before its authorization is checked."""
+REQUEST_BURST = 60
+"""How many requests an IP can make at once."""
+
+authorizations: List[bytes] = []
+"""The tokens webhooks can authorize with. Loaded by `load_authorizations`."""
+request_buckets: TTLCache[str, TokenBucket] = TTLCache(ttl=600, maxsize=10000)
+"""The rate limit of each IP."""
+
+VOTE_BATCH_SIZE = 100
+"""The most votes that are saved at once."""
+VOTE_FLUSH_INTERVAL = 1.0
+"""How long, in seconds, the vote writer waits for more votes before saving a batch."""
+
+vote_queue: asyncio.Queue[Optional[Votes]] = asyncio.Queue()
+"""Votes that have been acknowledged but not saved yet. None tells the vote writer to save what it has and stop."""
+
+async def load_authorizations() -> None:
+    global authorizations
+    authorizations = [token.encode() for token in await WebhookAuthorization.all().values_list('authorization', flat=True) if token]
+
+async def refresh_authorizations() -> None:
+    """Reloads the webhook authorizations every so often, so new ones work without a restart."""
+    while True:
+        await asyncio.sleep(AUTHORIZATION_REFRESH_INTERVAL)
+        try:
+            await load_authorizations()
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+
+def is_authorized(token: Optional[str]) -> bool:
+    """Checks a token against every authorization in constant time, so timing can't be used to guess one."""
+    if not token:
+        return False
+    token_bytes = token.encode()
+    authorized = False
+    for authorization in authorizations:
+        authorized |= hmac.compare_digest(token_bytes, authorization)
+    return authorized
+
+async def write_votes() -> None:
+    """Saves queued votes in batches. A batch is saved once it's full or nothing new was queued for `VOTE_FLUSH_INTERVAL`.
+    Stops once it reads None from the queue, after saving the batch it was building."""
+    stopping = False
+    while not stopping:
+        vote = await vote_queue.get()
+        if vote is None:
+            return
+        batch = [vote]
+        while len(batch) < VOTE_BATCH_SIZE:
+            try:
+                vote = await asyncio.wait_for(vote_queue.get(), VOTE_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                break
+            if vote is None:
+                stopping = True
+                break
+            batch.append(vote)
+        await flush_votes(batch)
+
+async def flush_votes(batch: List[Votes]) -> None:
+    try:
+        await Votes.bulk_record(batch)
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+
+def is_ratelimited(request: Request) -> bool:
+    address = get_remote_address(request)
+    bucket = request_buckets.get(address)
+    if bucket is None:
+        bucket = TokenBucket(REQUESTS_PER_SECOND, REQUEST_BURST)
+        request_buckets.set(address, bucket)
+    return not bucket.try_acquire()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Load the ML model
@@ -53,7 +133,22 @@ async def lifespan(app: FastAPI):
         config_file='db.yml'
     )
     await Tortoise.generate_schemas()
+    await load_authorizations()
+    refresh_task = asyncio.create_task(refresh_authorizations())
+    vote_task = asyncio.create_task(write_votes())
     yield
+    refresh_task.cancel()
+    # let the writer finish its batch rather than cancelling it, those votes are already acknowledged
+    vote_queue.put_nowait(None)
+    await vote_task
+    # save whatever was queued after the writer stopped
+    remaining = []
+    while not vote_queue.empty():
+        vote = vote_queue.get_nowait()
+        if vote is not None:
+            remaining.append(vote)
+    for start in range(0, len(remaining), VOTE_BATCH_SIZE):
+        await flush_votes(remaining[start:start + VOTE_BATCH_SIZE])
 
 print('ran main')
 
@@ -103,31 +198,35 @@ async def close_sessions(sessions: List[aiohttp.ClientSession]=[], session_nums:
 
 @app.middleware("http")
 async def middleware(request: Request, call_next):
-    if not await WebhookAuthorization.filter(authorization=request.headers.get('Authorization')).exists():
+    # both checks are in memory, so a flood of bad requests never reaches the database
+    if is_ratelimited(request):
+        return Response(status_code=429)
+    if not is_authorized(request.headers.get('Authorization')):
         return Response(status_code=401)
     return await call_next(request)
 
-async def save_vote(request: Request, site: str, data: dict):
-    addl_data = data
-    del addl_data['user_id']
-    del addl_data['user']
-    del addl_data['username']
-    del addl_data['timestamp']
-    del addl_data['avatar']
-    del addl_data['is_weekend']
-
-    await Votes.create(
-        user_id=data.get('user',None) or data.get('user_id',None),
+async def save_vote(request: Request, site: str, data: dict, raw: dict):
+    """Queues a vote to be saved and acknowledges it straight away. The vote writer saves it and skips duplicates."""
+    try:
+        user_id = int(data['user_id'])
+    except (KeyError, TypeError, ValueError):
+        return Response(status_code=400)
+
+    addl_data = {k: v for k, v in data.items() if k not in ('user_id', 'user', 'id', 'username', 'timestamp', 'avatar', 'is_weekend')}
+
+    vote_queue.put_nowait(Votes(
+        user_id=user_id,
         username=data.get('username',None),
 
         avatar=data.get('avatar',None),
 
         site=site,
-        timestamp=dateparser.parse(data['timestamp']),
+        timestamp=data['timestamp'],
         loggedby='webhook',
+        is_weekend=bool(data.get('is_weekend',False)),
         addl_data=addl_data,
-        _raw=data
-    )
+        _raw=raw,
+    ))
     return Response(status_code=200)
 
 @app.post("/webhooks/topgg")
@@ -137,9 +236,9 @@ async def vote_topgg(request: Request, data: dict):
    #{'user': '458657458995462154', 'type': 'test', 'query': '', 'bot': '1082452014157545502'}
     #{'user': '458657458995462154', 'type': 'upvote', 'query': '', 'isWeekend': False, 'bot': '1082452014157545502'}   
     new_dict = {
-        'user_id': data['user'],
+        'user_id': data.get('user',None),
         'username': data.get('username',None),
-        'timestamp': datetime.datetime.now(),
+        'timestamp': datetime.datetime.now(tz=datetime.timezone.utc),
         'avatar': data.get('avatar',None),
         'is_weekend': data.get('isWeekend',False),
         # 'type': data['type'],
@@ -151,7 +250,7 @@ async def vote_topgg(request: Request, data: dict):
     for k, v in data.items():
         if k not in new_dict.keys():
             new_dict[k] = v
-    return await save_vote(request, 'topgg', new_dict)
+    return await save_vote(request, 'topgg', new_dict, data)
 
 @app.post("/webhooks/dcbotlist")
 @limiter.limit("60/minute",error_message="bro you need to stop spamming my website")
@@ -159,9 +258,9 @@ async def vote_dcbotlist(request: Request, data: dict):
     #print(data)
     #{'id': '458657458995462154', 'username': 'aidenpearce3066', 'avatar': '3acfe15b991e017b80f0430797927156'}
     new_dict = {
-        'user_id': data['id'],
+        'user_id': data.get('id',None),
         'username': data.get('username',None),
-        'timestamp': datetime.datetime.now(),
+        'timestamp': datetime.datetime.now(tz=datetime.timezone.utc),
         'avatar': data.get('avatar',None),
         'is_weekend': data.get('isWeekend',False),
         # 'type': data['type'],
@@ -169,7 +268,7 @@ async def vote_dcbotlist(request: Request, data: dict):
         # 'type': data['type'],
         # 'query': data['query']
     }
-    return await save_vote(request, 'dcbotlist', new_dict)
+    return await save_vote(request, 'dcbotlist', new_dict, data)
 
 @app.get("/sentry-debug")
 async def trigger_error():